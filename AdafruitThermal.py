@@ -35,15 +35,46 @@
 # Python 2.X code using the library usu. needs to include the next line:
 from __future__ import print_function
 from serial import Serial
+import collections
 import time
 from PIL import Image
-
-class AdafruitThermal(Serial):
+import ThermalDither
+import ThermalTiming
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Printer pacing runs off a monotonic clock so that wall clock
+# adjustments (NTP, DST) can't stall or overrun the printer.
+try:
+    from time import monotonic as clock
+except ImportError: # Python 2
+    clock = time.time
+
+# Bumped whenever what gets sent for an image changes (see ThermalCache)
+__version__ = '1.1'
+
+# The print head has 384 dots across 48 mm of paper.
+DOTS_PER_MM = 8.0
+
+# Predicted cost of a job: wall time in seconds and paper in dot rows.
+class Estimate(collections.namedtuple('Estimate', 'seconds rows')):
+
+    # Paper length in millimetres
+    @property
+    def length(self):
+        return self.rows / DOTS_PER_MM
+
+# Printer state, timing model and command set, independent of where the
+# bytes end up.  AdafruitThermal (below) sends them to a serial port;
+# ThermalDocument collects them into a byte stream for later printing.
+class ThermalCommands(object):
 
     resume_time      =  0.0
     byte_time        =  0.0
-    dot_print_time    =  0.033
-    dot_feed_time     =  0.0025
+    dot_print_time    =  0.03
+    dot_feed_time     =  0.0021
     prev_byte        = '\n'
     column          =  0
     max_column       = 32
@@ -51,33 +82,20 @@ class AdafruitThermal(Serial):
     line_spacing     =  8
     barcode_height   = 50
     print_mode       =  0
+    # Dot rows of paper advanced so far, according to the timing model
+    paper_rows       =  0
     default_heat_time = 120
+    # Largest block handed to the printer in one go by write();
+    # kept well below the size of the printer's input buffer.
+    buffer_size      = 256
+    # timeout_wait() returns this many seconds before resume_time.
+    wake_margin      =  0.002
 
-    def __init__(self, *args, **kwargs):
-        # If no parameters given, use default port & baud rate.
-        # If only port is passed, use default baud rate.
-        # If both passed, use those values.
-        baudrate = 19200
-        if len(args) == 0:
-            args = [ "/dev/ttyAMA0", baudrate ]
-        elif len(args) == 1:
-            args = [ args[0], baudrate ]
-        else:
-            baudrate = args[1]
-        try:
-            self.no_printing = kwargs.pop('no_printing')
-        except:
-            self.no_printing = False
-        #print('NOPRINT', self.no_printing)
-
-        # Calculate time to issue one byte to the printer.
-        # 11 bits (not 8) to accommodate idle, start and stop bits.
-        # Idle time might be unnecessary, but erring on side of
-        # caution here.
-        self.byte_time = 11.0 / float(baudrate)
-        Serial.__init__(self, *args, **kwargs)
-        # Remainder of this method was previously in begin()
+    no_printing      = False
 
+    # Start-up sequence: wake the printer, reset it and set heating,
+    # character set and density parameters.
+    def _setup(self, heat_time=default_heat_time):
         # The printer can't start receiving data immediately upon
         # power up -- it needs a moment to cold boot and initialize.
         # Allow at least 1/2 sec of uptime before printer can
@@ -101,7 +119,6 @@ class AdafruitThermal(Serial):
         # blank page may occur.  The more heating interval, the more
         # clear, but the slower printing speed.
 
-        heat_time = kwargs.get('heattime', self.default_heat_time)
         self.write_bytes(
           27,       # Esc
           55,       # 7 (print settings)
@@ -140,9 +157,6 @@ class AdafruitThermal(Serial):
           35, # Print density
           (print_break_time << 5) | print_density)
 
-        self.dot_print_time = 0.03
-        self.dot_feed_time  = 0.0021
-        
         #self.set_ascii_font_mode()
 
 
@@ -158,13 +172,24 @@ class AdafruitThermal(Serial):
     # (e.g. receiving or decoding an image) while the printer
     # physically completes the task.
 
+    # Current time on the clock resume_time is kept on.
+    def now(self):
+        return clock()
+
     # Sets estimated completion time for a just-issued task.
     def timeout_set(self, x):
-        self.resume_time = time.time() + x
-
-    # Waits (if necessary) for the prior task to complete.
+        self.resume_time = clock() + x
+
+    # Waits (if necessary) for the prior task to complete.  The thread
+    # sleeps rather than spins, so other threads (web server, mail
+    # polling, button handling) get the CPU while paper is moving.  It
+    # wakes wake_margin early; the printer's input buffer absorbs the
+    # difference, and the next block is already on the wire by the time
+    # the previous one finishes printing.
     def timeout_wait(self):
-        while (time.time() - self.resume_time) < 0: pass
+        remaining = self.resume_time - clock()
+        if remaining > self.wake_margin:
+            time.sleep(remaining - self.wake_margin)
 
 
     # Printer performance may vary based on the power supply voltage,
@@ -190,41 +215,63 @@ class AdafruitThermal(Serial):
         if not self.no_printing:
             self.timeout_wait()
             self.timeout_set(len(args) * self.byte_time)
-            for arg in args:
-                super(AdafruitThermal, self).write(chr(arg))
+            self._send(bytearray(args))
+
 
+    # Text is sent using the printer's character code table
+    # (ISO-8859-1, see __init__); byte strings pass through as-is.
+    def _encode(self, data):
+        if isinstance(data, (bytes, bytearray)):
+            return bytearray(data)
+        return bytearray(data.encode('latin-1', 'replace'))
 
-    # Override write() method to keep track of paper feed.
+
+    # Override write() method to keep track of paper feed.  Column and
+    # line accounting is done over the whole string up front; the bytes
+    # then go out in blocks of at most buffer_size, each followed by a
+    # single timeout covering the print/feed time of every line in it.
     def write(self, *data):
-        if not self.no_printing:
-            for i in range(len(data)):
-                c = data[i]
-                if c != 0x13:
-                    self.timeout_wait()
-                    super(AdafruitThermal, self).write(c)
-                    d = self.byte_time
-                    if ((c == '\n') or
-                        (self.column == self.max_column)):
-                        # Newline or wrap
-                        if self.prev_byte == '\n':
-                            # Feed line (blank)
-                            d += ((self.char_height +
-                                   self.line_spacing) *
-                                  self.dot_feed_time)
-                        else:
-                            # Text line
-                            d += ((self.char_height *
-                                   self.dot_print_time) +
-                                  (self.line_spacing *
-                                   self.dot_feed_time))
-                            self.column = 0
-                            # Treat wrap as newline
-                            # on next pass
-                            c = '\n'
+        if self.no_printing:
+            return
+        block = bytearray()
+        d     = 0.0
+        for arg in data:
+            for c in self._encode(arg):
+                if c == 0x13:
+                    continue
+                block.append(c)
+                d += self.byte_time
+                if ((c == 10) or
+                    (self.column == self.max_column)):
+                    # Newline or wrap
+                    self.paper_rows += self.char_height + self.line_spacing
+                    if self.prev_byte == '\n':
+                        # Feed line (blank)
+                        d += ((self.char_height +
+                               self.line_spacing) *
+                              self.dot_feed_time)
                     else:
-                        self.column += 1
+                        # Text line
+                        d += ((self.char_height *
+                               self.dot_print_time) +
+                              (self.line_spacing *
+                               self.dot_feed_time))
+                        # On a wrap, this character is the first
+                        # of the next line, as on the printer
+                        self.column = 0 if c == 10 else 1
+                else:
+                    self.column += 1
+                self.prev_byte = chr(c)
+                if len(block) >= self.buffer_size:
+                    self.timeout_wait()
+                    self._send(block)
                     self.timeout_set(d)
-                    self.prev_byte = c
+                    block = bytearray()
+                    d     = 0.0
+        if block:
+            self.timeout_wait()
+            self._send(block)
+            self.timeout_set(d)
 
 
     # The bulk of this method was moved into __init__,
@@ -290,7 +337,8 @@ class AdafruitThermal(Serial):
         # Print string
         self.timeout_wait()
         self.timeout_set((self.barcode_height + 40) * self.dot_print_time)
-        super(AdafruitThermal, self).write(text)
+        self._send(self._encode(text))
+        self.paper_rows += self.barcode_height + 40
         self.prev_byte = '\n'
         self.feed(2)
 
@@ -403,7 +451,8 @@ class AdafruitThermal(Serial):
     # Feeds by the specified number of individual pixel rows
     def feed_rows(self, rows):
         self.write_bytes(27, 74, rows)
-        self.timeout_set(rows * dot_feed_time)
+        self.timeout_set(rows * self.dot_feed_time)
+        self.paper_rows += rows
 
 
     def flush(self):
@@ -441,8 +490,16 @@ class AdafruitThermal(Serial):
         self.underline_on(0)
 
 
+    # Bitmap data may be any bytes-like object or a list of ints (as in
+    # the gfx modules).  Each DC2 * chunk is sliced straight out of it;
+    # consecutive chunks (e.g. the single rows of LaaT) share one write
+    # as long as they fit within buffer_size, paced by their summed
+    # print time, as in print_document().
     def print_bitmap(self, w, h, bitmap, LaaT=False):
-        row_bytes = (w + 7) / 8  # Round up to next byte boundary
+        if self.no_printing:
+            return
+
+        row_bytes = (w + 7) // 8  # Round up to next byte boundary
         if row_bytes >= 48:
             row_bytes_clipped = 48  # 384 pixels max width
         else:
@@ -457,23 +514,47 @@ class AdafruitThermal(Serial):
         if LaaT: max_chunk_height = 1
         else:    max_chunk_height = 255
 
-        i = 0
+        if isinstance(bitmap, list):
+            bitmap = bytearray(bitmap)
+        data = memoryview(bitmap).cast('B')
+        if row_bytes != row_bytes_clipped and np is not None:
+            # Rows wider than the print head: a strided view of the
+            # leftmost 48 bytes of every row, copied once per chunk.
+            data = np.frombuffer(data, dtype=np.uint8, count=h * row_bytes)
+            data = data.reshape(h, row_bytes)[:, :row_bytes_clipped]
+
+        block = bytearray()
+        d     = 0.0
         for row_start in range(0, h, max_chunk_height):
             chunk_height = h - row_start
             if chunk_height > max_chunk_height:
                 chunk_height = max_chunk_height
+            row_end = row_start + chunk_height
+
+            chunk = bytearray((18, 42, chunk_height, row_bytes_clipped))
+            if row_bytes == row_bytes_clipped:
+                chunk += data[row_start * row_bytes:row_end * row_bytes]
+            elif np is not None:
+                chunk += data[row_start:row_end].tobytes()
+            else:
+                for y in range(row_start, row_end):
+                    i = y * row_bytes
+                    chunk += data[i:i + row_bytes_clipped]
+
+            if block and len(block) + len(chunk) > self.buffer_size:
+                self.timeout_wait()
+                self._send(block)
+                self.timeout_set(d)
+                block = bytearray()
+                d     = 0.0
+            block += chunk
+            d     += chunk_height * self.dot_print_time
+        if block:
+            self.timeout_wait()
+            self._send(block)
+            self.timeout_set(d)
 
-            # Timeout wait happens here
-            self.write_bytes(18, 42, chunk_height, row_bytes_clipped)
-
-            for y in range(chunk_height):
-                for x in range(row_bytes_clipped):
-                    super(AdafruitThermal, self).write(
-                      chr(bitmap[i]))
-                    i += 1
-                i += row_bytes - row_bytes_clipped
-            self.timeout_set(chunk_height * self.dot_print_time)
-
+        self.paper_rows += h
         self.prev_byte = '\n'
 
     # Print Image.  Requires Python Imaging Library.  This is
@@ -483,33 +564,22 @@ class AdafruitThermal(Serial):
     # For any other behavior (scale, B&W threshold, etc.), use
     # the Imaging Library to perform such operations before
     # passing the result to this function.
-    def print_image(self, image, LaaT=False):
+    # 'dither' names a ThermalDither method; by default PIL's
+    # Floyd-Steinberg conversion is used, without tone correction.
+    def print_image(self, image, LaaT=False, dither=None):
         if image.mode != '1':
-            image = image.convert('1')
+            if dither:
+                image = ThermalDither.dither(image, dither)
+            else:
+                image = image.convert('1')
 
         width  = image.size[0]
         height = image.size[1]
         if width > 384:
             width = 384
-        row_bytes = (width + 7) / 8
-        bitmap   = bytearray(row_bytes * height)
-        pixels   = image.load()
-
-        for y in range(height):
-            n = y * row_bytes
-            x = 0
-            for b in range(row_bytes):
-                sum = 0
-                bit = 128
-                while bit > 0:
-                    if x >= width: break
-                    if pixels[x, y] == 0:
-                        sum |= bit
-                    x    += 1
-                    bit >>= 1
-                bitmap[n + b] = sum
-
-        self.print_bitmap(width, height, bitmap, LaaT)
+            image = image.crop((0, 0, width, height))
+
+        self.print_bitmap(width, height, pack_image(image), LaaT)
 
 
     # Take the printer offline. Print commands sent after this
@@ -594,3 +664,198 @@ class AdafruitThermal(Serial):
             self.write(str(arg))
         self.write('\n')
 
+
+    # === Estimates ===
+    # Predicted wall time and paper use (an Estimate) of printing
+    # something, starting from the current formatting state.  The
+    # commands are compiled into a scratch ThermalDocument; nothing is
+    # sent and the printer's own state is left alone.
+
+    # Text as write() takes it; add '\n' for print_line()
+    def estimate_text(self, text):
+        document = ThermalDocument(self)
+        document.write(text)
+        return document.estimate()
+
+    def estimate_bitmap(self, w, h, LaaT=False):
+        document = ThermalDocument(self)
+        document.print_bitmap(w, h, bytes(((w + 7) // 8) * h), LaaT)
+        return document.estimate()
+
+    def estimate_barcode(self, text, type):
+        document = ThermalDocument(self)
+        document.print_barcode(text, type)
+        return document.estimate()
+
+    # A ThermalDocument compiled earlier
+    def estimate_document(self, document):
+        return document.estimate()
+
+
+    # Formatting state carried from a printer into a ThermalDocument
+    # and back once the document has been printed.
+    state_attrs = ('prev_byte', 'column', 'max_column', 'char_height',
+                   'line_spacing', 'barcode_height', 'print_mode')
+
+    # Print a ThermalDocument compiled earlier.  Segments are paced
+    # with the times computed when the document was compiled;
+    # consecutive segments share one write as long as they fit within
+    # buffer_size.
+    def print_document(self, document):
+        if self.no_printing:
+            return
+        block = bytearray()
+        d     = 0.0
+        for data, seconds in document.segments:
+            if block and len(block) + len(data) > self.buffer_size:
+                self.timeout_wait()
+                self._send(block)
+                self.timeout_set(d)
+                block = bytearray()
+                d     = 0.0
+            block += data
+            d     += seconds
+        if block:
+            self.timeout_wait()
+            self._send(block)
+            self.timeout_set(d)
+        for name in self.state_attrs:
+            setattr(self, name, getattr(document, name))
+        self.paper_rows += document.paper_rows
+
+
+
+
+class AdafruitThermal(ThermalCommands, Serial):
+
+    def __init__(self, *args, **kwargs):
+        # If no parameters given, use default port & baud rate.
+        # If only port is passed, use default baud rate.
+        # If both passed, use those values.
+        baudrate = 19200
+        if len(args) == 0:
+            args = [ "/dev/ttyAMA0", baudrate ]
+        elif len(args) == 1:
+            args = [ args[0], baudrate ]
+        else:
+            baudrate = args[1]
+        try:
+            self.no_printing = kwargs.pop('no_printing')
+        except:
+            self.no_printing = False
+        #print('NOPRINT', self.no_printing)
+
+        # Calculate time to issue one byte to the printer.
+        # 11 bits (not 8) to accommodate idle, start and stop bits.
+        # Idle time might be unnecessary, but erring on side of
+        # caution here.
+        self.byte_time = 11.0 / float(baudrate)
+        heat_time = kwargs.pop('heattime', self.default_heat_time)
+        # Print and feed times measured by ThermalTiming.calibrate()
+        # for this port, if any, replace the defaults.
+        timing_file = kwargs.pop('timing_file', None)
+        Serial.__init__(self, *args, **kwargs)
+        if timing_file is not None:
+            times = ThermalTiming.TimingStore(timing_file).get(args[0])
+            if times is not None:
+                ThermalTiming.apply(self, times)
+        # Remainder of this method was previously in begin()
+        self._setup(heat_time)
+
+
+    # Issue a block of bytes to the serial port with a single call.
+    def _send(self, data):
+        Serial.write(self, bytes(data))
+
+
+# Compiles printer commands into an ESC/POS byte stream instead of
+# sending them, so jobs can be rendered while the printer is still busy
+# with something else and kept around for reprinting.  It has the whole
+# ThermalCommands API; every call appends to 'segments', a list of
+# [bytes, seconds] pairs where seconds is how long the printer needs for
+# that segment according to the same timing model AdafruitThermal paces
+# with.  Pass a printer to start from its formatting state and timing
+# settings, and print the result with printer.print_document().
+class ThermalDocument(ThermalCommands):
+
+    def __init__(self, printer=None, baudrate=19200):
+        self.byte_time = 11.0 / float(baudrate)
+        if printer is not None:
+            for name in self.state_attrs + ('byte_time', 'dot_print_time',
+                                            'dot_feed_time'):
+                setattr(self, name, getattr(printer, name))
+        self.segments = []
+        self._segment = None
+
+
+    # A segment ends wherever the printer would wait for the previous
+    # task; the timeout set for it becomes the segment's duration.
+    def timeout_wait(self):
+        self._segment = None
+
+    def timeout_set(self, x):
+        if self._segment is None:
+            self._start_segment()
+        self._segment[1] = x
+
+    def _send(self, data):
+        if self._segment is None:
+            self._start_segment()
+        self._segment[0] += data
+
+    def _start_segment(self):
+        self._segment = [bytearray(), 0.0]
+        self.segments.append(self._segment)
+
+
+    # The complete ESC/POS byte stream.
+    @property
+    def data(self):
+        return b''.join(bytes(data) for data, seconds in self.segments)
+
+    # Estimated printing time in seconds.
+    @property
+    def duration(self):
+        return sum(seconds for data, seconds in self.segments)
+
+    # Estimated wall time and paper use.  Unlike duration, this counts
+    # the time to send a segment where that takes longer than printing
+    # it (e.g. bitmap rows at low baud rates).
+    def estimate(self):
+        seconds = sum(max(seconds, len(data) * self.byte_time)
+                      for data, seconds in self.segments)
+        return Estimate(seconds, self.paper_rows)
+
+
+# Pack a 1-bit image into printer bitmap rows: one bit per dot, MSB
+# first, set for black, each row padded to a whole byte.  NumPy does
+# this in a few array operations; without it, the pixels are walked
+# one at a time, producing identical output.
+def pack_image(image):
+    if image.mode != '1':
+        image = image.convert('1')
+    width, height = image.size
+    if np is not None:
+        dots = np.frombuffer(image.convert('L').tobytes(), dtype=np.uint8)
+        dots = dots.reshape(height, width) == 0
+        return np.packbits(dots, axis=1).tobytes()
+
+    row_bytes = (width + 7) // 8
+    bitmap    = bytearray(row_bytes * height)
+    pixels    = image.load()
+
+    for y in range(height):
+        n = y * row_bytes
+        x = 0
+        for b in range(row_bytes):
+            sum = 0
+            bit = 128
+            while bit > 0:
+                if x >= width: break
+                if pixels[x, y] == 0:
+                    sum |= bit
+                x    += 1
+                bit >>= 1
+            bitmap[n + b] = sum
+
+    return bytes(bitmap)
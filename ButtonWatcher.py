@@ -0,0 +1,175 @@
+#!/usr/bin/python3
+#
+# The printer's button and LED: a tap prints, holding the button shuts
+# the Raspberry Pi down.  The GPIO library is passed in, so FakeGPIO
+# can stand in for RPi.GPIO.
+
+import asyncio
+import logging
+import threading
+from AdafruitThermal import clock
+
+logger = logging.getLogger(__name__)
+
+
+class ButtonWatcher(object):
+    """Turns button presses into tap and hold actions, and blinks the LED
+
+    Edge interrupts from the GPIO library wake a single thread, which
+    waits tap_time for the pin to settle (software debounce) before
+    acting on the new level.  A release after a debounced press is a
+    tap, unless the button was held for hold_time, which triggers the
+    hold action (once) instead.  Between events the same thread blinks
+    the LED for 50ms every 2 seconds, so nothing else runs while the
+    button is left alone.  If edge detection is not
+    available, the pin is polled every poll_interval seconds instead.
+    """
+
+    blink_period = 2.0
+    blink_time = 0.05
+    poll_interval = 0.05
+
+    def __init__(self, gpio, button_pin, led_pin, on_tap, on_hold,
+                 tap_time=0.01, hold_time=2):
+        self.gpio = gpio
+        self.button_pin = button_pin
+        self.led_pin = led_pin
+        self.on_tap = on_tap
+        self.on_hold = on_hold
+        self.tap_time = tap_time
+        self.hold_time = hold_time
+        self.tap_enable = False
+        self.hold_enable = False
+        self.polling = False
+        self._edge = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            raise Exception("this watcher is already running")
+        self._stop.clear()
+        try:
+            self.gpio.add_event_detect(self.button_pin, self.gpio.BOTH, callback=self._changed)
+            self.polling = False
+        except RuntimeError as e:
+            logger.warning('No edge detection on pin {0} ({1}), polling'.format(self.button_pin, e))
+            self.polling = True
+        self._thread = threading.Thread(target=self._run, name='ButtonWatcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._edge.set()
+            self._thread.join()
+            self._thread = None
+            if not self.polling:
+                self.gpio.remove_event_detect(self.button_pin)
+
+    def _changed(self, pin):
+        # Runs on the GPIO library's thread: only note the edge
+        self._edge.set()
+
+    def _run(self):
+        self._reset()
+        while not self._stop.is_set():
+            now = clock()
+            if self._edge.wait(max(self._deadline(now) - now, 0)):
+                self._edge.clear()
+                self._changed_at = clock()
+            else:
+                self._update(clock(), lambda: self._action(self.on_tap),
+                             lambda: self._action(self.on_hold))
+
+    async def run_async(self):
+        """Watch the button from the running asyncio loop (instead of start())
+
+        Edges are passed to the loop; tap and hold actions, which may
+        block, run in its default executor.
+        """
+        loop = asyncio.get_running_loop()
+        edge = asyncio.Event()
+        self._stop.clear()
+        try:
+            self.gpio.add_event_detect(self.button_pin, self.gpio.BOTH,
+                                       callback=lambda pin: loop.call_soon_threadsafe(edge.set))
+            self.polling = False
+        except RuntimeError as e:
+            logger.warning('No edge detection on pin {0} ({1}), polling'.format(self.button_pin, e))
+            self.polling = True
+        on_tap = lambda: loop.run_in_executor(None, self._action, self.on_tap)
+        on_hold = lambda: loop.run_in_executor(None, self._action, self.on_hold)
+        self._reset()
+        try:
+            while not self._stop.is_set():
+                now = clock()
+                try:
+                    await asyncio.wait_for(edge.wait(), max(self._deadline(now) - now, 0))
+                except asyncio.TimeoutError:
+                    self._update(clock(), on_tap, on_hold)
+                else:
+                    edge.clear()
+                    self._changed_at = clock()
+        finally:
+            if not self.polling:
+                self.gpio.remove_event_detect(self.button_pin)
+
+    def _reset(self):
+        self._released = self.gpio.input(self.button_pin)
+        self._changed_at = None     # Time of the last unsettled edge
+        self._pressed_at = None
+        self._led_on = False
+        self._next_blink = clock()
+
+    def _deadline(self, now):
+        # When _update() next has something to do, barring edges
+        deadlines = [self._next_blink]
+        if self._changed_at is not None:
+            deadlines.append(self._changed_at + self.tap_time)
+        if self._pressed_at is not None and self.hold_enable:
+            deadlines.append(self._pressed_at + self.hold_time)
+        if self.polling:
+            deadlines.append(now + self.poll_interval)
+        return min(deadlines)
+
+    def _action(self, action):
+        # A failing action must not stop the watcher
+        try:
+            action()
+        except Exception:
+            logger.exception('Button action {0} failed'.format(getattr(action, '__name__', action)))
+
+    def _update(self, now, on_tap, on_hold):
+        if self.polling and self._changed_at is None:
+            if self.gpio.input(self.button_pin) != self._released:
+                self._changed_at = now
+        if self._changed_at is not None and now >= self._changed_at + self.tap_time:
+            self._changed_at = None
+            state = self.gpio.input(self.button_pin)
+            if state != self._released:
+                self._released = state
+                if not self._released:         # Debounced press
+                    self._pressed_at = now
+                    self.tap_enable = True     # Enable tap and hold actions
+                    self.hold_enable = True
+                else:                          # Debounced release
+                    self._pressed_at = None
+                    if self.tap_enable:        # Ignore if prior hold()
+                        on_tap()
+                    self.tap_enable = False
+                    self.hold_enable = False
+        if (self._pressed_at is not None and self.hold_enable and
+                now >= self._pressed_at + self.hold_time):
+            self.hold_enable = False           # 1 shot...don't repeat hold action
+            self.tap_enable = False            # Don't do tap action on release
+            on_hold()
+
+        # LED blinks while idle, for a brief interval every 2 seconds
+        if now >= self._next_blink:
+            self._led_on = not self._led_on
+            self.gpio.output(self.led_pin, self.gpio.HIGH if self._led_on else self.gpio.LOW)
+            self._next_blink += self.blink_time if self._led_on else self.blink_period - self.blink_time
+            if self._next_blink < now:         # Fell behind, e.g. during a hold action
+                self._next_blink = now
@@ -0,0 +1,99 @@
+#*************************************************************************
+# Stand-in for RPi.GPIO, for running thpr.py away from a Raspberry Pi.
+# thpr.py only uses it when THPR_FAKE_GPIO is set in the environment.
+#
+# Implements the part of the RPi.GPIO interface thpr.py uses.  Outputs
+# are only remembered; inputs read as their pull-up/down level until a
+# test changes them with set_input(), which also runs the callbacks
+# registered with add_event_detect() for that edge, like the real
+# library does from its event thread.
+#*************************************************************************
+
+from __future__ import print_function
+import threading
+
+BCM   = 11
+BOARD = 10
+OUT   = 0
+IN    = 1
+LOW   = 0
+HIGH  = 1
+PUD_OFF  = 20
+PUD_DOWN = 21
+PUD_UP   = 22
+RISING  = 31
+FALLING = 32
+BOTH    = 33
+
+_lock   = threading.Lock()
+_levels = {}      # pin -> current level
+_events = {}      # pin -> (edge, [callbacks])
+history = []      # (pin, level) of every output() call, for tests
+
+
+def setmode(mode):
+    pass
+
+
+def setwarnings(flag):
+    pass
+
+
+def setup(pin, direction, pull_up_down=PUD_OFF, initial=LOW):
+    with _lock:
+        if direction == IN:
+            _levels[pin] = HIGH if pull_up_down == PUD_UP else LOW
+        else:
+            _levels[pin] = initial
+
+
+def input(pin):
+    with _lock:
+        return _levels.get(pin, LOW)
+
+
+def output(pin, level):
+    with _lock:
+        _levels[pin] = HIGH if level else LOW
+        history.append((pin, _levels[pin]))
+
+
+def add_event_detect(pin, edge, callback=None, bouncetime=None):
+    with _lock:
+        if pin in _events:
+            raise RuntimeError('Conflicting edge detection already enabled for this GPIO channel')
+        _events[pin] = (edge, [callback] if callback else [])
+
+
+def add_event_callback(pin, callback):
+    with _lock:
+        _events[pin][1].append(callback)
+
+
+def remove_event_detect(pin):
+    with _lock:
+        _events.pop(pin, None)
+
+
+def cleanup(pin=None):
+    with _lock:
+        if pin is None:
+            _levels.clear()
+            _events.clear()
+        else:
+            _levels.pop(pin, None)
+            _events.pop(pin, None)
+
+
+def set_input(pin, level):
+    """Drive an input pin, running edge callbacks as a real pin would"""
+    level = HIGH if level else LOW
+    with _lock:
+        previous = _levels.get(pin, LOW)
+        _levels[pin] = level
+        edge, callbacks = _events.get(pin, (None, []))
+    if level == previous or edge is None:
+        return
+    if edge == BOTH or edge == (RISING if level == HIGH else FALLING):
+        for callback in list(callbacks):
+            callback(pin)
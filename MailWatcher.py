@@ -0,0 +1,633 @@
+#!/usr/bin/python3
+#
+# Mail to be printed: MailReceiver fetches new mails from an IMAP
+# mailbox and queues their text and image attachments, MailWatcher
+# keeps a session in IDLE to run it as soon as mail arrives.
+
+import asyncio
+import binascii
+import collections
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import email
+from email.header import decode_header
+import imaplib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import re
+import select
+import ssl
+import tempfile
+import threading
+import time
+from ThermalImage import pack_attachment
+import ThermalDither
+from MailWhitelist import Whitelist
+from PrintQueue import QueueFull
+
+logger = logging.getLogger(__name__)
+
+
+def decode_text(data, charset=None):
+    """Mail headers and payloads as text (they may arrive as bytes)"""
+    if data is None:
+        return ''
+    if isinstance(data, bytes):
+        data = data.decode(charset or 'latin-1', 'replace')
+    return data
+
+
+def message_set(uids):
+    """Collapse message numbers into an IMAP message set, e.g. '1:3,7'"""
+    ranges = []
+    for uid in sorted(set(int(uid) for uid in uids)):
+        if ranges and ranges[-1][1] == uid - 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ','.join(str(first) if first == last else '{0}:{1}'.format(first, last)
+                    for first, last in ranges)
+
+
+class MailReceiver(object):
+    def __init__(self, config, queue, no_deleting=False, config_file='thpr.conf'):
+        self.host = config['EMail'].get('host', 'imap.mail.me.com')
+        self.use_ssl = config['EMail'].getboolean('ssl', fallback=True)
+        self.port = config['EMail'].getint('port', fallback=993 if self.use_ssl else 143)
+        self.user = config['EMail']['user']
+        self.password = config['EMail']['password']
+        self.queue = queue
+        self.no_deleting = no_deleting
+        # Attachments are decoded in memory up to spool_size bytes, then
+        # into a temporary file the image worker reads; larger than
+        # max_attachment_size: skipped
+        self.max_attachment_size = config['EMail'].getint('max_attachment_size', fallback=20*1024*1024)
+        self.spool_size = config['EMail'].getint('attachment_spool_size', fallback=1024*1024)
+        # UIDVALIDITY and highest UID seen, see process()
+        self.state_file = config['EMail'].get('state_file', 'mail_state.json')
+        self.uidvalidity = None
+        # None until looked up on the server, see trash_folder()
+        self.trash = config['EMail'].get('trash', None)
+        
+        self.whitelist = Whitelist(config_file, config)
+        self.printable_extensions = ['.jpg', '.jpeg', '.png']
+        # Attachments are converted to bitmaps by image_workers processes
+        # (0: on this thread) while the next mails are fetched; at most
+        # image_backlog mails wait for them
+        self.image_workers = config['EMail'].getint('image_workers', fallback=2)
+        self.image_backlog = config['EMail'].getint('image_backlog', fallback=2*max(self.image_workers, 1))
+        # Checks a mail is retried whose image cannot be converted; after
+        # that it is printed without the image and left in the inbox
+        self.image_retries = config['EMail'].getint('image_retries', fallback=3)
+        self.pool = None
+        self.pending = collections.deque()
+        # UID -> whether its mail got into the print queue, see flush()
+        self.queued = {}
+        self.queue_full = False
+        self.kept = set()           # UIDs queued without their image
+        self.retries = {}           # UID (str) -> failed conversions
+        # Longest image to print, in dots (8 per mm); 0 for no limit
+        self.max_image_height = config['EMail'].getint('max_image_height', fallback=1600)
+        # 'median' threshold or a ThermalDither method, e.g. 'atkinson'
+        self.dither = config['EMail'].get('dither', 'median')
+        if self.dither != 'median' and self.dither not in ThermalDither.METHODS:
+            raise ValueError('Unknown dither method: {0}'.format(self.dither))
+
+    def read_attachment(self, part):
+        """Decode an attachment, return None if it is too large
+
+        Returns the data as bytes, or once it exceeds spool_size the name
+        of a temporary file holding it: an image worker reads the file
+        itself, so large photos are never held in memory whole.  Base64
+        data is decoded a block at a time, so no complete decoded copy is
+        built up in memory before it reaches the file either.
+        """
+        fp = io.BytesIO()
+        try:
+            if part.get('content-transfer-encoding', '').strip().lower() == 'base64':
+                payload = part.get_payload()
+                block_size = 64*1024
+                rest = ''
+                for start in range(0, len(payload), block_size):
+                    encoded = rest + ''.join(payload[start:start+block_size].split())
+                    usable = len(encoded) - len(encoded) % 4
+                    fp.write(binascii.a2b_base64(encoded[:usable]))
+                    rest = encoded[usable:]
+                    if fp.tell() > self.max_attachment_size:
+                        break
+                    fp = self.spill(fp)
+            else:
+                fp.write(part.get_payload(decode=True))
+                fp = self.spill(fp)
+        except:
+            self.discard(fp)
+            raise
+        if fp.tell() > self.max_attachment_size:
+            logger.info('Attachment {0} exceeds {1} bytes, skipped'.format(
+                part.get_filename(), self.max_attachment_size))
+            self.discard(fp)
+            return None
+        if isinstance(fp, io.BytesIO):
+            return fp.getvalue()
+        fp.close()
+        return fp.name
+
+    def spill(self, fp):
+        """Move a BytesIO beyond spool_size into a temporary file"""
+        if not isinstance(fp, io.BytesIO) or fp.tell() <= self.spool_size:
+            return fp
+        spilled = tempfile.NamedTemporaryFile(prefix='thpr-', delete=False)
+        spilled.write(fp.getbuffer())
+        return spilled
+
+    @staticmethod
+    def discard(fp):
+        fp.close()
+        if not isinstance(fp, io.BytesIO):
+            os.remove(fp.name)
+
+    def connect(self):
+        """Open an IMAP session with the inbox selected"""
+        # Icloud mail
+        # Benutzername: Dies ist in der Regel der Namensteil Ihrer
+        # iCloud-E-Mail-Adresse (beispielsweise emilyparker, nicht
+        # emilyparker@icloud.com). Wenn Ihr E-Mail-Client bei Verwendung
+        # des Namensteils Ihrer iCloud-E-Mail-Adresse keine Verbindung zu 
+        # iCloud herstellen kann, probieren Sie, die vollständige Adresse
+        # zu verwenden.
+        # Kennwort: Ihr iCloud-Kennwort (app specific!!!)
+        if self.use_ssl:
+            imap_session = imaplib.IMAP4_SSL(self.host, self.port)
+        else:
+            imap_session = imaplib.IMAP4(self.host, self.port)
+        imap_session.login(self.user, self.password)
+        # imaplib keeps the capabilities from before login, but servers
+        # may only announce some (e.g. MOVE, IDLE) once authenticated
+        typ, data = imap_session.capability()
+        if typ == 'OK' and data and data[-1]:
+            imap_session.capabilities = tuple(data[-1].decode('ascii').upper().split())
+        imap_session.select('inbox')
+        typ, data = imap_session.response('UIDVALIDITY')
+        self.uidvalidity = int(data[0]) if data and data[0] else None
+        return imap_session
+
+    def check_mail(self):
+        """Connect, print new mails and log out again (polling mode)"""
+        imap_session = self.connect()
+        self.process(imap_session)
+        imap_session.close()
+        imap_session.logout()
+
+    def process(self, imap_session):
+        """Print new valid mails in the selected mailbox, then remove them
+
+        Only messages with a UID above the highest one seen before are
+        looked at, and of those only the From/To/Subject headers are
+        fetched until they have passed the whitelist.  The highest UID
+        seen is kept in state_file along with the mailbox's UIDVALIDITY;
+        when that changes, the server has renumbered its messages and
+        all of them are looked at again.  Once the print queue refuses a
+        mail (QueueFull), that mail and the ones after it are left for
+        the next time.
+        """
+        state = self.load_state()
+        if state.get('uidvalidity') != self.uidvalidity:
+            state = {'uidvalidity': self.uidvalidity, 'last_uid': 0}
+        self.retries = state.setdefault('image_retries', {})
+
+        typ, data = imap_session.uid('SEARCH', None, 'UID {0}:*'.format(state['last_uid'] + 1))
+        if typ != 'OK':
+            raise imaplib.IMAP4.error('Error searching Inbox.')
+        # 'n:*' always matches the newest message, even if its UID is below n
+        uids = [int(uid) for uid in data[0].split() if int(uid) > state['last_uid']]
+        if not uids:
+            return
+
+        if self.whitelist.reload():
+            logger.info('Whitelists reloaded from {0}'.format(self.whitelist.config_file))
+        handled = set()
+        self.queued = {}
+        self.queue_full = False
+        self.kept = set()
+        for uid, headers in self.fetch(imap_session, uids, '(UID BODY.PEEK[HEADER.FIELDS (FROM TO SUBJECT)])'):
+            if self.queue_full:
+                break
+            headers = email.message_from_bytes(headers)
+            subject = decode_header(headers['subject'] or '')[0]
+            logger.debug('Output from decode header: {0}, encoding {1}'.format(subject[0], subject[1]))
+            subject = decode_text(subject[0], subject[1])
+            sender = headers['from']
+            recipient = headers['to']
+            #print('Mail found: subject "{0}", From: {1}, To: {2}'.format(subject, sender, recipient))
+            if sender != None and recipient != None:
+                
+                logger.debug('Decoded subject: {0}'.format(subject))    
+
+                if self.whitelist(sender, recipient):
+                    print('Valid mail found: subject "{0}", From: {1}, To: {2}'.format(subject, sender, recipient))
+                    for uid, message in self.fetch(imap_session, [uid], '(UID RFC822)'):
+                        self.print_mail(uid, email.message_from_bytes(message), subject)
+                    continue
+            handled.add(uid)
+        self.flush()
+
+        # Only move past mails that were dealt with; one the server sent
+        # nothing for, the queue had no room for or whose image could
+        # not be converted is looked at again
+        handled.update(uid for uid, queued in self.queued.items() if queued)
+        to_be_deleted = [uid for uid, queued in self.queued.items()
+                         if queued and uid not in self.kept]
+        for uid in sorted(uids):
+            if uid not in handled:
+                logger.warning('Mail UID {0} not queued, will retry'.format(uid))
+                break
+            state['last_uid'] = uid
+        state['image_retries'] = dict((uid, count) for uid, count in self.retries.items()
+                                      if int(uid) > state['last_uid'])
+        self.save_state(state)
+
+        # Mails are only removed once they are in the print queue
+        if to_be_deleted and not self.no_deleting:
+            self.dispose(imap_session, to_be_deleted)
+
+    def dispose(self, imap_session, uids):
+        """Move printed mails to the trash in one go"""
+        uids = message_set(uids)
+        trash = '"{0}"'.format(self.trash_folder(imap_session))
+        logger.debug('UIDs to be moved to {0}: {1}'.format(trash, uids))
+        if 'MOVE' in imap_session.capabilities:
+            typ, data = imap_session.uid('MOVE', uids, trash)
+        else:
+            typ, data = imap_session.uid('COPY', uids, trash)
+            if typ == 'OK':
+                imap_session.uid('STORE', uids, '+FLAGS.SILENT', '(\\Deleted)')
+                imap_session.expunge()
+        if typ != 'OK':
+            logger.warning('Could not move mails to {0}: {1}'.format(trash, data))
+
+    def trash_folder(self, imap_session):
+        """The mailbox flagged \\Trash (RFC 6154), looked up once"""
+        if self.trash is None:
+            self.trash = 'Deleted Messages'
+            typ, data = imap_session.list()
+            if typ != 'OK':
+                data = []
+            for line in data:
+                match = re.match(br'\((?P<flags>[^)]*)\) (?:"[^"]*"|NIL) (?P<name>.+)$', line or b'')
+                if match and b'\\trash' in match.group('flags').lower().split():
+                    self.trash = match.group('name').decode().strip('"')
+                    break
+        return self.trash
+
+    def fetch(self, imap_session, uids, parts):
+        """Yield (UID, data) for each message fetched"""
+        typ, data = imap_session.uid('FETCH', message_set(uids), parts)
+        if typ != 'OK':
+            raise imaplib.IMAP4.error('Error fetching mail.')
+        for i, item in enumerate(data):
+            if isinstance(item, tuple):
+                uid = re.search(br'UID (\d+)', item[0])
+                if not uid and i + 1 < len(data) and isinstance(data[i + 1], bytes):
+                    # Servers may send the UID after the literal
+                    uid = re.search(br'UID (\d+)', data[i + 1])
+                if uid:
+                    yield int(uid.group(1)), item[1]
+
+    def print_mail(self, uid, mail, subject):
+        """Queue a mail's text and first printable image for printing"""
+        mail_text = None
+        attachment = None
+        for num, part in enumerate(mail.walk()):
+            if part.is_multipart():
+                continue
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('---'*10)
+                logger.debug('Part No. {0}, Content type: :::{1}:::'.format(num, part.get_content_type()))
+                logger.debug('Part payload')
+                logger.debug(part.get_payload()[:100])
+
+            file_name = part.get_filename()
+            if file_name:
+                logger.debug('Filename: {0}'.format(file_name))
+                fn, file_extension = os.path.splitext(file_name)
+                if attachment is None and file_extension.lower() in self.printable_extensions:
+                    attachment = part
+            elif not mail_text and (part.get_content_type() == 'text/plain' or
+                                    not mail.is_multipart()):
+                mail_text = decode_text(part.get_payload(decode=True),
+                                        part.get_content_charset()).strip()
+                logger.debug('MAILTEXT (length: {1}): {0}'.format(mail_text[:100], len(mail_text)))
+        job = {'subject': subject,
+               'text': mail_text or ''}
+        image = None
+        if attachment is not None:
+            source = self.read_attachment(attachment)
+            if source is not None:
+                image = self.convert(source)
+        self.pending.append((uid, job, mail['message-id'] or None, image))
+        self.flush(self.image_backlog)
+
+    def convert(self, source):
+        """Start turning attachment data (or the temporary file
+        read_attachment() put it in) into a bitmap, return a Future"""
+        if self.image_workers <= 0:
+            future = concurrent.futures.Future()
+            try:
+                future.set_result(pack_attachment(source, max_height=self.max_image_height,
+                                                  dither=self.dither))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            if self.pool is None:
+                # thpr.py runs several threads by now, which fork() does
+                # not copy; the workers are forked from a clean server
+                # process instead
+                self.pool = concurrent.futures.ProcessPoolExecutor(
+                    self.image_workers, mp_context=multiprocessing.get_context('forkserver'))
+            future = self.pool.submit(pack_attachment, source, max_height=self.max_image_height,
+                                      dither=self.dither)
+        if not isinstance(source, bytes):
+            # Also called for a cancelled or failed conversion
+            future.add_done_callback(lambda future: os.remove(source))
+        return future
+
+    def flush(self, backlog=0):
+        """Queue converted mails, in order, until at most backlog are left
+
+        Mails at the front whose image is ready are queued in any case.
+        If the print queue is full, the remaining mails are dropped.
+        """
+        while self.pending:
+            uid, job, key, image = self.pending[0]
+            if len(self.pending) <= backlog and image is not None and not image.done():
+                break
+            self.pending.popleft()
+            files = {}
+            if image is not None:
+                try:
+                    job['width'], job['height'], files['bitmap'] = image.result()
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        # A worker died (out of memory?), start afresh
+                        self.pool = None
+                    if not self.retry(uid, job, e):
+                        continue
+            try:
+                self.queue.submit('mail', job, key=key, files=files)
+            except QueueFull as e:
+                logger.warning('Mail "{0}" not queued: {1}'.format(job['subject'], e))
+                self.queue_full = True
+                self.queued[uid] = False
+                while self.pending:
+                    uid, job, key, image = self.pending.popleft()
+                    if image is not None:
+                        image.cancel()
+                    self.queued[uid] = False
+                break
+            self.queued[uid] = True
+            self.retries.pop(str(uid), None)
+
+    def retry(self, uid, job, error):
+        """Count a failed image conversion; False to try the mail again
+        later, True to print it without the image and keep it"""
+        count = self.retries.get(str(uid), 0) + 1
+        if count < self.image_retries:
+            logger.warning('Could not convert image of "{0}", will retry: {1}'.format(
+                job['subject'], error))
+            self.retries[str(uid)] = count
+            self.queued[uid] = False
+            return False
+        logger.warning('Could not convert image of "{0}", printing the mail without it '
+                       'and leaving it in the inbox: {1}'.format(job['subject'], error))
+        self.kept.add(uid)
+        return True
+
+    def close(self):
+        """Queue the remaining mails and stop the worker processes"""
+        self.flush()
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def load_state(self):
+        try:
+            with open(self.state_file) as fp:
+                return json.load(fp)
+        except (IOError, ValueError):
+            return {}
+
+    def save_state(self, state):
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w') as fp:
+            json.dump(state, fp)
+        os.rename(tmp_file, self.state_file)
+
+
+class MailWatcher(object):
+    """Checks mail as soon as it arrives, using IMAP IDLE
+
+    One authenticated session is kept open in IDLE; an EXISTS response
+    from the server triggers receiver.process() on that same session.
+    IDLE is re-issued every idle_timeout seconds, as servers drop idle
+    connections after 30 minutes (RFC 2177).  If the server does not
+    advertise IDLE, the watcher polls with receiver.check_mail() every
+    poll_interval seconds instead.  After any error the session is
+    dropped and re-opened, waiting twice as long after each consecutive
+    failure (up to max_backoff seconds).
+    """
+
+    idle_timeout = 29 * 60
+
+    def __init__(self, receiver, poll_interval=60, max_backoff=300):
+        self.receiver = receiver
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self._stop = threading.Event()
+        self._thread = None
+        self._tag = 0
+
+    def start(self):
+        if self._thread is not None:
+            raise Exception("this watcher is already running")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='MailWatcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            imap_session = None
+            try:
+                imap_session = self.receiver.connect()
+                backoff = 1
+                if 'IDLE' in imap_session.capabilities:
+                    self._watch(imap_session)
+                else:
+                    logger.info('IMAP server lacks IDLE, polling every {0}s'.format(self.poll_interval))
+                    imap_session.logout()
+                    imap_session = None
+                    self._poll()
+            except Exception:
+                logger.exception('Mail watcher failed, reconnecting in {0}s'.format(backoff))
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+            finally:
+                if imap_session is not None:
+                    try:
+                        imap_session.logout()
+                    except Exception:
+                        pass
+
+    async def run_async(self):
+        """Watch the mailbox from the running asyncio loop (instead of start())
+
+        While in IDLE the loop waits for the session's socket, so no
+        thread sits on an idle connection.  imaplib itself blocks, so
+        logging in, fetching and ending IDLE run in the loop's default
+        executor.  Returns once cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        self._stop.clear()
+        backoff = 1
+        while not self._stop.is_set():
+            imap_session = None
+            try:
+                imap_session = await loop.run_in_executor(None, self.receiver.connect)
+                backoff = 1
+                if 'IDLE' in imap_session.capabilities:
+                    await loop.run_in_executor(None, self.receiver.process, imap_session)
+                    while not self._stop.is_set():
+                        if await self._idle_async(imap_session):
+                            logger.debug('New mail announced by IDLE')
+                        await loop.run_in_executor(None, self.receiver.process, imap_session)
+                else:
+                    logger.info('IMAP server lacks IDLE, polling every {0}s'.format(self.poll_interval))
+                    await loop.run_in_executor(None, imap_session.logout)
+                    imap_session = None
+                    while not self._stop.is_set():
+                        await loop.run_in_executor(None, self.receiver.check_mail)
+                        await asyncio.sleep(self.poll_interval)
+            except Exception:
+                logger.exception('Mail watcher failed, reconnecting in {0}s'.format(backoff))
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+            finally:
+                if imap_session is not None:
+                    try:
+                        await loop.run_in_executor(None, imap_session.logout)
+                    except Exception:
+                        pass
+
+    async def _idle_async(self, imap_session):
+        """_idle() with the waiting done by the loop"""
+        loop = asyncio.get_running_loop()
+        tag = await loop.run_in_executor(None, self._idle_start, imap_session)
+        fd = imap_session.socket().fileno()
+        deadline = loop.time() + self.idle_timeout
+        new_mail = False
+        try:
+            while not new_mail:
+                if not self._buffered(imap_session):
+                    readable = loop.create_future()
+                    loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+                    try:
+                        await asyncio.wait_for(readable, deadline - loop.time())
+                    except asyncio.TimeoutError:
+                        break
+                    finally:
+                        loop.remove_reader(fd)
+                # The rest of a line is at most one round trip behind
+                new_mail = self._idle_line(imap_session)
+        except asyncio.CancelledError:
+            # Leave IDLE, so that the session can still log out
+            await loop.run_in_executor(None, self._idle_done, imap_session, tag, new_mail)
+            raise
+        return await loop.run_in_executor(None, self._idle_done, imap_session, tag, new_mail)
+
+    def _poll(self):
+        while not self._stop.is_set():
+            self.receiver.check_mail()
+            self._stop.wait(self.poll_interval)
+
+    def _watch(self, imap_session):
+        self.receiver.process(imap_session)
+        while not self._stop.is_set():
+            if self._idle(imap_session):
+                logger.debug('New mail announced by IDLE')
+            # Also after a timeout: EXISTS responses that arrived during
+            # process() went to imaplib's untagged_responses, not to
+            # _idle(), and the incremental UID SEARCH is cheap
+            self.receiver.process(imap_session)
+
+    def _idle(self, imap_session):
+        """IDLE until the server reports new mail (True) or idle_timeout"""
+        tag = self._idle_start(imap_session)
+        sock = imap_session.socket()
+        deadline = time.time() + self.idle_timeout
+        new_mail = False
+        while not new_mail and not self._stop.is_set():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            # Lines may already wait in imaplib's buffer (e.g. EXISTS
+            # sent along with the continuation), where select() can't
+            # see them.  Wake up now and then to notice stop().
+            if (not self._buffered(imap_session) and
+                    not select.select([sock], [], [], min(remaining, 5))[0]):
+                continue
+            new_mail = self._idle_line(imap_session)
+        return self._idle_done(imap_session, tag, new_mail)
+
+    def _idle_start(self, imap_session):
+        """Send IDLE, return its tag once the server accepted it"""
+        self._tag += 1
+        tag = 'IDLE{0}'.format(self._tag).encode('ascii')
+        imap_session.send(tag + b' IDLE\r\n')
+        line = imap_session.readline()
+        if not line.startswith(b'+'):
+            raise imaplib.IMAP4.error('IDLE refused: {0!r}'.format(line))
+        return tag
+
+    def _idle_line(self, imap_session):
+        """Read a line sent during IDLE, True if it reports new mail"""
+        line = imap_session.readline()
+        if not line:
+            raise imaplib.IMAP4.abort('connection closed during IDLE')
+        return line.startswith(b'*') and line.rstrip().endswith(b'EXISTS')
+
+    def _idle_done(self, imap_session, tag, new_mail):
+        """End IDLE, True if new mail was reported (also meanwhile)"""
+        imap_session.send(b'DONE\r\n')
+        while True:
+            line = imap_session.readline()
+            if not line:
+                raise imaplib.IMAP4.abort('connection closed ending IDLE')
+            if line.startswith(tag + b' '):
+                break
+            new_mail = new_mail or (line.startswith(b'*') and
+                                    line.rstrip().endswith(b'EXISTS'))
+        return new_mail
+
+    def _buffered(self, imap_session):
+        """Whether data can be read from the session without waiting"""
+        sock = imap_session.socket()
+        if getattr(sock, 'pending', lambda: 0)():
+            return True             # Decrypted by SSL, not yet read
+        timeout = sock.gettimeout()
+        sock.setblocking(False)
+        try:
+            return bool(imap_session.file.peek(1))
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        finally:
+            sock.settimeout(timeout)
@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+#
+# Sender/recipient whitelists for mails to be printed.
+#
+# The [Valid senders] and [Valid recipients] sections of thpr.conf list
+# addresses (me@example.com) and domains (example.com or @example.com).
+# They are compiled once into hash lookups; a From:/To: header passes if
+# any address in it is listed, or its domain or a parent domain is.
+#
+# With whitelist_match = substring in [EMail] the entries are instead
+# looked for anywhere in the header, as thpr.py used to do, using a
+# single Aho-Corasick scan for all entries.
+#
+# The sections are read again whenever thpr.conf changes.
+
+import configparser
+import logging
+import os
+from email.utils import getaddresses
+
+logger = logging.getLogger(__name__)
+
+
+class AhoCorasick(object):
+    """Find any of a set of strings in a text in one pass"""
+
+    def __init__(self, patterns):
+        # Trie as a list of {char: node} dicts; fail links and whether a
+        # pattern ends here (or in a node reachable by fail links)
+        self.goto = [{}]
+        self.fail = [0]
+        self.match = [False]
+        for pattern in patterns:
+            if not pattern:
+                continue
+            node = 0
+            for char in pattern:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.match.append(False)
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.match[node] = True
+        # Breadth first, so fail links always point to finished nodes
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[child] = self.goto[fail].get(char, 0)
+                self.match[child] = self.match[child] or self.match[self.fail[child]]
+
+    def search(self, text):
+        """True if any pattern occurs in text"""
+        goto, fail, match = self.goto, self.fail, self.match
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if match[node]:
+                return True
+        return False
+
+
+class AddressMatcher(object):
+    """A compiled whitelist, called with a header value"""
+
+    def __init__(self, entries, substring=False):
+        entries = [entry.strip().lower() for entry in entries if entry.strip()]
+        self.substring = AhoCorasick(entries) if substring else None
+        self.addresses = set(entry for entry in entries if '@' in entry.lstrip('@'))
+        self.domains = set(entry.lstrip('@') for entry in entries
+                           if '@' not in entry.lstrip('@'))
+        if not substring:
+            for entry in entries:
+                domain = entry.rpartition('@')[2]
+                if '.' not in domain or '' in domain.split('.'):
+                    # Entries written for substring matching (a name,
+                    # @gmail) would silently match nothing
+                    logger.warning('Whitelist entry {0!r} is neither an address nor a '
+                                   'domain like example.com, it matches nothing unless '
+                                   'whitelist_match = substring'.format(entry))
+
+    def __call__(self, header):
+        if not header:
+            return False
+        if self.substring is not None:
+            return self.substring.search(header.lower())
+        for name, address in getaddresses([header]):
+            address = address.lower()
+            if address in self.addresses:
+                return True
+            domain = address.rpartition('@')[2]
+            while domain:
+                if domain in self.domains:
+                    return True
+                domain = domain.partition('.')[2]
+        return False
+
+
+class Whitelist(object):
+    """Sender and recipient whitelists, kept in sync with the config file"""
+
+    def __init__(self, config_file, config=None):
+        self.config_file = config_file
+        self.mtime = None
+        if config is None:
+            self.reload()
+        else:
+            self.mtime = self._mtime()
+            self.compile(config)
+
+    def _mtime(self):
+        try:
+            return os.stat(self.config_file).st_mtime
+        except OSError:
+            return None
+
+    def compile(self, config):
+        substring = config['EMail'].get('whitelist_match', 'address') == 'substring'
+        self.senders = AddressMatcher([x[1] for x in config.items('Valid senders')], substring)
+        self.recipients = AddressMatcher([x[1] for x in config.items('Valid recipients')], substring)
+
+    def reload(self):
+        """Compile the whitelists again if the config file has changed"""
+        mtime = self._mtime()
+        if mtime is None or mtime == self.mtime:
+            return False
+        config = configparser.ConfigParser()
+        try:
+            config.read(self.config_file)
+            self.compile(config)
+        except (configparser.Error, KeyError) as e:
+            # Most likely caught while the file was being edited; keep
+            # the old lists and try again next time
+            logger.warning('Could not reload whitelists: {0}'.format(e))
+            return False
+        self.mtime = mtime
+        return True
+
+    def __call__(self, sender, recipient):
+        return self.senders(sender) and self.recipients(recipient)
@@ -0,0 +1,445 @@
+#!/usr/bin/python3
+#
+# The print queue of thpr.py: jobs from mail, the button, the schedule
+# and the web server are spooled to disk and printed one at a time.
+
+import asyncio
+import collections
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from AdafruitThermal import clock, ThermalDocument
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised by PrintQueue.submit() when a job would exceed max_bytes"""
+    pass
+
+
+class PrintQueue(object):
+    """Serializes all printing through one worker thread
+
+    Producers (mail polling, button actions, the web server) call
+    submit(), which writes the job to spool_dir and returns at once.  The
+    worker thread is the only code that touches the AdafruitThermal
+    instance; it runs jobs in submission order through the handler
+    registered for their kind.
+
+    Jobs are JSON files, written atomically and fsync'ed before submit()
+    returns, so they survive a restart.  A job is renamed to .active
+    while it prints and removed once done; an .active job found at
+    startup was interrupted and is printed again.  A job that fails is
+    renamed to .failed and its files are removed; the last max_failed of
+    those are kept for status().  Jobs submitted with a
+    key (e.g. a mail's Message-ID) are recorded in done.log once printed,
+    and a key that is pending or done is not accepted a second time.
+
+    With max_bytes set, the spooled jobs (including the one printing)
+    may take up at most that many bytes; submit() raises QueueFull for a
+    job that does not fit.
+
+    Every job gets an estimate of its printing time when it is
+    submitted, from the estimator registered for its kind or else from
+    how long jobs of that kind took so far.  eta() adds them up to tell
+    when the printer will be free, and with max_seconds set, submit()
+    raises QueueFull rather than let the backlog grow beyond that.
+    """
+
+    max_done_keys = 1000
+    max_failed = 100
+    copy_size = 65536
+    # Estimate for a kind without estimator before one of its jobs ran
+    default_seconds = 30.0
+    # Weight of the latest run in the learned time per kind
+    learn_rate = 0.3
+    # Spool files belonging to a job: <job ID>.<state or file name>
+    file_name = re.compile(r'(\d{17}-[0-9a-f]{8})\.')
+
+    def __init__(self, printer, spool_dir, max_bytes=None, max_seconds=None):
+        self.printer = printer
+        self.spool_dir = spool_dir
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.handlers = {}
+        self.estimators = {}
+        self._seconds = {}          # Kind -> learned printing time
+        self._started = None        # When the current job started
+        self._cond = threading.Condition()
+        self._pending = collections.deque()
+        self._keys = set()
+        self._done_keys = collections.deque(maxlen=self.max_done_keys)
+        self._results = collections.OrderedDict()   # Job ID -> final status
+        self._bytes = 0
+        self._busy = False
+        self._current = None
+        self._thread = None
+        self._wakeup = None         # Set while run_async() runs
+        if not os.path.isdir(spool_dir):
+            os.makedirs(spool_dir)
+        self._load()
+
+    def register(self, kind, handler, estimate=None):
+        """Print jobs of this kind by calling handler(printer, job)
+
+        estimate(job) returns the seconds a job will take to print; it
+        is called by submit(), once the job's files are written.
+        """
+        self.handlers[kind] = handler
+        if estimate is not None:
+            self.estimators[kind] = estimate
+
+    def submit(self, kind, params=None, key=None, files=None, shed=True):
+        """Queue a job and return its ID (None if key was seen before)
+
+        files maps a name to bytes or a binary file object, stored
+        alongside the job; the handler finds their paths in
+        job['files'].  File objects are copied in chunks, so an upload
+        can be spooled without holding it in memory.  Raises QueueFull
+        if the job does not fit into max_bytes or max_seconds, unless
+        shed is False (for small local jobs that must not be refused).
+        """
+        with self._cond:
+            if key is not None and (key in self._keys or
+                                    key in self._done_keys):
+                logger.debug('Job with key {0} already queued or done'.format(key))
+                return None
+        job_id = '{0:017d}-{1}'.format(int(time.time() * 1000000),
+                                       uuid.uuid4().hex[:8])
+        job = {'id': job_id, 'kind': kind, 'key': key,
+               'params': params or {}, 'files': {}, 'size': 0}
+        # Files are written without holding the lock: uploads may be slow
+        try:
+            for name, data in (files or {}).items():
+                path = os.path.join(self.spool_dir, job_id + '.' + name)
+                job['files'][name] = path
+                room = None
+                if shed and self.max_bytes is not None:
+                    room = self.max_bytes - self.pending_bytes - job['size']
+                job['size'] += self._write_file(path, data, room)
+            job['seconds'] = self._estimate(job)
+            data = json.dumps(job).encode('utf-8')
+            job['size'] += len(data)
+            with self._cond:
+                if key is not None and (key in self._keys or
+                                        key in self._done_keys):
+                    logger.debug('Job with key {0} already queued or done'.format(key))
+                    self._remove_files(job)
+                    return None
+                if (shed and self.max_bytes is not None and
+                        self._bytes + job['size'] > self.max_bytes):
+                    raise QueueFull('print queue is full')
+                if (shed and self.max_seconds is not None and
+                        self._eta() + job['seconds'] > self.max_seconds):
+                    raise QueueFull('print queue is backlogged')
+                self._write_file(self._path(job_id, 'job'), data)
+                self._pending.append(job)
+                self._bytes += job['size']
+                if key is not None:
+                    self._keys.add(key)
+        except:
+            self._remove_files(job)
+            raise
+        with self._cond:
+            self._cond.notify()
+            if self._wakeup is not None:
+                self._wakeup()
+        logger.debug('Queued {0} job {1}'.format(kind, job_id))
+        return job_id
+
+    def status(self, job_id):
+        """Return a job's state as a dict, None if the job is unknown
+
+        'status' is one of queued, printing, done, failed or cancelled;
+        queued jobs also have their 'position' (0 prints next), and
+        queued and printing jobs the seconds until they are done ('eta').
+        """
+        with self._cond:
+            eta = self._remaining()
+            if self._current is not None and self._current['id'] == job_id:
+                return {'id': job_id, 'kind': self._current['kind'], 'status': 'printing',
+                        'eta': eta}
+            position = 0
+            for job in self._pending:
+                if job is None:
+                    continue
+                eta += job.get('seconds', self.default_seconds)
+                if job['id'] == job_id:
+                    return {'id': job_id, 'kind': job['kind'], 'status': 'queued',
+                            'position': position, 'eta': eta}
+                position += 1
+            if job_id in self._results:
+                kind, status = self._results[job_id]
+                return {'id': job_id, 'kind': kind, 'status': status}
+        if os.path.exists(self._path(job_id, 'failed')):
+            return {'id': job_id, 'kind': None, 'status': 'failed'}
+        return None
+
+    def cancel(self, job_id):
+        """Remove a queued job: True if done, False if it is printing or
+        finished, None if the job is unknown"""
+        with self._cond:
+            job = next((job for job in self._pending
+                        if job is not None and job['id'] == job_id), None)
+            if job is not None:
+                self._pending.remove(job)
+                self._bytes -= job.get('size', 0)
+                if job['key'] is not None:
+                    self._keys.discard(job['key'])
+                self._record(job, 'cancelled')
+                self._cond.notify_all()
+        if job is None:
+            return None if self.status(job_id) is None else False
+        os.remove(self._path(job_id, 'job'))
+        self._remove_files(job)
+        logger.debug('Cancelled {0} job {1}'.format(job['kind'], job_id))
+        return True
+
+    @property
+    def pending_bytes(self):
+        """Bytes taken up by spooled jobs"""
+        with self._cond:
+            return self._bytes
+
+    def eta(self):
+        """Seconds until every queued job will have been printed"""
+        with self._cond:
+            return self._eta()
+
+    def stats(self):
+        """Jobs waiting or printing, their bytes and the queue's eta()"""
+        with self._cond:
+            return {'jobs': sum(job is not None for job in self._pending) + self._busy,
+                    'bytes': self._bytes, 'eta': self._eta()}
+
+    def _eta(self):
+        return self._remaining() + sum(job.get('seconds', self.default_seconds)
+                                       for job in self._pending if job is not None)
+
+    def _remaining(self):
+        if self._current is None:
+            return 0.0
+        elapsed = clock() - self._started
+        return max(self._current.get('seconds', self.default_seconds) - elapsed, 0.0)
+
+    def _estimate(self, job):
+        estimate = self.estimators.get(job['kind'])
+        if estimate is not None:
+            try:
+                return estimate(job)
+            except Exception:
+                logger.warning('Cannot estimate {0} job {1}'.format(job['kind'], job['id']),
+                               exc_info=True)
+        return self._seconds.get(job['kind'], self.default_seconds)
+
+    def join(self, timeout=None):
+        """Wait until every queued job has been printed"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._pending or self._busy:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def start(self):
+        if self._thread is not None:
+            raise Exception("this queue is already running")
+        self._thread = threading.Thread(target=self._run, name='PrintQueue')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            with self._cond:
+                self._pending.appendleft(None)
+                self._cond.notify()
+            self._thread.join()
+            self._thread = None
+        elif self._wakeup is not None:
+            with self._cond:
+                self._pending.appendleft(None)
+            self._wakeup()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                job = self._pending.popleft()
+                if job is None:
+                    return
+                self._busy = True
+                self._current = job
+                self._started = clock()
+            try:
+                self._print(job)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._current = None
+                    self._cond.notify_all()
+
+    async def run_async(self, play):
+        """Run the queue from the running asyncio loop (instead of start())
+
+        Handlers render each job into a ThermalDocument in the loop's
+        default executor, as they may block; play(document) is then
+        awaited to print it.  Returns once stop() is called.
+        """
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        self._wakeup = lambda: loop.call_soon_threadsafe(wakeup.set)
+        try:
+            while True:
+                with self._cond:
+                    job = self._pending.popleft() if self._pending else False
+                    if job is None:
+                        return
+                    self._busy = job is not False
+                    self._current = job or None
+                    self._started = clock()
+                if job is False:
+                    await wakeup.wait()
+                    wakeup.clear()
+                    continue
+                try:
+                    document = ThermalDocument(self.printer)
+                    active = self._begin(job)
+                    try:
+                        await loop.run_in_executor(None, self.handlers[job['kind']], document, job)
+                        await play(document)
+                    except Exception as e:
+                        self._finish(job, active, e)
+                    else:
+                        self._finish(job, active)
+                finally:
+                    with self._cond:
+                        self._busy = False
+                        self._current = None
+                        self._cond.notify_all()
+        finally:
+            self._wakeup = None
+
+    def _print(self, job):
+        active = self._begin(job)
+        try:
+            self.handlers[job['kind']](self.printer, job)
+        except Exception as e:
+            self._finish(job, active, e)
+        else:
+            self._finish(job, active)
+
+    def _begin(self, job):
+        active = self._path(job['id'], 'active')
+        os.rename(self._path(job['id'], 'job'), active)
+        return active
+
+    def _finish(self, job, active, error=None):
+        if error is not None:
+            logger.error('Print job {0} ({1}) failed'.format(job['id'], job['kind']),
+                         exc_info=error)
+            os.rename(active, self._path(job['id'], 'failed'))
+            self._remove_files(job)
+            self._expire_failed()
+        else:
+            os.remove(active)
+            for path in job['files'].values():
+                os.remove(path)
+        with self._cond:
+            self._bytes -= job.get('size', 0)
+            self._record(job, 'done' if error is None else 'failed')
+            if error is None and job['kind'] not in self.estimators:
+                seconds = clock() - self._started
+                learned = self._seconds.get(job['kind'], seconds)
+                self._seconds[job['kind']] = learned + self.learn_rate * (seconds - learned)
+            if job['key'] is not None:
+                self._keys.discard(job['key'])
+                self._done_keys.append(job['key'])
+        if job['key'] is not None:
+            with open(os.path.join(self.spool_dir, 'done.log'), 'a') as fp:
+                fp.write(job['key'] + '\n')
+
+    def _load(self):
+        done_log = os.path.join(self.spool_dir, 'done.log')
+        if os.path.exists(done_log):
+            with open(done_log) as fp:
+                self._done_keys.extend(line.rstrip('\n') for line in fp)
+            # Keep the log from growing without bound
+            with open(done_log, 'w') as fp:
+                fp.writelines(key + '\n' for key in self._done_keys)
+        names = sorted(os.listdir(self.spool_dir))
+        for name in names:
+            job_id, ext = os.path.splitext(name)
+            if ext == '.active':
+                logger.info('Print job {0} was interrupted, printing it again'.format(job_id))
+                os.rename(os.path.join(self.spool_dir, name),
+                          self._path(job_id, 'job'))
+            elif ext != '.job':
+                continue
+            with open(self._path(job_id, 'job')) as fp:
+                job = json.load(fp)
+            self._pending.append(job)
+            self._bytes += job.get('size', 0)
+            if job['key'] is not None:
+                self._keys.add(job['key'])
+        # Files left behind by a crash during submit() or by failed jobs
+        queued = set(job['id'] for job in self._pending)
+        for name in names:
+            match = self.file_name.match(name)
+            if (match and match.group(1) not in queued and
+                    not name.endswith('.failed')):
+                logger.info('Removing stale spool file {0}'.format(name))
+                os.remove(os.path.join(self.spool_dir, name))
+        self._expire_failed()
+
+    def _expire_failed(self):
+        failed = sorted(name for name in os.listdir(self.spool_dir)
+                        if name.endswith('.failed'))
+        for name in failed[:max(len(failed) - self.max_failed, 0)]:
+            os.remove(os.path.join(self.spool_dir, name))
+
+    def _path(self, job_id, state):
+        return os.path.join(self.spool_dir, job_id + '.' + state)
+
+    def _write_file(self, path, data, limit=None):
+        """Write bytes or a file object's contents atomically, return the
+        size; raises QueueFull once more than limit bytes are written"""
+        tmp_path = path + '.tmp'
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as fp:
+                if isinstance(data, (bytes, bytearray)):
+                    data = io.BytesIO(data)
+                while True:
+                    chunk = data.read(self.copy_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if limit is not None and size > limit:
+                        raise QueueFull('print queue is full')
+                    fp.write(chunk)
+                fp.flush()
+                os.fsync(fp.fileno())
+        except:
+            os.remove(tmp_path)
+            raise
+        os.rename(tmp_path, path)
+        return size
+
+    def _remove_files(self, job):
+        for path in job['files'].values():
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _record(self, job, status):
+        self._results[job['id']] = (job['kind'], status)
+        while len(self._results) > self.max_done_keys:
+            self._results.popitem(last=False)
@@ -0,0 +1,261 @@
+#!/usr/bin/python3
+#
+# Timed jobs for thpr.py: the daily print and anything else that runs
+# at set times or intervals, kept by one thread (or one asyncio task).
+
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from AdafruitThermal import clock
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledJob(object):
+    """A function run by a Scheduler, with its timing and lateness stats"""
+
+    def __init__(self, function, name, interval=None, fixed_rate=True,
+                 jitter=0.0, overrun='skip', at=None):
+        if overrun not in ('skip', 'coalesce', 'queue'):
+            raise ValueError('Unknown overrun policy: {0}'.format(overrun))
+        self.function = function
+        self.name = name
+        self.interval = interval
+        self.fixed_rate = fixed_rate
+        self.jitter = jitter
+        self.overrun = overrun
+        self.at = at                # (hour, minute) for daily jobs
+        self.due = None             # Nominal time of the next run
+        self.offset = None          # Wall clock - clock() when due was set
+        self.cancelled = False
+        self.runs = 0
+        self.skipped = 0
+        self.max_late = 0.0
+        self.total_late = 0.0
+        self.last_late = None
+
+    def metrics(self):
+        return {'runs': self.runs,
+                'skipped': self.skipped,
+                'last_late': self.last_late,
+                'max_late': self.max_late,
+                'mean_late': self.total_late / self.runs if self.runs else None}
+
+
+class Scheduler(object):
+    """Runs functions at set times, all on one thread
+
+    Jobs wait in a heap ordered by their next deadline on the monotonic
+    clock; the thread sleeps until the first one is due or a job is
+    added.  every() jobs run at a fixed rate (deadlines on a fixed grid,
+    so slow runs don't make the schedule drift) or with a fixed delay
+    after the end of the previous run.  When a fixed-rate run takes
+    longer than the interval, its overrun policy decides what happens to
+    the deadlines missed meanwhile: 'skip' drops them, 'coalesce' runs
+    once straight away for all of them, 'queue' runs once for each.
+    daily() jobs run at a local wall clock time; their deadlines are
+    worked out again whenever the wall clock is set (checked every
+    wall_check seconds), e.g. by NTP after a Pi without a real-time clock
+    has booted.  Each deadline may be
+    delayed by a random jitter, and the lateness of every run (start
+    against nominal deadline) is kept per job, see metrics().
+    """
+
+    wall_check = 60.0
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self._wakeup = None         # Set while run_async() runs
+        self.jobs = {}
+
+    def every(self, interval, function, name=None, fixed_rate=True, jitter=0.0,
+              overrun='skip', first=None):
+        """Run function every interval seconds, first after 'first' seconds"""
+        job = ScheduledJob(function, name or function.__name__, interval,
+                           fixed_rate, jitter, overrun)
+        job.due = clock() + (interval if first is None else first)
+        return self._add(job)
+
+    def daily(self, hour, minute, function, name=None, jitter=0.0):
+        """Run function every day at hour:minute local time"""
+        job = ScheduledJob(function, name or function.__name__, jitter=jitter,
+                           at=(hour, minute))
+        job.due = self._next_daily(job)
+        return self._add(job)
+
+    def cancel(self, job):
+        with self._cond:
+            job.cancelled = True
+            self.jobs.pop(job.name, None)
+
+    def metrics(self):
+        with self._cond:
+            return dict((name, job.metrics()) for name, job in self.jobs.items())
+
+    def start(self):
+        if self._thread is not None:
+            raise Exception("this scheduler is already running")
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name='Scheduler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            with self._cond:
+                self._stop = True
+                self._cond.notify()
+            self._thread.join()
+            self._thread = None
+        elif self._wakeup is not None:
+            with self._cond:
+                self._stop = True
+            self._wakeup()
+
+    def _add(self, job):
+        with self._cond:
+            self.jobs[job.name] = job
+            self._push(job)
+        return job
+
+    def _push(self, job):
+        deadline = job.due + (random.uniform(0, job.jitter) if job.jitter else 0.0)
+        heapq.heappush(self._heap, (deadline, next(self._seq), job))
+        self._cond.notify()
+        if self._wakeup is not None:
+            self._wakeup()
+
+    def _next_daily(self, job):
+        # Local time of the next hour:minute, as a monotonic deadline
+        now = time.time()
+        t = time.localtime(now)
+        wall = time.mktime((t.tm_year, t.tm_mon, t.tm_mday, job.at[0], job.at[1], 0, 0, 0, -1))
+        if wall <= now:
+            t = time.localtime(now + 24 * 3600)
+            wall = time.mktime((t.tm_year, t.tm_mon, t.tm_mday, job.at[0], job.at[1], 0, 0, 0, -1))
+        monotonic = clock()
+        job.offset = now - monotonic
+        return monotonic + (wall - now)
+
+    def _follow_wall_clock(self):
+        # Work out the deadlines of daily jobs not yet due again if the
+        # wall clock was set since they were computed
+        now = clock()
+        offset = time.time() - now
+        moved = False
+        for i, (deadline, seq, job) in enumerate(self._heap):
+            if (job.at is not None and not job.cancelled and job.due > now and
+                    abs(offset - job.offset) > 1.0):
+                due = self._next_daily(job)
+                self._heap[i] = (deadline + due - job.due, seq, job)
+                job.due = due
+                moved = True
+        if moved:
+            logger.info('Wall clock was set, daily jobs rescheduled')
+            heapq.heapify(self._heap)
+
+    def _run(self):
+        with self._cond:
+            while not self._stop:
+                job, wait = self._next_due()
+                if job is None:
+                    self._cond.wait(wait)
+                    continue
+                self._cond.release()
+                try:
+                    start = self._call(job)
+                finally:
+                    self._cond.acquire()
+                self._done(job, start)
+
+    async def run_async(self):
+        """Run the jobs from the running asyncio loop (instead of start())
+
+        Job functions run in the loop's default executor, as they may
+        block (the daily print submits to the queue, which syncs files);
+        the loop only keeps the time.
+        """
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        with self._cond:
+            self._stop = False
+            self._wakeup = lambda: loop.call_soon_threadsafe(wakeup.set)
+        try:
+            while True:
+                with self._cond:
+                    if self._stop:
+                        return
+                    job, wait = self._next_due()
+                if job is None:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    wakeup.clear()
+                    continue
+                start = await loop.run_in_executor(None, self._call, job)
+                with self._cond:
+                    self._done(job, start)
+        finally:
+            self._wakeup = None
+
+    def _next_due(self):
+        # The next job if it is due, else (None, seconds to wait or None)
+        self._follow_wall_clock()
+        while self._heap:
+            deadline, seq, job = self._heap[0]
+            now = clock()
+            if deadline > now:
+                if any(entry[2].at is not None for entry in self._heap):
+                    return None, min(deadline - now, self.wall_check)
+                return None, deadline - now
+            heapq.heappop(self._heap)
+            if not job.cancelled:
+                return job, None
+        return None, None
+
+    def _call(self, job):
+        start = clock()
+        try:
+            job.function()
+        except Exception:
+            logger.exception('Scheduled job {0} failed'.format(job.name))
+        return start
+
+    def _done(self, job, start):
+        late = start - job.due
+        job.runs += 1
+        job.last_late = late
+        job.max_late = max(job.max_late, late)
+        job.total_late += late
+        if not job.cancelled:
+            self._reschedule(job)
+
+    def _reschedule(self, job):
+        now = clock()
+        if job.at is not None:
+            job.due = self._next_daily(job)
+        elif not job.fixed_rate:
+            job.due = now + job.interval
+        else:
+            job.due += job.interval
+            if job.due <= now:
+                missed = int((now - job.due) // job.interval) + 1
+                if job.overrun == 'skip':
+                    # Next deadline still ahead
+                    job.skipped += missed
+                    job.due += missed * job.interval
+                elif job.overrun == 'coalesce':
+                    # One run, right away, for the latest missed deadline
+                    job.skipped += missed - 1
+                    job.due += (missed - 1) * job.interval
+                # 'queue': one run per missed deadline, back to back
+        self._push(job)
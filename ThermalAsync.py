@@ -0,0 +1,84 @@
+#*************************************************************************
+# asyncio output for the Adafruit Thermal Printer.
+#
+# AsyncThermal prints ThermalDocuments from an asyncio event loop: the
+# document's segments are sent in blocks of up to buffer_size bytes, as
+# print_document() does, but instead of sleeping until the printer has
+# caught up, the coroutine is resumed by loop.call_at() at that time,
+# and writes go to the port's file descriptor without blocking, waiting
+# for it to become writable when the kernel buffer is full.  Everything
+# else on the loop keeps running while a job prints.
+#*************************************************************************
+
+from __future__ import print_function
+import asyncio
+import os
+
+
+class AsyncThermal(object):
+
+    # 'printer' is an AdafruitThermal whose port is open and set up;
+    # AsyncThermal takes over sending to it, so it must not be used
+    # directly at the same time.
+    def __init__(self, printer):
+        self.printer = printer
+        # Same monotonic clock as the event loop's
+        self.resume_time = printer.resume_time
+        self._lock = None
+
+    # Print a ThermalDocument, returning once the last block has been
+    # handed to the port (the printer needs document.duration seconds
+    # in all to print it)
+    async def print_document(self, document):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self.printer.no_printing:
+                block = bytearray()
+                d     = 0.0
+                for data, seconds in document.segments:
+                    if block and len(block) + len(data) > self.printer.buffer_size:
+                        await self._send(block, d)
+                        block = bytearray()
+                        d     = 0.0
+                    block += data
+                    d     += seconds
+                if block:
+                    await self._send(block, d)
+            for name in self.printer.state_attrs:
+                setattr(self.printer, name, getattr(document, name))
+            self.printer.paper_rows += document.paper_rows
+
+    async def _send(self, data, seconds):
+        loop = asyncio.get_running_loop()
+        await self.sleep_until(self.resume_time)
+        await self._write(bytes(data))
+        self.resume_time = loop.time() + seconds
+
+    # Resume at loop time 'when'; at once if that has passed
+    async def sleep_until(self, when):
+        loop = asyncio.get_running_loop()
+        if when <= loop.time():
+            return
+        future = loop.create_future()
+        handle = loop.call_at(when, lambda: future.done() or future.set_result(None))
+        try:
+            await future
+        finally:
+            handle.cancel()
+
+    async def _write(self, data):
+        loop = asyncio.get_running_loop()
+        fd = self.printer.fileno()
+        os.set_blocking(fd, False)
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[os.write(fd, view):]
+            except BlockingIOError:
+                writable = loop.create_future()
+                loop.add_writer(fd, lambda: writable.done() or writable.set_result(None))
+                try:
+                    await writable
+                finally:
+                    loop.remove_writer(fd)
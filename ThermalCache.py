@@ -0,0 +1,120 @@
+#*************************************************************************
+# On-disk cache of print-ready bitmaps for the Adafruit Thermal Printer.
+#
+# Static images (greeting logos and the like) would otherwise be
+# decoded, dithered and packed again for every print.  The cache keeps
+# the packed 1-bit rows print_bitmap() takes, in files named after a
+# SHA-1 of the source file's contents, the print width, the dither
+# method and the library version, so any change to one of them simply
+# misses.  Hits are memory-mapped and sent straight from the page cache.
+#
+# The least recently used files are removed once the cache grows past
+# max_size bytes; a hit counts as a use (the file's mtime is updated).
+#*************************************************************************
+
+from __future__ import print_function
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from PIL import Image
+import AdafruitThermal
+import ThermalDither
+
+PRINT_WIDTH = 384
+HEADER      = struct.Struct('<II')  # width, height
+
+
+class BitmapCache(object):
+
+    def __init__(self, cache_dir=None, max_size=16*1024*1024):
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'thermal')
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        # (path, size, mtime) -> content hash, to hash each file only once
+        self.hashes = {}
+
+    # Print an image file through the cache.  The image is cropped to
+    # 'width' dots if wider, as print_image() does; with 'dither' it is
+    # dithered by that ThermalDither method.
+    def print_image(self, printer, path, LaaT=False, width=PRINT_WIDTH, dither=None):
+        cache_file = self.cache_file(path, width, dither)
+        if not os.path.exists(cache_file):
+            self.store(cache_file, *render(Image.open(path), width, dither))
+        with open(cache_file, 'rb') as fp:
+            w, h = HEADER.unpack(fp.read(HEADER.size))
+            if w * h == 0:
+                return
+            os.utime(cache_file, None)
+            bitmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                view = memoryview(bitmap)
+                try:
+                    printer.print_bitmap(w, h, view[HEADER.size:], LaaT)
+                finally:
+                    view.release()
+            finally:
+                bitmap.close()
+
+    def cache_file(self, path, width, dither):
+        stat = os.stat(path)
+        source = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+        if source not in self.hashes:
+            digest = hashlib.sha1()
+            with open(path, 'rb') as fp:
+                for block in iter(lambda: fp.read(64*1024), b''):
+                    digest.update(block)
+            self.hashes[source] = digest.hexdigest()
+        key = '{0}-{1}-{2}-{3}'.format(self.hashes[source], width, dither or 'none',
+                                       AdafruitThermal.__version__)
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + '.bits')
+
+    def store(self, cache_file, width, height, bitmap):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        fd, tmp_file = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(HEADER.pack(width, height))
+            fp.write(bitmap)
+        os.rename(tmp_file, cache_file)
+        self.evict()
+
+    # Remove least recently used files until the cache fits max_size
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.bits'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        entries.sort()
+        # The newest file stays even if it alone is too large
+        for mtime, size, path in entries[:-1]:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+# Image to (width, height, packed bitmap) the way print_image() would
+# send it
+def render(image, width=PRINT_WIDTH, dither=None):
+    if image.mode != '1':
+        if dither:
+            image = ThermalDither.dither(image, dither)
+        else:
+            image = image.convert('1')
+    if image.size[0] > width:
+        image = image.crop((0, 0, width, image.size[1]))
+    return image.size[0], image.size[1], AdafruitThermal.pack_image(image)
@@ -0,0 +1,194 @@
+#*************************************************************************
+# Dithering for the Adafruit Thermal Printer.
+#
+# Turns grayscale images into 1-bit images by one of these methods:
+#
+#   floyd-steinberg  error diffusion, done by PIL's convert('1')
+#   atkinson         error diffusion passing on only 3/4 of the error,
+#                    which keeps highlights and shadows clean
+#   stucki           error diffusion over two rows, smoothest result
+#   bayer            ordered dither with an 8x8 Bayer matrix
+#   blue-noise       threshold against interleaved gradient noise
+#
+# Thermal paper prints dots larger than their pitch, so dithered
+# midtones come out too dark; images are lightened and given a bit of
+# contrast first (see tone_table).
+#
+# Error diffusion is inherently serial, but a pixel only depends on
+# pixels above it up to two columns to the right.  With NumPy, pixels
+# are therefore processed in skewed diagonals (x + 3*y constant), each
+# of which can be done at once, in bands of BAND_ROWS rows; without
+# NumPy, one pixel at a time.
+# The threshold methods only use PIL operations.
+#*************************************************************************
+
+from __future__ import print_function
+from PIL import Image, ImageChops
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+GAMMA    = 1.6
+CONTRAST = 1.1
+
+# Rows diffused at once with NumPy; more take more memory, fewer more time
+BAND_ROWS = 512
+
+# Error diffusion kernels: (dx, dy, weight) for the error of a pixel,
+# dy >= 0 and dx > 0 where dy is 0
+KERNELS = {
+    'atkinson': [( 1, 0, 1/8.), ( 2, 0, 1/8.),
+                 (-1, 1, 1/8.), ( 0, 1, 1/8.), ( 1, 1, 1/8.),
+                 ( 0, 2, 1/8.)],
+    'stucki':   [( 1, 0, 8/42.), ( 2, 0, 4/42.),
+                 (-2, 1, 2/42.), (-1, 1, 4/42.), ( 0, 1, 8/42.), ( 1, 1, 4/42.), ( 2, 1, 2/42.),
+                 (-2, 2, 1/42.), (-1, 2, 2/42.), ( 0, 2, 4/42.), ( 1, 2, 2/42.), ( 2, 2, 1/42.)],
+}
+
+METHODS = ('threshold', 'floyd-steinberg', 'atkinson', 'stucki', 'bayer', 'blue-noise')
+
+
+# Dither a grayscale image with the named method ('threshold' thresholds
+# at the middle gray, see ThermalImage.prepare_image for a better one).
+def dither(gray, method='floyd-steinberg', gamma=GAMMA, contrast=CONTRAST):
+    if method not in METHODS:
+        raise ValueError('Unknown dither method: {0}'.format(method))
+    if gray.mode != 'L':
+        gray = gray.convert('L')
+    if method == 'threshold':
+        return gray.point(lambda v: 255 if v >= 128 else 0, '1')
+    gray = gray.point(tone_table(gamma, contrast))
+    if method == 'floyd-steinberg':
+        return gray.convert('1')
+    if method in KERNELS:
+        return diffuse(gray, KERNELS[method])
+    if method == 'bayer':
+        return ordered(gray, bayer_map(gray.size))
+    return ordered(gray, noise_map(gray.size))
+
+
+# Lookup table for Image.point(): gamma lightens midtones (for gamma
+# above 1), then contrast stretches around the middle gray.
+def tone_table(gamma=GAMMA, contrast=CONTRAST):
+    table = []
+    for v in range(256):
+        v = 255.0 * (v / 255.0) ** (1.0 / gamma)
+        v = (v - 127.5) * contrast + 127.5
+        table.append(min(max(int(v + 0.5), 0), 255))
+    return table
+
+
+# White where gray >= threshold, from the threshold map's inverse: the
+# saturating add only reaches 255 there.
+def ordered(gray, thresholds):
+    inverse = thresholds.point(lambda v: 255 - v)
+    return ImageChops.add(gray, inverse).point(lambda v: 255 if v == 255 else 0, '1')
+
+
+# Bayer matrix of size 2**order, values 0 .. 4**order - 1
+def bayer_matrix(order=3):
+    matrix = [[0]]
+    for i in range(order):
+        n = len(matrix)
+        matrix = [[4 * matrix[y % n][x % n] + (0, 2, 3, 1)[(y // n) * 2 + x // n]
+                   for x in range(2 * n)] for y in range(2 * n)]
+    return matrix
+
+
+# Threshold map tiled with an 8x8 Bayer matrix, thresholds 2 .. 254
+def bayer_map(size):
+    matrix = bayer_matrix(3)
+    tile = Image.new('L', (8, 8))
+    tile.putdata([(4 * v + 2) for row in matrix for v in row])
+    thresholds = Image.new('L', size)
+    for y in range(0, size[1], 8):
+        for x in range(0, size[0], 8):
+            thresholds.paste(tile, (x, y))
+    return thresholds
+
+
+# Threshold map of interleaved gradient noise (Jimenez 2014), a cheap
+# stand-in for blue noise without visible tiling
+def noise_map(size):
+    width, height = size
+    if np is not None:
+        x = np.arange(width, dtype=np.float64)[np.newaxis, :]
+        y = np.arange(height, dtype=np.float64)[:, np.newaxis]
+        noise = np.modf(52.9829189 * np.modf(0.06711056 * x + 0.00583715 * y)[0])[0]
+        return Image.frombytes('L', size, (noise * 254 + 1).astype(np.uint8).tobytes())
+    data = bytearray(width * height)
+    for y in range(height):
+        for x in range(width):
+            noise = (52.9829189 * ((0.06711056 * x + 0.00583715 * y) % 1.0)) % 1.0
+            data[y * width + x] = int(noise * 254 + 1)
+    return Image.frombytes('L', size, bytes(data))
+
+
+# Error diffusion with a kernel from KERNELS
+def diffuse(gray, kernel):
+    if np is None:
+        return _diffuse_rows(gray, kernel)
+    width, height = gray.size
+    pixels = np.frombuffer(gray.tobytes(), dtype=np.uint8).reshape(height, width)
+    out    = np.empty((height, width), dtype=bool)
+    reach  = max(dy for dx, dy, weight in kernel)
+    carry  = np.zeros((reach, width), dtype=np.float32)
+    for top in range(0, height, BAND_ROWS):
+        rows = min(BAND_ROWS, height - top)
+        band = np.vstack((pixels[top:top + rows].astype(np.float32),
+                          np.zeros((reach, width), dtype=np.float32)))
+        band[:reach] += carry
+        band = _diffuse_band(band, rows, kernel)
+        out[top:top + rows] = band[:rows] >= 128
+        carry = band[rows:]
+    bits = np.where(out, 255, 0).astype(np.uint8).tobytes()
+    return Image.frombytes('L', (width, height), bits).convert('1', dither=Image.NONE)
+
+
+# Diffuse the errors of the first 'rows' rows of a float array in place
+# (the rows below only collect errors).  Row y is stored shifted right
+# by 3*y + 2, which turns the diagonals of pixels processed together
+# into columns of 'skew'.
+def _diffuse_band(band, rows, kernel):
+    height, width = band.shape
+    pad  = 2
+    skew = np.zeros((height, width + 3 * height + 2 * pad), dtype=np.float32)
+    for y in range(height):
+        skew[y, 3 * y + pad:3 * y + pad + width] = band[y]
+    shifts  = [(dy, dx + 3 * dy) for dx, dy, weight in kernel]
+    weights = np.array([weight for dx, dy, weight in kernel], dtype=np.float32)
+    for step in range(width + 3 * (rows - 1)):
+        low    = max(0, (step - width + 3) // 3)
+        high   = min(rows, step // 3 + 1)
+        column = step + pad
+        values = skew[low:high, column]
+        error  = values - (values >= 128) * np.float32(255)
+        shares = np.multiply.outer(weights, error)
+        for (dy, shift), share in zip(shifts, shares):
+            skew[low + dy:high + dy, column + shift] += share
+    for y in range(height):
+        band[y] = skew[y, 3 * y + pad:3 * y + pad + width]
+    return band
+
+
+# Error diffusion a pixel at a time, for when NumPy is not available
+def _diffuse_rows(gray, kernel):
+    width, height = gray.size
+    data = gray.tobytes()
+    rows = [[float(v) for v in data[y * width:(y + 1) * width]] for y in range(height)]
+    out  = bytearray(width * height)
+    for y in range(height):
+        row = rows[y]
+        for x in range(width):
+            value = row[x]
+            if value >= 128:
+                out[y * width + x] = 255
+                error = value - 255
+            else:
+                error = value
+            for dx, dy, weight in kernel:
+                if 0 <= x + dx < width and y + dy < height:
+                    rows[y + dy][x + dx] += error * weight
+    return Image.frombytes('L', (width, height), bytes(out)).convert('1', dither=Image.NONE)
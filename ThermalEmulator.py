@@ -0,0 +1,425 @@
+#*************************************************************************
+# Printer emulator for the AdafruitThermal library.
+#
+# PrinterEmulator stands in for the serial port: it parses the ESC/POS
+# commands the library emits, models the printer's receive buffer and
+# paper motion over time, and renders the printout to a PIL image.
+# EmulatedThermal is the printer class to use with it, with the same
+# API as AdafruitThermal.  Together they allow the byte stream, timing
+# and output of the library to be measured and checked without any
+# hardware, e.g.:
+#
+#   emulator = PrinterEmulator(clock=VirtualClock())
+#   printer  = EmulatedThermal(emulator)
+#   printer.print_line('Hello')
+#   emulator.image().save('hello.png')
+#
+# With a VirtualClock, waits for the (emulated) paper to move take no
+# real time, so long print jobs can be replayed quickly.
+#*************************************************************************
+
+from __future__ import print_function
+import collections
+import time
+import warnings
+from PIL import Image, ImageDraw, ImageFont
+from AdafruitThermal import ThermalCommands, clock
+
+
+# A clock that only advances when something sleeps on it.
+class VirtualClock(object):
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+
+
+# Issued (through the warnings module) whenever more data has been
+# sent than the emulated printer's receive buffer can hold.
+class BufferOverrun(RuntimeWarning):
+    pass
+
+
+class PrinterEmulator(object):
+
+    width = 384   # Print head width in dots
+    char_width = 12
+
+    # Command bytes
+    LF  = 10
+    ESC = 27
+    DC2 = 18
+    GS  = 29
+
+    def __init__(self, baudrate=19200, buffer_size=4096,
+                 dot_print_time=0.03, dot_feed_time=0.0021, clock=clock):
+        self.baudrate       = baudrate
+        self.byte_time      = 11.0 / float(baudrate)
+        self.buffer_size    = buffer_size
+        self.dot_print_time = dot_print_time
+        self.dot_feed_time  = dot_feed_time
+        self.clock          = clock
+        self.sleep          = getattr(clock, 'sleep', time.sleep)
+
+        self.bytes_received = 0
+        self.commands       = collections.Counter()
+        self.overruns       = 0
+        self.print_time     = 0.0  # Time spent moving paper
+        self.idle_time      = 0.0  # Time spent waiting for data mid-job
+        self.busy_until     = 0.0  # When the last command received completes
+        self.max_buffered   = 0
+
+        self._buf      = bytearray()  # Received, not yet parsed
+        self._blocks   = collections.deque()  # (first byte index, start time)
+        self._line_free = 0.0  # When the serial line finishes sending
+        self._queued   = collections.deque()  # (start time, bytes) not started
+        self._queued_bytes = 0
+        self._status   = collections.deque()  # (ready time, byte)
+        self._bitmap   = None  # [rows left, row bytes] inside DC2 *
+        self._paper    = []
+        self._line     = bytearray()
+        self.reset()
+
+
+    # Printer settings after power-up or ESC @
+    def reset(self):
+        self.print_mode     = 0
+        self.char_height    = 24
+        self.line_spacing   = 8
+        self.justify        = 0
+        self.underline      = 0
+        self.size           = 0
+        self.barcode_height = 50
+        self.heat_config    = (7, 80, 2)
+        self.online         = True
+
+
+    # Serial port interface
+
+    def write(self, data):
+        data = bytes(data)
+        start = max(self.clock(), self._line_free)
+        self._blocks.append((self.bytes_received, start))
+        self._line_free = start + len(data) * self.byte_time
+        self._buf += data
+        self.bytes_received += len(data)
+        self._parse()
+        return len(data)
+
+    def read(self, size=1):
+        result = bytearray()
+        while self._status and len(result) < size:
+            ready, value = self._status.popleft()
+            self.sleep(max(0.0, ready - self.clock()))
+            result.append(value)
+        return bytes(result)
+
+    # A property, as on pyserial's Serial
+    @property
+    def in_waiting(self):
+        return len(self._status)
+
+
+    # Printout so far, as a 1-bit image self.width dots wide.
+    def image(self):
+        height = sum(part.size[1] for part in self._paper)
+        paper  = Image.new('1', (self.width, max(height, 1)), 1)
+        y = 0
+        for part in self._paper:
+            paper.paste(part, (0, y))
+            y += part.size[1]
+        return paper
+
+    # When the printer will have finished everything received so far.
+    def finish_time(self):
+        return max(self.busy_until, self._line_free)
+
+
+    # Parsing.  Complete commands are taken off the front of _buf;
+    # an incomplete one stays there until more data arrives.
+
+    def _parse(self):
+        i   = 0
+        buf = self._buf
+        while i < len(buf):
+            if self._bitmap is not None:
+                rows_left, row_bytes = self._bitmap
+                if len(buf) - i < row_bytes:
+                    break
+                self._bitmap_row(buf[i:i + row_bytes])
+                i += row_bytes
+                self._done(i, row_bytes, self.dot_print_time)
+                if rows_left == 1:
+                    self._bitmap = None
+                else:
+                    self._bitmap[0] -= 1
+                continue
+
+            c = buf[i]
+            if c == self.ESC:
+                n = self._escape(buf, i)
+            elif c == self.DC2:
+                n = self._dc2(buf, i)
+            elif c == self.GS:
+                n = self._gs(buf, i)
+            elif c == self.LF:
+                n = 1
+                self._done(i + 1, 1, self._end_line())
+            elif c < 0x20 or c == 0xFF:
+                n = 1  # Wake byte, tab, form feed etc.: no paper motion
+                self._done(i + 1, 1, 0.0)
+            else:
+                n = 1
+                cost = 0.0
+                if len(self._line) >= self._max_column():
+                    cost = self._end_line()
+                self._line.append(c)
+                self._done(i + 1, 1, cost)
+            if n is None:
+                break
+            i += n
+        del buf[:i]
+
+    def _escape(self, buf, i):
+        if len(buf) - i < 2:
+            return None
+        cmd = buf[i + 1]
+        if cmd == 64:        # ESC @  Initialize
+            self.reset()
+            return self._command(i, 2, 'ESC @')
+        if cmd == 55:        # ESC 7 n1 n2 n3  Heating parameters
+            if len(buf) - i < 5:
+                return None
+            self.heat_config = tuple(buf[i + 2:i + 5])
+            return self._command(i, 5, 'ESC 7')
+        if cmd in (33, 97, 45, 51, 74, 61, 56, 118, 82, 116, 32, 100):
+            if len(buf) - i < 3:
+                return None
+            n = buf[i + 2]
+            cost = 0.0
+            if cmd == 33:    # ESC ! n  Print mode
+                self.print_mode  = n
+                self.char_height = 48 if n & (1 << 4) else 24
+            elif cmd == 97:  # ESC a n  Justification
+                self.justify = n
+            elif cmd == 45:  # ESC - n  Underline
+                self.underline = n
+            elif cmd == 51:  # ESC 3 n  Line spacing
+                self.line_spacing = max(n - 24, 0)
+            elif cmd == 74:  # ESC J n  Feed n dot rows
+                self._feed(n)
+                cost = n * self.dot_feed_time
+            elif cmd == 100: # ESC d n  Feed n lines
+                cost = sum(self._end_line() for x in range(n))
+            elif cmd == 61:  # ESC = n  Online/offline
+                self.online = bool(n & 1)
+            elif cmd == 118: # ESC v n  Status: bit 2 clear = paper present
+                self._status.append((None, 0))
+            return self._command(i, 3, 'ESC ' + chr(cmd), cost)
+        # Lone ESC (e.g. the ones wake() sends): skip it and carry
+        # on with whatever follows.
+        self._done(i + 1, 1, 0.0)
+        return 1
+
+    def _dc2(self, buf, i):
+        if len(buf) - i < 2:
+            return None
+        cmd = buf[i + 1]
+        if cmd == 42:        # DC2 * r n  Bitmap, r rows of n bytes
+            if len(buf) - i < 4:
+                return None
+            rows, row_bytes = buf[i + 2], buf[i + 3]
+            self._flush_line()
+            if rows and row_bytes:
+                self._bitmap = [rows, row_bytes]
+            return self._command(i, 4, 'DC2 *')
+        if cmd == 35:        # DC2 # n  Print density
+            if len(buf) - i < 3:
+                return None
+            return self._command(i, 3, 'DC2 #')
+        if cmd == 84:        # DC2 T  Test page
+            self._feed(24 * 26 + 8 * 26 + 32)
+            return self._command(i, 2, 'DC2 T',
+                                 self.dot_print_time * 24 * 26 +
+                                 self.dot_feed_time * (8 * 26 + 32))
+        self._done(i + 1, 1, 0.0)
+        return 1
+
+    def _gs(self, buf, i):
+        if len(buf) - i < 3:
+            return None
+        cmd, n = buf[i + 1], buf[i + 2]
+        if cmd == 33:        # GS ! n  Character size
+            self.size = n
+            self.char_height = 48 if n & 0x0F else 24
+            return self._command(i, 3, 'GS !')
+        if cmd == 104:       # GS h n  Barcode height
+            self.barcode_height = max(n, 1)
+            return self._command(i, 3, 'GS h')
+        if cmd in (72, 119): # GS H n, GS w n  Barcode label/width
+            return self._command(i, 3, 'GS ' + chr(cmd))
+        if cmd == 107:       # GS k m d1...dk  Barcode, data up to NUL
+            end = i + 3
+            while end < len(buf) and buf[end] >= 0x20:
+                end += 1
+            if end == len(buf):
+                return None
+            text = bytes(buf[i + 3:end])
+            if buf[end] == 0:
+                end += 1
+            self._barcode(text)
+            rows = self.barcode_height + 40
+            return self._command(i, end - i, 'GS k',
+                                 rows * self.dot_print_time)
+        self._done(i + 1, 1, 0.0)
+        return 1
+
+    def _command(self, i, length, name, cost=0.0):
+        self.commands[name] += 1
+        self._done(i + length, length, cost)
+        return length
+
+
+    # Timing.  A command has arrived once its last byte has come off
+    # the serial line, and starts once it has arrived and the printer
+    # is done with the command before it.  Until it starts, its bytes
+    # take up room in the receive buffer.
+
+    def _arrival(self, end):
+        index = self.bytes_received - len(self._buf) + end - 1
+        while len(self._blocks) > 1 and self._blocks[1][0] <= index:
+            self._blocks.popleft()
+        first, start = self._blocks[0]
+        return start + (index - first + 1) * self.byte_time
+
+    def _done(self, end, length, cost):
+        arrival = self._arrival(end)
+        while self._queued and self._queued[0][0] <= arrival:
+            self._queued_bytes -= self._queued.popleft()[1]
+        buffered = self._queued_bytes + length
+        self.max_buffered = max(self.max_buffered, buffered)
+        if buffered > self.buffer_size:
+            self.overruns += 1
+            warnings.warn('printer receive buffer overrun: {0} bytes buffered, '
+                          'room for {1}'.format(buffered, self.buffer_size),
+                          BufferOverrun, stacklevel=4)
+        start = max(arrival, self.busy_until)
+        if cost and self.busy_until and arrival > self.busy_until:
+            self.idle_time += arrival - self.busy_until
+        if start > arrival:
+            self._queued.append((start, length))
+            self._queued_bytes += length
+        if cost:
+            self.busy_until = start + cost
+            self.print_time += cost
+        elif arrival > self.busy_until:
+            self.busy_until = arrival
+        if self._status and self._status[-1][0] is None:
+            # Status replies go out once the printer gets to the query
+            self._status[-1] = (start, self._status[-1][1])
+
+
+    # Rendering
+
+    def _max_column(self):
+        width = self.char_width
+        if self.print_mode & (1 << 5) or self.size & 0xF0:
+            width *= 2
+        return self.width // width
+
+    def _end_line(self):
+        if not self._line:
+            self._feed(self.char_height + self.line_spacing)
+            return ((self.char_height + self.line_spacing) *
+                    self.dot_feed_time)
+        self._flush_line()
+        return (self.char_height * self.dot_print_time +
+                self.line_spacing * self.dot_feed_time)
+
+    def _flush_line(self):
+        if not self._line:
+            return
+        text   = self._line.decode('latin-1')
+        self._line = bytearray()
+        cell_w = self.width // self._max_column()
+        line_w = min(cell_w * len(text), self.width)
+        font   = ImageFont.load_default()
+        left, top, right, bottom = font.getbbox(text)
+        glyphs = Image.new('L', (max(right, 1), max(bottom, 1)), 0)
+        ImageDraw.Draw(glyphs).text((0, 0), text, fill=255, font=font)
+        glyphs = glyphs.resize((line_w, self.char_height))
+        mask   = glyphs.point(lambda v: 255 if v >= 128 else 0)
+        row = Image.new('1', (self.width, self.char_height + self.line_spacing), 1)
+        x = [0, (self.width - line_w) // 2, self.width - line_w][min(self.justify, 2)]
+        draw = ImageDraw.Draw(row)
+        ink  = 0
+        if self.print_mode & (1 << 1):   # Inverse
+            draw.rectangle([x, 0, x + line_w - 1, self.char_height - 1], fill=0)
+            ink = 1
+        row.paste(ink, (x, 0), mask)
+        if self.print_mode & (1 << 3):   # Bold
+            row.paste(ink, (x + 1, 0), mask)
+        if self.underline:
+            draw.rectangle([x, self.char_height - self.underline,
+                            x + line_w - 1, self.char_height - 1], fill=0)
+        self._paper.append(row)
+
+    def _feed(self, rows):
+        if rows:
+            self._paper.append(Image.new('1', (self.width, rows), 1))
+
+    def _bitmap_row(self, data):
+        # Printer bits are set for black, PIL's for white.
+        data = bytes(bytearray(b ^ 0xFF for b in data))
+        self._paper.append(Image.frombytes('1', (len(data) * 8, 1), data))
+
+    def _barcode(self, text):
+        self._flush_line()
+        bars = Image.new('1', (self.width, self.barcode_height + 40), 1)
+        draw = ImageDraw.Draw(bars)
+        x = 16
+        for c in bytearray(text):
+            for bit in range(8):
+                if c & (0x80 >> bit):
+                    draw.rectangle([x, 0, x + 2, self.barcode_height - 1], fill=0)
+                x += 3
+        draw.text((16, self.barcode_height + 8), text.decode('latin-1'),
+                  fill=0, font=ImageFont.load_default())
+        self._paper.append(bars)
+
+
+# AdafruitThermal API on top of a PrinterEmulator rather than a serial
+# port.  Pacing runs off the emulator's clock, so with a VirtualClock
+# a long print job completes as fast as the host can generate it.
+class EmulatedThermal(ThermalCommands):
+
+    def __init__(self, emulator=None, **kwargs):
+        if emulator is None:
+            emulator = PrinterEmulator()
+        self.emulator    = emulator
+        self.byte_time   = emulator.byte_time
+        self.no_printing = kwargs.pop('no_printing', False)
+        self._setup(kwargs.pop('heattime', self.default_heat_time))
+
+    def now(self):
+        return self.emulator.clock()
+
+    def timeout_set(self, x):
+        self.resume_time = self.emulator.clock() + x
+
+    def timeout_wait(self):
+        remaining = self.resume_time - self.emulator.clock()
+        if remaining > self.wake_margin:
+            self.emulator.sleep(remaining - self.wake_margin)
+
+    def _send(self, data):
+        self.emulator.write(data)
+
+    def read(self, size=1):
+        return self.emulator.read(size)
@@ -0,0 +1,98 @@
+#*************************************************************************
+# Image preparation for the Adafruit Thermal Printer.
+#
+# Turns arbitrary pictures (mail attachments, web uploads) into 1-bit
+# images print_image() can send as-is: scaled to the print width,
+# converted to grayscale and thresholded.  All per-image statistics are
+# computed once, from the 256-bin histogram, and the threshold is
+# applied through a single 256-entry lookup table.
+#
+# JPEG files are decoded straight to grayscale and, using the decoder's
+# DCT scaling, to no more than twice the size needed (see load_image),
+# which is much faster and leaner than decoding a phone photo in full.
+#*************************************************************************
+
+from __future__ import print_function
+from PIL import Image, ImageOps
+from AdafruitThermal import pack_image
+import ThermalDither
+import io
+
+PRINT_WIDTH = 384
+
+
+# Scale an image to 'width' dots (keeping its aspect ratio), convert it
+# to grayscale and threshold it at 'factor' times its median brightness,
+# or dither it by one of the ThermalDither methods.  Conversion happens
+# first so the resize only deals with one channel.  Images that would
+# come out longer than 'max_height' dots are made narrower instead.
+def prepare_image(image, width=PRINT_WIDTH, factor=1.1, max_height=None, dither='median'):
+    gray = image.convert('L')
+    size = fit_size(gray.size, width, max_height)
+    if gray.size != size:
+        gray = gray.resize(size)
+    if dither != 'median':
+        return ThermalDither.dither(gray, dither)
+    return gray.point(threshold_table(median(gray) * factor), '1')
+
+
+# Size of an image scaled to 'width', or to 'max_height' if it would be
+# taller than that, keeping its aspect ratio.
+def fit_size(size, width=PRINT_WIDTH, max_height=None):
+    scale = width / float(size[0])
+    if max_height and size[1] * scale > max_height:
+        scale = max_height / float(size[1])
+    return (max(int(size[0] * scale + 0.5), 1),
+            max(int(size[1] * scale + 0.5), 1))
+
+
+# Open an image file for prepare_image(), turned upright according to its
+# EXIF orientation.  JPEGs are decoded in grayscale at the smallest DCT
+# scale (1/2, 1/4 or 1/8) still at least as large as the printed image.
+def load_image(fp, width=PRINT_WIDTH, max_height=None):
+    image = Image.open(fp)
+    if image.format == 'JPEG':
+        # Orientations 5 to 8 swap width and height
+        transposed = image.getexif().get(0x0112, 1) in (5, 6, 7, 8)
+        size = image.size[::-1] if transposed else image.size
+        target = fit_size(size, width, max_height)
+        if transposed:
+            target = target[::-1]
+        image.draft('L', target)
+    return ImageOps.exif_transpose(image)
+
+
+# Median brightness of a grayscale image, from its histogram.  Same
+# result as numpy.median() over the pixels: for an even pixel count
+# the two middle values are averaged.
+def median(gray):
+    histogram = gray.histogram()
+    count     = sum(histogram)
+    lower     = (count - 1) // 2
+    upper     = count // 2
+    seen      = 0
+    low_value = None
+    for value, n in enumerate(histogram):
+        seen += n
+        if low_value is None and seen > lower:
+            low_value = value
+        if seen > upper:
+            return (low_value + value) / 2.0
+    return 0.0
+
+
+# Lookup table for Image.point(): black below 'level', white from it up.
+def threshold_table(level):
+    return [0 if x < level else 255 for x in range(256)]
+
+
+# Decode an image file, given as its data or its name, and return it
+# ready for print_bitmap(): (width, height, packed bitmap).  Takes and
+# returns plain values so it can run in a worker process (see
+# MailReceiver in MailWatcher.py).
+def pack_attachment(source, width=PRINT_WIDTH, max_height=None, dither='median'):
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    image = load_image(source, width, max_height)
+    image = prepare_image(image, width, max_height=max_height, dither=dither)
+    return image.size[0], image.size[1], pack_image(image)
@@ -0,0 +1,137 @@
+#*************************************************************************
+# Self-calibration of the AdafruitThermal timing model.
+#
+# Output is paced with dot_print_time and dot_feed_time, the seconds
+# the printer takes to print or feed one dot row.  The defaults are
+# conservative values from one test unit: too slow for some printers,
+# too fast for others.  calibrate() measures them on the printer at
+# hand.  It sends bursts of bitmap rows and of paper feeds, each small
+# enough for the printer's receive buffer, and follows each burst
+# with a status query (ESC v).  The printer answers the query only once
+# it has worked through everything before it, so the reply arrives
+# when the burst is done.  A straight line fitted through bursts of
+# different sizes gives the time per row; the fixed transfer and reply
+# latency ends up in the intercept.  This needs the printer's TX line
+# to be connected.
+#
+# TimingStore keeps the results per serial port in a JSON file, from
+# which AdafruitThermal picks them up on start-up (timing_file).
+#*************************************************************************
+
+from __future__ import print_function
+import json
+import os
+import time
+
+
+class CalibrationError(Exception):
+    pass
+
+
+# Bursts measured by calibrate(): dot rows of bitmap printed, dot rows
+# of paper fed.  The bitmap rows are row_bytes wide and solid black.
+PRINT_BURSTS = (30, 60, 90)
+FEED_BURSTS  = (100, 300, 500)
+
+# Applied to the measured times, so that a unit running a little slower
+# than it did during calibration (colder, weaker supply) still doesn't
+# overrun its receive buffer.
+MARGIN = 1.1
+
+
+# Wait until the printer has finished everything sent to it, by
+# asking for its status; returns when the reply arrived.
+def wait_idle(printer):
+    reset = getattr(printer, 'reset_input_buffer', None)
+    if reset is not None:
+        reset()
+    printer._send(bytearray((27, 118, 0)))
+    if not printer.read(1):
+        raise CalibrationError('no status reply from the printer '
+                               '(is its TX line connected?)')
+    return printer.now()
+
+
+# Seconds the printer takes for one burst, from its first byte being
+# sent to the status reply.  Sent as is, without the library's pacing.
+def measure(printer, print_rows=0, feed_rows=0, row_bytes=4):
+    printer.timeout_wait()
+    wait_idle(printer)
+    data = bytearray()
+    while print_rows > 0:
+        rows = min(print_rows, 255)
+        data += bytearray((18, 42, rows, row_bytes))
+        data += b'\xff' * (rows * row_bytes)
+        printer.paper_rows += rows
+        print_rows -= rows
+    while feed_rows > 0:
+        rows = min(feed_rows, 255)
+        data += bytearray((27, 74, rows))
+        printer.paper_rows += rows
+        feed_rows -= rows
+    start = printer.now()
+    printer._send(data)
+    return wait_idle(printer) - start
+
+
+# Least squares slope of y over x
+def slope(points):
+    n  = float(len(points))
+    mx = sum(x for x, y in points) / n
+    my = sum(y for x, y in points) / n
+    sxx = sum((x - mx) ** 2 for x, y in points)
+    if not sxx:
+        raise CalibrationError('need bursts of at least two sizes')
+    return sum((x - mx) * (y - my) for x, y in points) / sxx
+
+
+# Measure the printer and return its dot_print_time and dot_feed_time
+# (without MARGIN) in a dict.  Prints a few centimetres of black bars.
+def calibrate(printer, repeat=2, print_bursts=PRINT_BURSTS, feed_bursts=FEED_BURSTS):
+    printed = [(rows, measure(printer, print_rows=rows))
+               for i in range(repeat) for rows in print_bursts]
+    fed     = [(rows, measure(printer, feed_rows=rows))
+               for i in range(repeat) for rows in feed_bursts]
+    times = {'dot_print_time': slope(printed),
+             'dot_feed_time':  slope(fed)}
+    for name, value in times.items():
+        if value <= 0:
+            raise CalibrationError('implausible {0}: {1}'.format(name, value))
+    # Back to the state the library assumes after a bitmap
+    printer.prev_byte = '\n'
+    return times
+
+
+# Set a printer's timing from calibrated values
+def apply(printer, times, margin=MARGIN):
+    printer.dot_print_time = times['dot_print_time'] * margin
+    printer.dot_feed_time  = times['dot_feed_time'] * margin
+
+
+# Calibrated times per serial port, in a JSON file
+class TimingStore(object):
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as fp:
+                return json.load(fp)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    # The times stored for port, None if it has not been calibrated
+    def get(self, port):
+        return self.load().get(port)
+
+    def put(self, port, times):
+        entries = self.load()
+        entries[port] = dict(times, calibrated=time.time())
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(entries, fp, indent=2, sort_keys=True)
+        os.rename(tmp_path, self.path)
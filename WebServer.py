@@ -0,0 +1,259 @@
+#!/usr/bin/python3
+#
+# The web interface of thpr.py: a status page, the action URLs for
+# IFTTT and a JSON API to queue jobs and follow them.  All requests
+# only submit to the print queue, served by waitress (or from an asyncio
+# loop by serve_async()).
+
+import asyncio
+import hmac
+import http.client
+import io
+import math
+import sys
+import tempfile
+import urllib.parse
+import wsgiref.handlers
+from flask import Flask, render_template, request, jsonify, abort, url_for
+import waitress
+import ThermalDither
+from PrintQueue import QueueFull
+
+webapp = Flask(__name__)
+
+
+    
+@webapp.route("/")
+def main():
+    # For each pin, read the pin state and store it in the pins dictionary:
+    #for pin in pins:
+    #    pins[pin]['state'] = GPIO.input(pin)
+    # Put the pin dictionary into the template data dictionary:
+    #templateData = {'pins': pins}
+    # Pass the template data into the template main.html and
+    # return it to the user
+    return render_template('main.html', queue=webapp.config['QUEUE'].stats())#, **templateData)
+
+@webapp.route("/<secret_key>/<action>/<param>")
+def action(secret_key, action, param):
+    """Executed when someone requests a URL with secret_key, action and param"""
+    templateData, status = handle_action(secret_key, action, param)
+    return render_template('main.html', **templateData), status
+
+
+def handle_action(secret_key, action, param):
+    """Carry out an action requested over HTTP
+
+    Returns the template data and the HTTP status code.
+    """
+    status = 200
+    if valid_key(secret_key):
+        # key is correct, so continue
+        if action == 'print':
+            try:
+                webapp.config['QUEUE'].submit('text', {'text': param})
+            except QueueFull:
+                status = 429
+         
+    # Along with the pin dictionary, put the message into the template data dictionary:
+    templateData = {
+        'action' : action,
+        'param' : param,
+        'queue' : webapp.config['QUEUE'].stats()
+    }
+    if status == 429:
+        templateData['message'] = 'The print queue is full, try again later'
+    return templateData, status
+
+
+def valid_key(secret_key):
+    """Compare a secret key from a URL with the configured one
+
+    hmac.compare_digest() takes the same time wherever the keys differ,
+    so response times do not give the key away.
+    """
+    return hmac.compare_digest(secret_key.encode('utf-8'),
+                               webapp.config['API']['secret_key'].encode('utf-8'))
+
+
+def queue_full(error):
+    response = jsonify({'error': str(error)})
+    response.status_code = 429
+    # By then the queue will have drained
+    response.headers['Retry-After'] = str(max(int(math.ceil(webapp.config['QUEUE'].eta())), 1))
+    return response
+
+
+@webapp.route("/api/<secret_key>/print/<kind>", methods=['POST'])
+def submit_job(secret_key, kind):
+    """Queue text, an image or ESC/POS data, answer 202 with the job's status
+
+    Text is the 'text' value of a JSON object or form, or else the whole
+    body.  Images and raw data are the body or a 'file' upload; they are
+    spooled to disk as they arrive, and the request is refused with 429
+    once the print queue's byte budget is used up.  Nothing waits for
+    the printer.
+    """
+    if not valid_key(secret_key):
+        abort(403)
+    if kind not in ('text', 'image', 'raw'):
+        abort(404)
+    queue = webapp.config['QUEUE']
+    if (queue.max_bytes is not None and request.content_length is not None and
+            queue.pending_bytes + request.content_length > queue.max_bytes):
+        return queue_full(QueueFull('print queue is full'))
+    try:
+        if kind == 'text':
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                data = request.form
+            text = data.get('text')
+            if text is None:
+                text = request.get_data(as_text=True)
+            job_id = queue.submit('text', {'text': text})
+        else:
+            upload = request.files.get('file')
+            stream = upload.stream if upload else request.stream
+            if kind == 'image':
+                dither = request.args.get('dither', 'median')
+                if dither != 'median' and dither not in ThermalDither.METHODS:
+                    abort(400)
+                params = {'dither': dither,
+                          'max_height': webapp.config['MAX_IMAGE_HEIGHT']}
+                job_id = queue.submit('image', params, files={'image': stream})
+            else:
+                job_id = queue.submit('raw', files={'data': stream})
+    except QueueFull as e:
+        return queue_full(e)
+    response = jsonify(queue.status(job_id))
+    response.status_code = 202
+    response.headers['Location'] = url_for('job_status', secret_key=secret_key, job_id=job_id)
+    return response
+
+
+@webapp.route("/api/<secret_key>/queue")
+def queue_status(secret_key):
+    """Report the number of queued jobs, their size and when the printer is free"""
+    if not valid_key(secret_key):
+        abort(403)
+    return jsonify(webapp.config['QUEUE'].stats())
+
+
+@webapp.route("/api/<secret_key>/jobs/<job_id>", methods=['GET', 'DELETE'])
+def job_status(secret_key, job_id):
+    """Report a job's status; DELETE cancels it unless it is printing"""
+    if not valid_key(secret_key):
+        abort(403)
+    queue = webapp.config['QUEUE']
+    if request.method == 'DELETE':
+        cancelled = queue.cancel(job_id)
+        if cancelled is None:
+            abort(404)
+        return jsonify(queue.status(job_id)), 200 if cancelled else 409
+    status = queue.status(job_id)
+    if status is None:
+        abort(404)
+    return jsonify(status)
+
+
+def configure(queue, api, max_image_height=1600):
+    """Point the web app at queue, a PrintQueue, and api, the [api]
+    section of thpr.conf
+
+    Uploaded images are cut off at max_image_height rows, the same
+    limit as mail attachments ([EMail] max_image_height).
+    """
+    webapp.config['QUEUE'] = queue
+    webapp.config['API'] = api
+    webapp.config['MAX_IMAGE_HEIGHT'] = max_image_height
+    webapp.config['MAX_CONTENT_LENGTH'] = api.getint('max_upload', fallback=8 << 20)
+
+
+def web_server(queue, api, port=80, max_image_height=1600):
+    """The web app in waitress, a production WSGI server
+
+    Requests only spool their job, so a handful of worker threads is
+    enough.  Call run() on the result to serve, close() to stop.
+    """
+    configure(queue, api, max_image_height)
+    return waitress.create_server(webapp, host='0.0.0.0', port=port, threads=4)
+
+
+async def serve_async(queue, api, port=80, host='0.0.0.0', max_image_height=1600):
+    """Serve the web app from the running asyncio loop until cancelled
+
+    Connections are read and written by the loop, so many slow clients
+    cost no threads; only the app itself, which spools to disk, runs in
+    the loop's default executor once a request is complete.  Bodies
+    beyond 64 KiB are spooled to a temporary file as they arrive.  Each
+    connection serves one request (HTTP/1.0), which is all IFTTT and the
+    API clients need.
+    """
+    configure(queue, api, max_image_height)
+    server = await asyncio.start_server(serve_connection, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+async def serve_connection(reader, writer):
+    """Read one HTTP request, answer it from the web app, close"""
+    loop = asyncio.get_running_loop()
+    body = tempfile.SpooledTemporaryFile(64 * 1024)
+    try:
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+            request_line, _, header_block = head.partition(b'\r\n')
+            method, target, version = request_line.decode('latin-1').split()
+            headers = http.client.parse_headers(io.BytesIO(header_block))
+            length = int(headers.get('Content-Length', 0))
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return
+        except (ValueError, http.client.HTTPException):
+            writer.write(b'HTTP/1.0 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+            return
+        if 'chunked' in headers.get('Transfer-Encoding', '').lower():
+            writer.write(b'HTTP/1.0 411 Length Required\r\nContent-Length: 0\r\n\r\n')
+            return
+        if length > webapp.config['MAX_CONTENT_LENGTH']:
+            writer.write(b'HTTP/1.0 413 Payload Too Large\r\nContent-Length: 0\r\n\r\n')
+            return
+        remaining = length
+        while remaining:
+            data = await reader.read(min(remaining, 64 * 1024))
+            if not data:
+                return
+            body.write(data)
+            remaining -= len(data)
+        body.seek(0)
+
+        path, _, query = target.partition('?')
+        peer = writer.get_extra_info('peername') or ('', 0)
+        sockname = writer.get_extra_info('sockname') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': urllib.parse.unquote(path, 'latin-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': str(sockname[0]),
+            'SERVER_PORT': str(sockname[1]),
+            'SERVER_PROTOCOL': version,
+            'REMOTE_ADDR': str(peer[0]),
+            'CONTENT_LENGTH': str(length),
+        }
+        for name, value in headers.items():
+            key = name.upper().replace('-', '_')
+            if key == 'CONTENT_TYPE':
+                environ[key] = value
+            elif key != 'CONTENT_LENGTH':
+                environ.setdefault('HTTP_' + key, value)
+        response = io.BytesIO()
+        handler = wsgiref.handlers.SimpleHandler(body, response, sys.stderr, environ,
+                                                 multithread=True, multiprocess=False)
+        await loop.run_in_executor(None, handler.run, webapp)
+        writer.write(response.getvalue())
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        body.close()
+        writer.close()
@@ -0,0 +1,5 @@
+# Benchmarks for the AdafruitThermal library.  These run without
+# printer hardware: 'python -m benchmarks' runs the print path suite
+# (see suite.py) and reports JSON; pacing.py compares CPU usage of the
+# printer pacing strategies and decode.py full against draft-mode
+# decoding of large JPEG attachments.
@@ -0,0 +1,29 @@
+"""Run the print path benchmarks and write the results as JSON
+
+Usage:
+benchmarks [--repeat=<n>] [--output=<file>] [<case>...]
+benchmarks (-h | --help)
+
+Options:
+-h --help           Show this help (run as: python -m benchmarks)
+--repeat=<n>        Host timing runs per case, best is kept [default: 3]
+--output=<file>     Write the JSON report to a file instead of stdout
+
+Cases: text, qrcode, hello, photo, barcode, mail_threshold, dither_atkinson,
+       dither_stucki, dither_bayer (default: all)
+"""
+
+from __future__ import print_function
+import json
+from docopt import docopt
+from benchmarks.suite import run
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    report = run(arguments['<case>'], int(arguments['--repeat']))
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if arguments['--output']:
+        with open(arguments['--output'], 'w') as fp:
+            fp.write(output + '\n')
+    else:
+        print(output)
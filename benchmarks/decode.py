@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Compare full and draft-mode decoding of a large JPEG attachment
+
+Writes a synthetic photo of the given size as JPEG and turns it into a
+printable bitmap twice: by decoding it in full and resizing (as mail
+attachments used to be handled) and with ThermalImage.load_image(),
+which lets the JPEG decoder scale it down.  Each run happens in a fresh
+process, so its peak RSS can be reported alongside the decode time.
+
+Usage:
+decode.py [--size=<w>x<h>] [--repeat=<n>]
+decode.py (-h | --help)
+
+Options:
+-h --help        Show this help
+--size=<w>x<h>   Size of the test photo [default: 4000x3000]
+--repeat=<n>     Conversions per run, the fastest is reported [default: 3]
+"""
+
+from __future__ import print_function
+import os
+import sys
+if not __package__:
+    # Run as benchmarks/decode.py: the library lives one directory up
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import io
+import multiprocessing
+import resource
+import time
+from docopt import docopt
+from PIL import Image
+from ThermalImage import load_image, prepare_image
+
+
+def photo_jpeg(width, height):
+    # Noise scaled up gives smooth but incompressible detail, like a photo
+    image = Image.effect_noise((width // 10, height // 10), 60).convert('RGB')
+    image = image.resize((width, height), Image.BICUBIC)
+    data = io.BytesIO()
+    image.save(data, 'JPEG', quality=90)
+    return data.getvalue()
+
+
+def full(data):
+    return prepare_image(Image.open(io.BytesIO(data)))
+
+
+def draft(data):
+    return prepare_image(load_image(io.BytesIO(data)))
+
+
+def measure(name, data, repeat):
+    """Run in a child process: fastest conversion time and peak RSS"""
+    convert = {'full': full, 'draft': draft}[name]
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        convert(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kB on Linux
+    return best, base / 1024.0, peak / 1024.0
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    width, height = [int(x) for x in arguments['--size'].split('x')]
+    repeat = int(arguments['--repeat'])
+    data = photo_jpeg(width, height)
+    print('{0}x{1} JPEG, {2} kB'.format(width, height, len(data) // 1024))
+    context = multiprocessing.get_context('spawn')
+    for name in ('full', 'draft'):
+        with context.Pool(1) as pool:
+            best, base, peak = pool.apply(measure, (name, data, repeat))
+        print('{0:>6}: {1:7.3f}s, peak RSS {2:6.1f} MB ({3:+6.1f} MB)'
+              .format(name, best, peak, peak - base))
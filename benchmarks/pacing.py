@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""Compare host CPU usage of busy-wait and sleep-based printer pacing
+
+Prints the same long text once with the original spinning timeout_wait()
+and once with the current sleep-based one, against a port that discards
+all output, and reports CPU time against wall time for each.  Wall time
+is dominated by the (simulated) paper motion, so it should be about the
+same for both runs; CPU time is what differs.
+
+Usage:
+pacing.py [--lines=<n>]
+pacing.py (-h | --help)
+
+Options:
+-h --help       Show this help
+--lines=<n>     Number of 32-column text lines to print [default: 20]
+"""
+
+from __future__ import print_function
+import os
+import sys
+if not __package__:
+    # Run as benchmarks/pacing.py: the library lives one directory up
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import time
+from docopt import docopt
+from AdafruitThermal import AdafruitThermal, clock
+
+
+class NullThermal(AdafruitThermal):
+    """AdafruitThermal that paces as usual but never opens a port"""
+
+    def __init__(self):
+        AdafruitThermal.__init__(self, None, 19200)
+
+    def _send(self, data):
+        pass
+
+
+class SpinningThermal(NullThermal):
+    """NullThermal using the original busy-wait timeout_wait()"""
+
+    def timeout_wait(self):
+        while (clock() - self.resume_time) < 0: pass
+
+
+def measure(printer, lines):
+    text = 'x' * printer.max_column
+    printer.timeout_wait()
+    cpu_start  = time.process_time()
+    wall_start = clock()
+    for i in range(lines):
+        printer.print_line(text)
+    printer.timeout_wait()
+    cpu  = time.process_time() - cpu_start
+    wall = clock() - wall_start
+    return cpu, wall
+
+
+if __name__ == '__main__':
+    arguments = docopt(__doc__)
+    lines = int(arguments['--lines'])
+    for name, cls in (('spin', SpinningThermal), ('sleep', NullThermal)):
+        cpu, wall = measure(cls(), lines)
+        print('{0:>6}: {1:7.3f}s CPU / {2:7.3f}s wall ({3:5.1f}% of a core)'
+              .format(name, cpu, wall, 100.0 * cpu / wall))
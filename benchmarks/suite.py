@@ -0,0 +1,138 @@
+"""Benchmark cases for the text, bitmap, image and barcode print paths
+
+Each case drives a CountingThermal, which keeps the library's pacing
+arithmetic but runs it against a virtual clock and a port that only
+counts what it is given, so host CPU and wall time reflect the work done
+on the host alone.  The same case is then replayed once against the
+printer emulator for the physical side: estimated paper time and
+receive buffer overruns.
+"""
+
+from __future__ import print_function
+import os
+import platform
+import time
+import warnings
+from PIL import Image
+from AdafruitThermal import ThermalCommands, clock
+from ThermalEmulator import PrinterEmulator, EmulatedThermal, VirtualClock
+from ThermalImage import prepare_image
+from gfx import adaqrcode
+
+GFX_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'gfx')
+
+
+class CountingThermal(ThermalCommands):
+    """Printer that counts writes and bytes instead of sending them"""
+
+    def __init__(self, baudrate=19200):
+        self.byte_time = 11.0 / float(baudrate)
+        self.clock = VirtualClock()
+        self.writes = 0
+        self.bytes_sent = 0
+        self._setup()
+        self.writes = 0
+        self.bytes_sent = 0
+
+    def timeout_set(self, x):
+        self.resume_time = self.clock() + x
+
+    def timeout_wait(self):
+        self.clock.sleep(self.resume_time - self.clock())
+
+    def _send(self, data):
+        self.writes += 1
+        self.bytes_sent += len(data)
+
+
+def photo():
+    """Full-width grayscale test photo: gradient plus noise"""
+    gradient = Image.linear_gradient('L').resize((384, 1000))
+    noise = Image.effect_noise((384, 1000), 64)
+    return Image.blend(gradient, noise, 0.3)
+
+
+def case_text(printer):
+    text = ('The quick brown fox jumps over the lazy dog. ' * 45)[:2000]
+    printer.print_line(text)
+
+def case_qrcode(printer):
+    printer.print_bitmap(adaqrcode.width, adaqrcode.height, adaqrcode.data)
+
+def case_hello(printer):
+    printer.print_image(Image.open(os.path.join(GFX_DIR, 'hello.png')), True)
+
+def case_photo(printer):
+    printer.print_image(photo())
+
+def case_barcode(printer):
+    printer.print_barcode('123456789012', printer.UPC_A)
+
+def case_mail_threshold(printer):
+    printer.print_image(prepare_image(photo()), True)
+
+def case_dither_atkinson(printer):
+    printer.print_image(photo(), True, dither='atkinson')
+
+def case_dither_stucki(printer):
+    printer.print_image(photo(), True, dither='stucki')
+
+def case_dither_bayer(printer):
+    printer.print_image(photo(), True, dither='bayer')
+
+
+CASES = [
+    ('text', case_text),
+    ('qrcode', case_qrcode),
+    ('hello', case_hello),
+    ('photo', case_photo),
+    ('barcode', case_barcode),
+    ('mail_threshold', case_mail_threshold),
+    ('dither_atkinson', case_dither_atkinson),
+    ('dither_stucki', case_dither_stucki),
+    ('dither_bayer', case_dither_bayer),
+]
+
+
+def run_case(function, repeat=3):
+    """Best-of-repeat host timings plus one emulated run"""
+    result = {}
+    for i in range(repeat):
+        printer = CountingThermal()
+        cpu_start = time.process_time()
+        wall_start = clock()
+        function(printer)
+        cpu = time.process_time() - cpu_start
+        wall = clock() - wall_start
+        if i == 0 or wall < result['wall_seconds']:
+            result.update(cpu_seconds=cpu, wall_seconds=wall)
+    result['writes'] = printer.writes
+    result['bytes'] = printer.bytes_sent
+    result['host_bytes_per_second'] = printer.bytes_sent / max(result['wall_seconds'], 1e-9)
+    result['line_bytes_per_second'] = 1.0 / printer.byte_time
+
+    emulator = PrinterEmulator(clock=VirtualClock())
+    emulated = EmulatedThermal(emulator)
+    start = emulator.clock()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        function(emulated)
+    result['paper_seconds'] = emulator.finish_time() - start
+    result['overruns'] = emulator.overruns
+    return result
+
+
+def run(names=None, repeat=3):
+    """Run the selected cases (all by default) and return a report"""
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cases': {},
+    }
+    for name, function in CASES:
+        if names and name not in names:
+            continue
+        report['cases'][name] = run_case(function, repeat)
+    return report
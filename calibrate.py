@@ -19,11 +19,39 @@
 # You may need to pull on the paper as it reaches the jamming point,
 # and/or just abort the program, press the feed button and take the
 # last good number.
+#
+# With --auto, the printer's print and feed speed is measured instead
+# (see ThermalTiming.py) and stored for its port in the timing file,
+# from where AdafruitThermal(..., timing_file=...) applies it:
+#
+#   calibrate.py --auto [port [timing file]]
 
 from __future__ import print_function
+import sys
 from AdafruitThermal import *
+import ThermalTiming
+
+PORT        = "/dev/cu.usbserial-AH02DXOC"
+TIMING_FILE = "/var/lib/thpr/timing.json"
+
+args = sys.argv[1:]
+auto = '--auto' in args
+if auto:
+    args.remove('--auto')
+port        = args[0] if len(args) > 0 else PORT
+timing_file = args[1] if len(args) > 1 else TIMING_FILE
+
+printer = AdafruitThermal(port, 9600, timeout=5)
 
-printer = AdafruitThermal("/dev/cu.usbserial-AH02DXOC", 9600, timeout=5)
+if auto:
+    print('Measuring print and feed times...')
+    times = ThermalTiming.calibrate(printer)
+    print('dot_print_time {0:.6f} s, dot_feed_time {1:.6f} s'.format(
+        times['dot_print_time'], times['dot_feed_time']))
+    ThermalTiming.TimingStore(timing_file).put(port, times)
+    print('Stored in {0}'.format(timing_file))
+    printer.feed(4)
+    sys.exit(0)
 
 for i in range(0,256,15):
     print('Heat parameter is currently on {0}'.format(i))
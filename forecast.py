@@ -13,61 +13,12 @@
 # http://www.adafruit.com/products/597 Mini Thermal Receipt Printer
 # http://www.adafruit.com/products/600 Printer starter pack
 
-from __future__ import print_function
-import urllib, time
-from Adafruit_Thermal import *
-from xml.dom.minidom import parseString
-
-# WOEID indicates the geographic location for the forecast.  It is
-# not a ZIP code or other common indicator.  Instead, it can be found
-# by 'manually' visiting http://weather.yahoo.com, entering a location
-# and requesting a forecast, then copy the number from the end of the
-# current URL string and paste it here.
-WOEID = '2459115'
-
-# Dumps one forecast line to the printer
-def forecast(idx):
-	tag     = 'yweather:forecast'
-	day     = dom.getElementsByTagName(tag)[idx].getAttribute('day')
-	lo      = dom.getElementsByTagName(tag)[idx].getAttribute('low')
-	hi      = dom.getElementsByTagName(tag)[idx].getAttribute('high')
-	cond    = dom.getElementsByTagName(tag)[idx].getAttribute('text')
-	printer.print(day + ': low ' + lo )
-	printer.print(deg)
-	printer.print(' high ' + hi)
-	printer.print(deg)
-	printer.print_line(' ' + cond)
-
-printer = Adafruit_Thermal("/dev/cu.usbserial-AH02DXOC", 19200, timeout=5)
-deg     = chr(0xf8) # Degree symbol on thermal printer
+# The job itself is jobs/forecast.py, which thpr.py runs in-process;
+# this script prints it once on its own.
 
-# Fetch forecast data from Yahoo!, parse resulting XML
-dom = parseString(urllib.urlopen(
-        'http://weather.yahooapis.com/forecastrss?w=' + WOEID).read())
-
-# Print heading
-printer.inverse_on()
-printer.print('{:^32}'.format(
-  dom.getElementsByTagName('description')[0].firstChild.data))
-printer.inverse_off()
-
-# Print current conditions
-printer.bold_on()
-printer.print('{:^32}'.format('Current conditions:'))
-printer.bold_off()
-printer.print('{:^32}'.format(
-  dom.getElementsByTagName('pubDate')[0].firstChild.data))
-temp = dom.getElementsByTagName('yweather:condition')[0].getAttribute('temp')
-cond = dom.getElementsByTagName('yweather:condition')[0].getAttribute('text')
-printer.print(temp)
-printer.print(deg)
-printer.print_line(' ' + cond)
-printer.bold_on()
-
-# Print forecast
-printer.print('{:^32}'.format('Forecast:'))
-printer.bold_off()
-forecast(0)
-forecast(1)
+from __future__ import print_function
+from AdafruitThermal import *
+import jobs
 
-printer.feed(3)
+printer = AdafruitThermal("/dev/cu.usbserial-AH02DXOC", 19200, timeout=5)
+jobs.run('forecast', printer)
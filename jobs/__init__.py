@@ -0,0 +1,49 @@
+# Print jobs that run inside the long-lived thpr.py process.
+#
+# Each job is a module in this package with a main(printer, ...)
+# function, which prints onto the printer it is given (already open and
+# initialised) and may return a result.  Modules are imported on first
+# use, or all at once by preload(), and stay loaded, so anything they
+# set up at import time (glyph sheets and the like) is reused by every
+# later run.  The old top-level scripts (timetemp.py etc.) are now thin
+# wrappers that open a printer and call the same main().
+
+from __future__ import print_function
+import importlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Job name -> module
+JOBS = {
+    'timetemp': 'jobs.timetemp',
+    'forecast': 'jobs.forecast',
+    'sudoku':   'jobs.sudoku',
+    'twitter':  'jobs.twitter',
+}
+
+
+def register(name, module):
+    """Make the job in 'module' (a module name) available as 'name'"""
+    JOBS[name] = module
+
+
+def get(name):
+    """The main() function of a job"""
+    if name not in JOBS:
+        raise ValueError('Unknown job: {0}'.format(name))
+    return importlib.import_module(JOBS[name]).main
+
+
+def run(name, printer, **kwargs):
+    """Run a job on printer and return its result"""
+    return get(name)(printer, **kwargs)
+
+
+def preload():
+    """Import all jobs now rather than on their first run"""
+    for name in sorted(JOBS):
+        try:
+            get(name)
+        except Exception as e:
+            logger.warning('Could not load job {0}: {1}'.format(name, e))
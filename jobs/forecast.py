@@ -0,0 +1,65 @@
+# Weather forecast for the Adafruit Mini Thermal Printer.  Retrieves
+# data from Yahoo! weather, prints current conditions and forecasts for
+# next two days.  See timetemp.py for a different weather example using
+# nice bitmaps.
+# Written by Adafruit Industries.  MIT license.
+
+from __future__ import print_function
+from urllib.request import urlopen
+from xml.dom.minidom import parseString
+
+# WOEID indicates the geographic location for the forecast.  It is
+# not a ZIP code or other common indicator.  Instead, it can be found
+# by 'manually' visiting http://weather.yahoo.com, entering a location
+# and requesting a forecast, then copy the number from the end of the
+# current URL string and paste it here.
+WOEID = '2459115'
+
+deg = chr(0xf8) # Degree symbol on thermal printer
+
+
+# Dumps one forecast line to the printer
+def forecast(printer, dom, idx):
+    tag  = dom.getElementsByTagName('yweather:forecast')[idx]
+    day  = tag.getAttribute('day')
+    lo   = tag.getAttribute('low')
+    hi   = tag.getAttribute('high')
+    cond = tag.getAttribute('text')
+    printer.print(day + ': low ' + lo)
+    printer.print(deg)
+    printer.print(' high ' + hi)
+    printer.print(deg)
+    printer.print_line(' ' + cond)
+
+
+def main(printer):
+    # Fetch forecast data from Yahoo!, parse resulting XML
+    dom = parseString(urlopen(
+            'http://weather.yahooapis.com/forecastrss?w=' + WOEID).read())
+
+    # Print heading
+    printer.inverse_on()
+    printer.print('{:^32}'.format(
+      dom.getElementsByTagName('description')[0].firstChild.data))
+    printer.inverse_off()
+
+    # Print current conditions
+    printer.bold_on()
+    printer.print('{:^32}'.format('Current conditions:'))
+    printer.bold_off()
+    printer.print('{:^32}'.format(
+      dom.getElementsByTagName('pubDate')[0].firstChild.data))
+    temp = dom.getElementsByTagName('yweather:condition')[0].getAttribute('temp')
+    cond = dom.getElementsByTagName('yweather:condition')[0].getAttribute('text')
+    printer.print(temp)
+    printer.print(deg)
+    printer.print_line(' ' + cond)
+    printer.bold_on()
+
+    # Print forecast
+    printer.print('{:^32}'.format('Forecast:'))
+    printer.bold_off()
+    forecast(printer, dom, 0)
+    forecast(printer, dom, 1)
+
+    printer.feed(3)
@@ -0,0 +1,166 @@
+# Current time and temperature display for the Adafruit Mini Thermal
+# Printer.  Retrieves data from Yahoo! weather, prints current
+# conditions and time using large, friendly graphics.
+# See forecast.py for a different weather example that's all text-based.
+# Written by Adafruit Industries.  MIT license.
+
+from __future__ import print_function
+import os
+import time
+from urllib.request import urlopen
+from xml.dom.minidom import parseString
+from PIL import Image, ImageDraw
+
+# WOEID indicates the geographic location for the forecast.  It is
+# not a ZIP code or other common indicator.  Instead, it can be found
+# by 'manually' visiting http://weather.yahoo.com, entering a location
+# and requesting a forecast, then copy the number from the end of the
+# current URL string and paste it here.
+WOEID = '2459115'
+
+GFX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gfx')
+
+# Although the Python Imaging Library does have nice font support,
+# I opted here to use a raster bitmap for all of the glyphs instead.
+# This allowed lots of control over kerning and such, and I didn't
+# want to spend a lot of time hunting down a suitable font with a
+# permissive license.  The glyphs are cut out once, on import.
+symbols = Image.open(os.path.join(GFX_DIR, 'timetemp.png'))  # Bitmap w/all chars & symbols
+symbols.load()
+
+# These are the widths of certain glyphs within the 'symbols' bitmap
+TimeDigitWidth = [  38,  29,  38,  36,  40,  35,  37,  37, 38, 37, 13 ]
+TempDigitWidth = [  33,  25,  32,  31,  35,  30,  32,  32, 33, 32, 17, 14 ]
+DateDigitWidth = [  16,  13,  16,  15,  17,  15,  16,  16, 16, 16 ]
+HumiDigitWidth = [  14,  10,  14,  13,  15,  12,  13,  13, 13, 13, 18 ]
+DayWidth       = [ 104, 109,  62, 110,  88, 110,  95 ]
+MonthWidth     = [  53,  52,  60,  67,  59,  63,  59,  56, 51, 48, 54, 53 ]
+DirWidth       = [  23,  35,  12,  27,  15,  33,  19,  41, 23 ]
+DirAngle       = [  23,  68, 113, 157, 203, 247, 293, 336 ]
+
+
+# Generate a list of sub-image glyphs cropped from the symbols image
+def croplist(widths, x, y, height):
+    return [symbols.crop([x, y + i * height, x + widths[i], y + (i + 1) * height])
+            for i in range(len(widths))]
+
+# Crop glyph lists (digits, days of week, etc.)
+TimeDigit = croplist(TimeDigitWidth,   0,   0, 44)
+TempDigit = croplist(TempDigitWidth,  40,   0, 39)
+DateDigit = croplist(DateDigitWidth,  75,   0, 18)
+HumiDigit = croplist(HumiDigitWidth,  75, 180, 16)
+Day       = croplist(DayWidth      ,  93,   0, 25)
+Month     = croplist(MonthWidth    ,  93, 175, 24)
+Dir       = croplist(DirWidth      , 162, 175, 21)
+# Crop a few odds-and-ends glyphs (not in lists)
+Wind      = symbols.crop([  93, 463, 157, 479 ])
+Humidity  = symbols.crop([  93, 479, 201, 500 ])
+Kph       = symbols.crop([ 156, 366, 196, 386 ])
+Mph       = symbols.crop([ 156, 387, 203, 407 ])
+
+
+# Paste a series of glyphs (mostly numbers) from string to img
+def drawNums(img, str, x, y, list):
+    for c in str:
+        d = ord(c) - ord('0')
+        img.paste(list[d], (x, y))
+        x += list[d].size[0] + 1
+    return x
+
+
+# Determine total width of a series of glyphs in string
+def numWidth(str, list):
+    w = 0 # Cumulative width
+    for i, c in enumerate(str):
+        d = ord(c) - ord('0')
+        if i > 0: w += 1     # Space between digits
+        w += list[d].size[0] # Digit width
+    return w
+
+
+# Fetch weather data from Yahoo!: temperature, humidity, wind speed,
+# direction and units
+def weather():
+    dom = parseString(urlopen(
+            'http://weather.yahooapis.com/forecastrss?w=' + WOEID).read())
+    wind = dom.getElementsByTagName('yweather:wind')[0]
+    return (int(dom.getElementsByTagName('yweather:condition')[0].getAttribute('temp')),
+            int(dom.getElementsByTagName('yweather:atmosphere')[0].getAttribute('humidity')),
+            int(wind.getAttribute('speed')),
+            int(wind.getAttribute('direction')),
+            dom.getElementsByTagName('yweather:units')[0].getAttribute('speed'))
+
+
+# Draw time, date and the given conditions into a new image
+def render(temperature, humidity, windSpeed, windDir, windUnits, t=None):
+    if t is None:
+        t = time.localtime()
+    img  = Image.new("1", [330, 117], "white") # Working 'background' image
+    draw = ImageDraw.Draw(img)
+
+    # Draw top & bottom bars
+    draw.rectangle([42,   0, 330,   3], fill="black")
+    draw.rectangle([42, 113, 330, 116], fill="black")
+
+    x = 42 # Initial drawing position
+    y = 12
+
+    # Render current time (always 24 hour XX:XX format)
+    drawNums(img, time.strftime("%H:%M", t), x, y, TimeDigit)
+
+    # Determine wider of day-of-week or date (for alignment)
+    s = str(t.tm_mday) # Convert day of month to a string
+    w = MonthWidth[t.tm_mon - 1] + 6 + numWidth(s, DateDigit)
+    if DayWidth[t.tm_wday] > w: w = DayWidth[t.tm_wday]
+
+    # Draw day-of-week and date
+    x = img.size[0] - w                    # Left alignment for two lines
+    img.paste(Day[t.tm_wday], (x, y))      # Draw day of week word
+    y += 27                                # Next line
+    img.paste(Month[t.tm_mon - 1], (x, y)) # Draw month word
+    x += MonthWidth[t.tm_mon - 1] + 6      # Advance past month
+    drawNums(img, s, x, y, DateDigit)      # Draw day of month
+
+    x = 42 # Position for temperature
+    y = 67
+    # Degrees to string, remap '-' glyph, append degrees glyph
+    s = str(temperature).replace('-', ';') + ':'
+    drawNums(img, s, x, y, TempDigit)
+
+    # Determine wider of humidity or wind info
+    s  = str(humidity) + ':' # Appends percent glyph
+    s2 = str(windSpeed)
+    winDirNum = 0  # Wind direction glyph number
+    if windSpeed > 0:
+        for winDirNum in range(len(DirAngle) - 1):
+            if windDir < DirAngle[winDirNum]: break
+    w  = Humidity.size[0] + 5 + numWidth(s, HumiDigit)
+    w2 = Wind.size[0] + 5 + numWidth(s2, HumiDigit)
+    if windSpeed > 0:
+        w2 += 3 + Dir[winDirNum].size[0]
+    if windUnits == 'kph': w2 += 3 + Kph.size[0]
+    else:                  w2 += 3 + Mph.size[0]
+    if w2 > w: w = w2
+
+    # Draw humidity and wind
+    x = img.size[0] - w # Left-align the two lines
+    y = 67
+    img.paste(Humidity, (x, y))
+    x += Humidity.size[0] + 5
+    drawNums(img, s, x, y, HumiDigit)
+    x = img.size[0] - w # Left-align again
+    y += 23             # And advance to next line
+    img.paste(Wind, (x, y))
+    x += Wind.size[0] + 5
+    if windSpeed > 0:
+        img.paste(Dir[winDirNum], (x, y))
+        x += Dir[winDirNum].size[0] + 3
+    x = drawNums(img, s2, x, y, HumiDigit) + 3
+    if windUnits == 'kph': img.paste(Kph, (x, y))
+    else:                  img.paste(Mph, (x, y))
+    return img
+
+
+def main(printer):
+    printer.print_image(render(*weather()), True)
+    printer.feed(3)
@@ -0,0 +1,115 @@
+# This is a Python port of Adafruit's "Gutenbird" sketch for Arduino.
+# Polls one or more Twitter accounts for changes, displaying updates
+# on attached thermal printer.
+# Written by Adafruit Industries.  MIT license.
+#
+# Uses Twitter 1.1 API application-only authentication.  This
+# REQUIRES a Twitter account and some account configuration.  Start
+# at dev.twitter.com, sign in with your Twitter credentials, select
+# "My Applications" from the avatar drop-down menu at the top right,
+# then "Create a new application."  Provide a name, description,
+# placeholder URL and complete the captcha, after which you'll be
+# provided a "consumer key" and "consumer secret" for your app.
+# Copy these strings to the globals below, and configure the search
+# string to your liking.  DO NOT SHARE your consumer key or secret!
+# If you put code on Github or other public repository, replace them
+# with dummy strings.
+
+from __future__ import print_function
+import base64, html, http.client, json, zlib
+from urllib.parse import quote
+from unidecode import unidecode
+
+
+# Configurable globals.  Edit to your needs. -------------------------------
+
+# Twitter application credentials -- see notes above -- DO NOT SHARE.
+consumer_key    = 'PUT_YOUR_CONSUMER_KEY_HERE'
+consumer_secret = 'PUT_YOUR_CONSUMER_SECRET_HERE'
+
+# queryString can be any valid Twitter API search string, including
+# boolean operators.  See http://dev.twitter.com/docs/using-search
+# for options and syntax.  Funny characters do NOT need to be URL
+# encoded here -- urllib takes care of that.
+queryString = 'from:Adafruit'
+
+
+# Other globals.  You probably won't need to change these. -----------------
+
+host      = 'api.twitter.com'
+authUrl   = '/oauth2/token'
+searchUrl = '/1.1/search/tweets.json?'
+agent     = 'Gutenbird v1.0'
+# Newest tweet printed so far; kept between runs in the same process
+lastId    = '1'
+
+
+class TwitterError(Exception):
+    pass
+
+
+# Initiate an HTTPS connection/request, uncompress and JSON-decode results
+def issueRequestAndDecodeResponse(method, url, body, headers):
+    connection = http.client.HTTPSConnection(host)
+    connection.request(method, url, body, headers)
+    response = connection.getresponse()
+    if response.status != 200:
+        raise TwitterError('HTTP error: %d' % response.status)
+    compressed = response.read()
+    connection.close()
+    return json.loads(zlib.decompress(compressed, 16+zlib.MAX_WBITS).decode('utf-8'))
+
+
+def main(printer, last_id=None):
+    """Print tweets newer than last_id (or the last run's), return the newest id"""
+    global lastId
+    if last_id is not None:
+        lastId = str(last_id)
+
+    # Get access token.
+    credentials = (quote(consumer_key) + ':' + quote(consumer_secret)).encode('ascii')
+    token = issueRequestAndDecodeResponse(
+      'POST', authUrl, 'grant_type=client_credentials',
+       {'Host'            : host,
+        'User-Agent'      : agent,
+        'Accept-Encoding' : 'gzip',
+        'Content-Type'    : 'application/x-www-form-urlencoded;charset=UTF-8',
+        'Authorization'   : 'Basic ' + base64.b64encode(credentials).decode('ascii')}
+      )['access_token']
+
+    # Perform search.
+    data = issueRequestAndDecodeResponse(
+      'GET',
+      (searchUrl + 'count=3&since_id=%s&q=%s' %
+       (lastId, quote(queryString))),
+      None,
+      {'Host'            : host,
+       'User-Agent'      : agent,
+       'Accept-Encoding' : 'gzip',
+       'Authorization'   : 'Bearer ' + token})
+
+    # Display results.
+    maxId = data['search_metadata']['max_id_str']
+
+    for tweet in data['statuses']:
+
+        printer.inverse_on()
+        printer.print(' ' + '{:<31}'.format(tweet['user']['screen_name']))
+        printer.inverse_off()
+
+        printer.underline_on()
+        printer.print('{:<32}'.format(tweet['created_at']))
+        printer.underline_off()
+
+        # max_id_str is not always present, so check tweet IDs as fallback
+        id = tweet['id_str']
+        if int(id) > int(maxId): maxId = id
+
+        # Remove HTML escape sequences
+        # and remap Unicode values to nearest ASCII equivalents
+        printer.print(unidecode(html.unescape(tweet['text'])))
+
+        printer.feed(3)
+
+    lastId = maxId
+    return maxId
@@ -0,0 +1,228 @@
+"""A small IMAP server for testing MailReceiver and MailWatcher
+
+Speaks just enough IMAP4rev1 (plus IDLE, UID MOVE and SPECIAL-USE LIST)
+for thpr.py, over plain TCP on localhost.  Tests add mail to a
+Mailbox, which announces it to sessions in IDLE like a real server.
+"""
+
+import re
+import socketserver
+import threading
+
+
+class Mailbox(object):
+
+    def __init__(self, capabilities=('IMAP4rev1', 'IDLE', 'MOVE'), after_login=()):
+        self.capabilities = list(capabilities)
+        # Announced only to authenticated sessions, as Dovecot does
+        self.after_login = list(after_login)
+        self.uidvalidity = 1
+        self.messages = []          # [uid, raw message, flags]
+        self.trash = []
+        self.log = []               # Commands received
+        self.next_uid = 1
+        self.lock = threading.Lock()
+        self._idlers = []
+        self._on_idle = []          # Added when the next IDLE starts
+        self._on_search = []        # Added right after the next SEARCH
+
+    def add(self, raw):
+        """Deliver a message now, announcing it to sessions in IDLE"""
+        with self.lock:
+            self._append(raw)
+            for wfile in list(self._idlers):
+                wfile.write(b'* %d EXISTS\r\n' % len(self.messages))
+                wfile.flush()
+
+    def add_on_idle(self, raw):
+        """Deliver a message once a session enters IDLE, announcing it
+        in the same segment as the '+' continuation"""
+        with self.lock:
+            self._on_idle.append(raw)
+
+    def add_on_search(self, raw):
+        """Deliver a message right after the next SEARCH, announcing it
+        to that session before its tagged response"""
+        with self.lock:
+            self._on_search.append(raw)
+
+    def _append(self, raw):
+        self.messages.append([self.next_uid, raw, set()])
+        self.next_uid += 1
+
+    def uids(self, message_set, uid):
+        """UIDs in an IMAP message set of UIDs or sequence numbers"""
+        last = len(self.messages)
+        if uid:
+            last = self.messages[-1][0] if self.messages else 0
+        numbers = set()
+        for part in message_set.split(','):
+            first, _, end = part.partition(':')
+            first = last if first == '*' else int(first)
+            end = first if not end else last if end == '*' else int(end)
+            # n:* matches the last message even if n is beyond it
+            numbers.update(range(min(first, end), max(first, end) + 1))
+        if uid:
+            return {number for number in numbers
+                    if any(m[0] == number for m in self.messages)}
+        return {self.messages[n - 1][0] for n in numbers if 0 < n <= last}
+
+
+class Handler(socketserver.StreamRequestHandler):
+
+    def send(self, data):
+        self.wfile.write(data if isinstance(data, bytes) else data.encode('ascii'))
+        self.wfile.flush()
+
+    def handle(self):
+        box = self.server.mailbox
+        self.logged_in = False
+        self.send('* OK fake IMAP server ready\r\n')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            line = line.decode('utf-8').rstrip('\r\n')
+            box.log.append(line)
+            tag, command, args = (line.split(' ', 2) + ['', ''])[:3]
+            command = command.upper()
+            uid = command == 'UID'
+            if uid:
+                command, _, args = args.partition(' ')
+                command = command.upper()
+            method = getattr(self, 'do_' + command, None)
+            if method is None:
+                self.send(tag + ' BAD unknown command\r\n')
+            elif method(box, tag, args, uid) is False:
+                return
+
+    def do_CAPABILITY(self, box, tag, args, uid):
+        capabilities = box.capabilities + (box.after_login if self.logged_in else [])
+        self.send('* CAPABILITY ' + ' '.join(capabilities) + '\r\n' + tag + ' OK done\r\n')
+
+    def do_LOGIN(self, box, tag, args, uid):
+        self.logged_in = True
+        self.send(tag + ' OK logged in\r\n')
+
+    def do_SELECT(self, box, tag, args, uid):
+        self.send('* %d EXISTS\r\n* OK [UIDVALIDITY %d] ok\r\n%s OK [READ-WRITE] done\r\n'
+                  % (len(box.messages), box.uidvalidity, tag))
+
+    def do_NOOP(self, box, tag, args, uid):
+        self.send(tag + ' OK done\r\n')
+
+    do_CLOSE = do_NOOP
+
+    def do_LOGOUT(self, box, tag, args, uid):
+        self.send('* BYE\r\n' + tag + ' OK done\r\n')
+        return False
+
+    def do_IDLE(self, box, tag, args, uid):
+        with box.lock:
+            reply = b'+ idling\r\n'
+            if box._on_idle:
+                for raw in box._on_idle:
+                    box._append(raw)
+                box._on_idle = []
+                reply += b'* %d EXISTS\r\n' % len(box.messages)
+            self.send(reply)
+            box._idlers.append(self.wfile)
+        done = self.rfile.readline()
+        with box.lock:
+            box._idlers.remove(self.wfile)
+        box.log.append(done.decode('ascii').strip())
+        self.send(tag + ' OK IDLE terminated\r\n')
+
+    def do_SEARCH(self, box, tag, args, uid):
+        with box.lock:
+            match = re.search(r'UID (\S+)', args)
+            if match:
+                found = sorted(box.uids(match.group(1), True))
+            else:
+                found = [m[0] for m in box.messages]
+            if not uid:
+                found = [i + 1 for i, m in enumerate(box.messages) if m[0] in found]
+            reply = '* SEARCH' + ''.join(' %d' % n for n in found) + '\r\n'
+            if box._on_search:
+                for raw in box._on_search:
+                    box._append(raw)
+                box._on_search = []
+                reply += '* %d EXISTS\r\n' % len(box.messages)
+        self.send(reply + tag + ' OK done\r\n')
+
+    def do_FETCH(self, box, tag, args, uid):
+        message_set, _, items = args.partition(' ')
+        with box.lock:
+            uids = box.uids(message_set, uid)
+            selected = [(n + 1, m) for n, m in enumerate(box.messages) if m[0] in uids]
+        for number, (message_uid, raw, flags) in selected:
+            fields = re.search(r'HEADER\.FIELDS \(([^)]*)\)', items.upper())
+            if fields:
+                names = fields.group(1).split()
+                header = raw.split(b'\r\n\r\n')[0].split(b'\r\n')
+                data = b''.join(line + b'\r\n' for line in header
+                                if line.split(b':')[0].upper().decode() in names) + b'\r\n'
+                item = 'BODY[HEADER.FIELDS (%s)]' % ' '.join(names)
+            else:
+                data, item = raw, 'RFC822'
+            if self.server.uid_last:
+                self.send(b'* %d FETCH (%s {%d}\r\n' % (number, item.encode(), len(data)) +
+                          data + b' UID %d)\r\n' % message_uid)
+            else:
+                self.send(b'* %d FETCH (UID %d %s {%d}\r\n' % (number, message_uid, item.encode(),
+                                                               len(data)) + data + b')\r\n')
+        self.send(tag + ' OK done\r\n')
+
+    def _move(self, box, args, uid, delete):
+        message_set, _, mailbox = args.partition(' ')
+        with box.lock:
+            uids = box.uids(message_set, uid)
+            box.trash += [m for m in box.messages if m[0] in uids]
+            if delete:
+                box.messages = [m for m in box.messages if m[0] not in uids]
+
+    def do_COPY(self, box, tag, args, uid):
+        self._move(box, args, uid, False)
+        self.send(tag + ' OK done\r\n')
+
+    def do_MOVE(self, box, tag, args, uid):
+        self._move(box, args, uid, True)
+        self.send(tag + ' OK done\r\n')
+
+    def do_STORE(self, box, tag, args, uid):
+        message_set, _, flags = args.partition(' ')
+        with box.lock:
+            uids = box.uids(message_set, uid)
+            for m in box.messages:
+                if m[0] in uids and '\\Deleted' in flags:
+                    m[2].add('\\Deleted')
+        self.send(tag + ' OK done\r\n')
+
+    def do_EXPUNGE(self, box, tag, args, uid):
+        with box.lock:
+            box.messages = [m for m in box.messages if '\\Deleted' not in m[2]]
+        self.send(tag + ' OK done\r\n')
+
+    def do_LIST(self, box, tag, args, uid):
+        self.send('* LIST (\\HasNoChildren) "/" "INBOX"\r\n'
+                  '* LIST (\\HasNoChildren \\Trash) "/" "Deleted Messages"\r\n'
+                  + tag + ' OK done\r\n')
+
+
+class Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def serve(mailbox, uid_last=False):
+    """Serve mailbox on a free localhost port, return the server
+
+    With uid_last, FETCH responses give the UID after the message data
+    rather than before it.
+    """
+    server = Server(('127.0.0.1', 0), Handler)
+    server.mailbox = mailbox
+    server.uid_last = uid_last
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,30 @@
+"""BitmapCache against the printer emulator"""
+
+import os
+
+from PIL import Image
+
+import ThermalCache
+from ThermalEmulator import PrinterEmulator, VirtualClock, EmulatedThermal
+
+GFX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gfx')
+
+
+def print_cached(cache, path):
+    emulator = PrinterEmulator(clock=VirtualClock())
+    cache.print_image(EmulatedThermal(emulator), path, True)
+    return emulator
+
+
+def test_hit_prints_like_miss(tmp_path):
+    path = os.path.join(GFX_DIR, 'goodbye.png')
+    cache = ThermalCache.BitmapCache(str(tmp_path))
+    missed = print_cached(cache, path)
+    assert len(os.listdir(str(tmp_path))) == 1
+    cache.hashes.clear()
+    hit = print_cached(cache, path)
+    expected = Image.open(path).convert('1')
+    for emulator in (missed, hit):
+        paper = emulator.image().crop((0, 0) + expected.size)
+        assert paper.tobytes() == expected.tobytes()
+        assert emulator.overruns == 0
@@ -0,0 +1,176 @@
+"""PrinterEmulator as a stand-in for the serial port"""
+
+import random
+import time
+
+import pytest
+from PIL import Image
+
+import AdafruitThermal
+from ThermalEmulator import PrinterEmulator, VirtualClock, EmulatedThermal, BufferOverrun
+from gfx import adaqrcode
+
+
+def test_status_reply_already_due_with_real_clock():
+    emulator = PrinterEmulator()
+    emulator.write(bytearray((27, 118, 0)))
+    time.sleep(0.01)
+    assert emulator.in_waiting == 1
+    assert emulator.read(1) == b'\x00'
+    assert emulator.in_waiting == 0
+
+
+def test_status_reply_waits_for_printing():
+    clock = VirtualClock()
+    emulator = PrinterEmulator(clock=clock)
+    printer = EmulatedThermal(emulator)
+    printer.feed_rows(100)
+    printer.write_bytes(27, 118, 0)
+    assert printer.read(1) == b'\x00'
+    assert clock() >= emulator.finish_time()
+
+
+class RecordingThermal(EmulatedThermal):
+    """EmulatedThermal that keeps every write after start-up"""
+
+    def __init__(self, emulator, **kwargs):
+        self.writes = []
+        EmulatedThermal.__init__(self, emulator, **kwargs)
+        del self.writes[:]
+
+    def _send(self, data):
+        self.writes.append(bytes(data))
+        EmulatedThermal._send(self, data)
+
+
+def emulated():
+    emulator = PrinterEmulator(clock=VirtualClock())
+    return emulator, RecordingThermal(emulator)
+
+
+def random_image(width, height, seed=0):
+    rng = random.Random(seed)
+    image = Image.new('1', (width, height))
+    image.putdata([rng.choice((0, 255)) for i in range(width * height)])
+    return image
+
+
+def bitmap_stream(w, h, bitmap, chunk_height):
+    """DC2 * commands for a bitmap, rows clipped to the print head"""
+    row_bytes = (w + 7) // 8
+    clipped = min(row_bytes, 48)
+    stream = bytearray()
+    for row_start in range(0, h, chunk_height):
+        rows = min(chunk_height, h - row_start)
+        stream += bytearray((18, 42, rows, clipped))
+        for y in range(row_start, row_start + rows):
+            stream += bytearray(bitmap[y * row_bytes:y * row_bytes + clipped])
+    return bytes(stream)
+
+
+def printed(emulator, w, h):
+    return emulator.image().crop((0, 0, min(w, 384), h))
+
+
+def test_bitmap_from_list_or_bytes():
+    emulator, printer = emulated()
+    printer.print_bitmap(adaqrcode.width, adaqrcode.height, adaqrcode.data)
+    bytes_emulator, bytes_printer = emulated()
+    bytes_printer.print_bitmap(adaqrcode.width, adaqrcode.height, bytes(adaqrcode.data))
+    stream = bitmap_stream(adaqrcode.width, adaqrcode.height, adaqrcode.data, 255)
+    assert b''.join(printer.writes) == b''.join(bytes_printer.writes) == stream
+    assert (printed(emulator, adaqrcode.width, adaqrcode.height).tobytes() ==
+            printed(bytes_emulator, adaqrcode.width, adaqrcode.height).tobytes())
+
+
+@pytest.mark.parametrize('numpy', [True, False])
+def test_bitmap_wider_than_print_head(numpy, monkeypatch):
+    if numpy and AdafruitThermal.np is None:
+        pytest.skip('NumPy not installed')
+    if not numpy:
+        monkeypatch.setattr(AdafruitThermal, 'np', None)
+    image = random_image(500, 20, seed=500)
+    bitmap = AdafruitThermal.pack_image(image)
+    emulator, printer = emulated()
+    printer.print_bitmap(500, 20, bitmap)
+    assert b''.join(printer.writes) == bitmap_stream(500, 20, bitmap, 255)
+    assert printed(emulator, 500, 20).tobytes() == image.crop((0, 0, 384, 20)).tobytes()
+
+
+def test_laat_rows_share_writes():
+    image = random_image(384, 100, seed=1)
+    bitmap = AdafruitThermal.pack_image(image)
+    emulator, printer = emulated()
+    printer.print_bitmap(384, 100, bitmap, LaaT=True)
+    assert b''.join(printer.writes) == bitmap_stream(384, 100, bitmap, 1)
+    # Four 52-byte rows per write of at most buffer_size (256) bytes
+    assert [len(data) for data in printer.writes] == [4 * 52] * 25
+    assert emulator.overruns == 0
+    assert printed(emulator, 384, 100).tobytes() == image.tobytes()
+
+
+@pytest.mark.parametrize('text', ['x' * 32, 'x' * 33, 'x' * 65, 'a\n\nb',
+                                  ('The quick brown fox jumps over the lazy dog. ' * 45)[:2000]],
+                         ids=['full line', 'wrap', 'two wraps', 'blank line', 'long text'])
+def test_write_accounts_lines_as_printed(text):
+    emulator, printer = emulated()
+    printer.print_line(text)
+    # Wrapped lines as the printer makes them, and paced to its speed
+    assert printer.paper_rows == emulator.image().size[1]
+    assert printer.resume_time == pytest.approx(emulator.finish_time(), abs=0.05)
+    assert emulator.overruns == 0
+
+
+def test_write_text_stream_and_rendering():
+    emulator, printer = emulated()
+    printer.print_line('Hello')
+    assert b''.join(printer.writes) == b'Hello\n'
+    paper = emulator.image()
+    assert paper.size == (384, 32)
+    # Glyphs within the character height, the line spacing left blank
+    ink = [paper.crop((0, y, 384, y + 1)).tobytes() != b'\xff' * 48 for y in range(32)]
+    assert any(ink[:24]) and not any(ink[24:])
+
+
+def test_write_sends_blocks_of_at_most_buffer_size():
+    emulator, printer = emulated()
+    text = ('The quick brown fox jumps over the lazy dog. ' * 45)[:2000]
+    printer.print_line(text)
+    assert b''.join(printer.writes) == text.encode('latin-1') + b'\n'
+    assert max(len(data) for data in printer.writes) == printer.buffer_size
+    assert emulator.overruns == 0
+    assert emulator.max_buffered <= emulator.buffer_size
+
+
+def test_bitmap_timing_and_rendering():
+    image = random_image(200, 300, seed=2)
+    emulator, printer = emulated()
+    printer.print_bitmap(200, 300, AdafruitThermal.pack_image(image))
+    assert printer.paper_rows == 300
+    assert emulator.commands
+    assert emulator.print_time == pytest.approx(300 * emulator.dot_print_time)
+    assert printer.resume_time == pytest.approx(emulator.finish_time(), abs=0.05)
+    assert emulator.overruns == 0
+    assert printed(emulator, 200, 300).tobytes() == image.tobytes()
+
+
+def test_image_cropped_to_print_head_and_converted():
+    gray = Image.linear_gradient('L').resize((500, 40))
+    emulator, printer = emulated()
+    printer.print_image(gray, LaaT=True)
+    expected = gray.convert('1').crop((0, 0, 384, 40))
+    assert b''.join(printer.writes) == bitmap_stream(
+        384, 40, AdafruitThermal.pack_image(expected), 1)
+    assert printed(emulator, 384, 40).tobytes() == expected.tobytes()
+    assert emulator.overruns == 0
+
+
+def test_pacing_too_fast_overruns_buffer():
+    # At 115200 baud the line outruns the print head several times over
+    emulator = PrinterEmulator(baudrate=115200, clock=VirtualClock())
+    printer = RecordingThermal(emulator)
+    printer.dot_print_time = 0.0
+    image = random_image(384, 200, seed=3)
+    with pytest.warns(BufferOverrun):
+        printer.print_bitmap(384, 200, AdafruitThermal.pack_image(image), LaaT=True)
+    assert emulator.overruns > 0
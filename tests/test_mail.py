@@ -0,0 +1,306 @@
+"""MailReceiver and MailWatcher against the fake IMAP server"""
+
+import asyncio
+import configparser
+import os
+import tempfile
+import time
+from email.message import EmailMessage
+
+import pytest
+
+import MailWatcher
+import fakeimap
+from PrintQueue import QueueFull
+
+
+def message(subject, sender='me@example.org', recipient='printer@example.net', image=None):
+    mail = EmailMessage()
+    mail['Subject'] = subject
+    mail['From'] = sender
+    mail['To'] = recipient
+    mail['Message-ID'] = '<{0}@example.org>'.format(subject)
+    mail.set_content('Hello ' + subject)
+    if image is not None:
+        mail.add_attachment(image, maintype='image', subtype='png', filename='photo.png')
+    return mail.as_bytes().replace(b'\n', b'\r\n')
+
+
+class RecordingQueue(object):
+    """Takes the place of PrintQueue, remembering the subjects"""
+
+    def __init__(self):
+        self.subjects = []
+        self.files = []
+        self.room = None            # Jobs still accepted, None for any
+
+    def submit(self, kind, params=None, key=None, files=None, shed=True):
+        if self.room is not None:
+            if self.room <= 0:
+                raise QueueFull('print queue is full')
+            self.room -= 1
+        self.subjects.append(params['subject'])
+        self.files.append(files)
+        return len(self.subjects)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def receiver(tmp_path):
+    """Returns a function making a MailReceiver for a fake server's mailbox"""
+    servers = []
+
+    def make(mailbox, options=None, **serve_args):
+        server = fakeimap.serve(mailbox, **serve_args)
+        servers.append(server)
+        config = configparser.ConfigParser()
+        config.read_dict({
+            'EMail': {'user': 'user', 'password': 'secret', 'host': '127.0.0.1',
+                      'port': str(server.server_address[1]), 'ssl': 'no',
+                      'state_file': str(tmp_path / 'mail.state'),
+                      'image_workers': '0', **(options or {})},
+            'Valid senders': {'a': 'example.org'},
+            'Valid recipients': {'a': 'example.net'},
+        })
+        return MailWatcher.MailReceiver(config, RecordingQueue(),
+                                 config_file=str(tmp_path / 'thpr.conf'))
+
+    yield make
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def watch():
+    """Returns a function starting a MailWatcher, stopped afterwards"""
+    watchers = []
+
+    def start(receiver, **attributes):
+        watcher = MailWatcher.MailWatcher(receiver, poll_interval=0.2)
+        for name, value in attributes.items():
+            setattr(watcher, name, value)
+        watcher.start()
+        watchers.append(watcher)
+        return watcher
+
+    yield start
+    for watcher in watchers:
+        watcher.stop()
+
+
+def test_check_mail_prints_valid_mail_only(receiver):
+    mailbox = fakeimap.Mailbox()
+    mailbox.add(message('spam', sender='someone@example.com'))
+    mailbox.add(message('one'))
+    mailbox.add(message('two'))
+    mr = receiver(mailbox)
+    mr.check_mail()
+    assert mr.queue.subjects == ['one', 'two']
+    # Printed mails are moved to the trash, the rest stays
+    assert [m[0] for m in mailbox.trash] == [2, 3]
+    assert [m[0] for m in mailbox.messages] == [1]
+
+
+def test_check_mail_fetches_only_new_uids(receiver):
+    mailbox = fakeimap.Mailbox()
+    mailbox.add(message('spam', sender='someone@example.com'))
+    mr = receiver(mailbox)
+    mr.check_mail()
+    mailbox.add(message('three'))
+    del mailbox.log[:]
+    mr.check_mail()
+    assert mr.queue.subjects == ['three']
+    assert [line for line in mailbox.log if 'FETCH' in line][0].split()[3] == '2'
+
+
+def test_uidvalidity_change_rescans(receiver):
+    mailbox = fakeimap.Mailbox(('IMAP4rev1',))
+    mailbox.add(message('one'))
+    mr = receiver(mailbox)
+    mr.no_deleting = True
+    mr.check_mail()
+    mailbox.uidvalidity = 2
+    mr.check_mail()
+    assert mr.queue.subjects == ['one', 'one']
+
+
+def test_idle_reports_new_mail(receiver, watch):
+    mailbox = fakeimap.Mailbox()
+    mailbox.add(message('first'))
+    mr = receiver(mailbox)
+    watch(mr)
+    assert wait_for(lambda: mr.queue.subjects == ['first'])
+    assert wait_for(lambda: mailbox._idlers)
+    started = time.time()
+    mailbox.add(message('second'))
+    assert wait_for(lambda: mr.queue.subjects == ['first', 'second'])
+    assert time.time() - started < 1
+
+
+def test_exists_sent_with_idle_continuation(receiver, watch):
+    # The EXISTS line arrives in the same segment as '+ idling' and sits
+    # in imaplib's buffer, invisible to select()
+    mailbox = fakeimap.Mailbox()
+    mr = receiver(mailbox)
+    watcher = watch(mr, idle_timeout=30)
+    assert wait_for(lambda: mailbox._idlers)
+    mailbox.add_on_idle(message('buffered'))
+    # Reconnect, so that the next IDLE delivers the mail
+    watcher.stop()
+    watcher.start()
+    assert wait_for(lambda: mr.queue.subjects == ['buffered'], timeout=3)
+
+
+def test_exists_during_process_is_not_lost(receiver, watch):
+    # EXISTS arriving during process() ends up in imaplib's
+    # untagged_responses; the mail must still be printed
+    mailbox = fakeimap.Mailbox()
+    mailbox.add_on_search(message('late'))
+    mr = receiver(mailbox)
+    watch(mr, idle_timeout=0.5)
+    assert wait_for(lambda: mr.queue.subjects == ['late'], timeout=3)
+
+
+def test_capabilities_after_login(receiver, watch):
+    # MOVE and IDLE are only announced once logged in
+    mailbox = fakeimap.Mailbox(('IMAP4rev1',), after_login=('IDLE', 'MOVE'))
+    mailbox.add(message('one'))
+    mr = receiver(mailbox)
+    watch(mr)
+    assert wait_for(lambda: mailbox._idlers)
+    assert mr.queue.subjects == ['one']
+    assert any(' UID MOVE ' in line for line in mailbox.log)
+
+
+def test_run_async_idles_on_the_loop(receiver):
+    mailbox = fakeimap.Mailbox()
+    mailbox.add(message('first'))
+    mr = receiver(mailbox)
+    watcher = MailWatcher.MailWatcher(mr, poll_interval=0.2)
+
+    async def until(condition, timeout=5):
+        deadline = time.time() + timeout
+        while not condition():
+            if time.time() > deadline:
+                return False
+            await asyncio.sleep(0.01)
+        return True
+
+    async def run():
+        task = asyncio.ensure_future(watcher.run_async())
+        assert await until(lambda: mailbox._idlers)
+        mailbox.add(message('second'))
+        assert await until(lambda: mr.queue.subjects == ['first', 'second'])
+        assert await until(lambda: mailbox._idlers)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    # Cancelled in IDLE, the session still ends cleanly
+    assert [line.split()[-1] for line in mailbox.log[-2:]] == ['DONE', 'LOGOUT']
+
+
+def test_polls_without_idle(receiver, watch):
+    mailbox = fakeimap.Mailbox(('IMAP4rev1',))
+    mr = receiver(mailbox)
+    watch(mr)
+    mailbox.add(message('polled'))
+    assert wait_for(lambda: mr.queue.subjects == ['polled'])
+
+
+def test_uid_after_literal(receiver):
+    mailbox = fakeimap.Mailbox()
+    mailbox.add(message('one'))
+    mailbox.add(message('two'))
+    mr = receiver(mailbox, uid_last=True)
+    mr.check_mail()
+    assert mr.queue.subjects == ['one', 'two']
+    assert mr.load_state()['last_uid'] == 2
+
+
+def test_unfetched_mail_is_retried(receiver, monkeypatch):
+    mailbox = fakeimap.Mailbox()
+    mailbox.add(message('one'))
+    mailbox.add(message('two'))
+    mailbox.add(message('three'))
+    mr = receiver(mailbox)
+    fetch = mr.fetch
+
+    def lossy_fetch(imap_session, uids, parts):
+        # The server returns nothing for UID 2's body
+        return [(uid, data) for uid, data in fetch(imap_session, uids, parts)
+                if not (uid == 2 and 'RFC822' in parts)]
+
+    monkeypatch.setattr(mr, 'fetch', lossy_fetch)
+    mr.check_mail()
+    assert mr.queue.subjects == ['one', 'three']
+    assert mr.load_state()['last_uid'] == 1
+    monkeypatch.setattr(mr, 'fetch', fetch)
+    mr.check_mail()
+    assert mr.queue.subjects == ['one', 'three', 'two']
+    assert mr.load_state()['last_uid'] == 2
+
+
+def test_mail_refused_by_full_queue_is_retried(receiver):
+    mailbox = fakeimap.Mailbox()
+    mailbox.add(message('one'))
+    mailbox.add(message('two'))
+    mailbox.add(message('three'))
+    mr = receiver(mailbox)
+    mr.queue.room = 1
+    mr.check_mail()
+    # Only the queued mail is moved to the trash and passed over
+    assert mr.queue.subjects == ['one']
+    assert [m[0] for m in mailbox.trash] == [1]
+    assert mr.load_state()['last_uid'] == 1
+    mr.queue.room = None
+    mr.check_mail()
+    assert mr.queue.subjects == ['one', 'two', 'three']
+    assert [m[0] for m in mailbox.trash] == [1, 2, 3]
+    assert mr.load_state()['last_uid'] == 3
+
+
+def test_image_converted_by_worker_from_file(receiver, tmp_path, monkeypatch):
+    # Larger than attachment_spool_size, so the worker gets a file name
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    with open(os.path.join(os.path.dirname(__file__), '..', 'gfx', 'hello.png'), 'rb') as fp:
+        image = fp.read()
+    mailbox = fakeimap.Mailbox()
+    mailbox.add(message('photo', image=image))
+    mr = receiver(mailbox, {'image_workers': '1', 'attachment_spool_size': '100'})
+    sources = []
+    convert = mr.convert
+    monkeypatch.setattr(mr, 'convert', lambda source: sources.append(source) or convert(source))
+    mr.check_mail()
+    mr.close()
+    assert mr.queue.subjects == ['photo']
+    assert mr.queue.files[0]['bitmap']
+    assert [os.path.dirname(source) for source in sources] == [str(tmp_path)]
+    assert not [name for name in os.listdir(str(tmp_path)) if name.startswith('thpr-')]
+
+
+def test_unconvertible_image_is_retried_then_kept(receiver):
+    mailbox = fakeimap.Mailbox()
+    mailbox.add(message('broken', image=b'not a png'))
+    mailbox.add(message('text'))
+    mr = receiver(mailbox, {'image_retries': '2'})
+    mr.check_mail()
+    # Not queued, left in the inbox and looked at again
+    assert mr.queue.subjects == ['text']
+    assert [m[0] for m in mailbox.messages] == [1]
+    assert mr.load_state()['last_uid'] == 0
+    mr.check_mail()
+    # Out of retries: printed without its image, the mail is kept
+    assert mr.queue.subjects == ['text', 'broken']
+    assert mr.queue.files[1] == {}
+    assert [m[0] for m in mailbox.messages] == [1]
+    assert mr.load_state()['last_uid'] == 1
@@ -0,0 +1,47 @@
+"""pack_image() with NumPy must match the pure Python loop byte for byte"""
+
+import os
+import random
+
+import pytest
+from PIL import Image
+
+import AdafruitThermal
+
+pytestmark = pytest.mark.skipif(AdafruitThermal.np is None, reason='NumPy not installed')
+
+GFX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gfx')
+
+
+def random_image(width, height, seed=0):
+    rng = random.Random(seed)
+    image = Image.new('1', (width, height))
+    image.putdata([rng.choice((0, 255)) for i in range(width * height)])
+    return image
+
+
+def pack_both(image, monkeypatch):
+    fast = AdafruitThermal.pack_image(image)
+    with monkeypatch.context() as patch:
+        patch.setattr(AdafruitThermal, 'np', None)
+        slow = AdafruitThermal.pack_image(image)
+    return fast, slow
+
+
+@pytest.mark.parametrize('width', [1, 7, 8, 9, 100, 383, 384, 385, 500])
+def test_widths(width, monkeypatch):
+    fast, slow = pack_both(random_image(width, 13, seed=width), monkeypatch)
+    assert fast == slow
+    assert len(fast) == (width + 7) // 8 * 13
+
+
+def test_gray_image_is_converted(monkeypatch):
+    image = Image.linear_gradient('L').resize((203, 40))
+    fast, slow = pack_both(image, monkeypatch)
+    assert fast == slow
+
+
+def test_hello_png(monkeypatch):
+    image = Image.open(os.path.join(GFX_DIR, 'hello.png'))
+    fast, slow = pack_both(image, monkeypatch)
+    assert fast == slow
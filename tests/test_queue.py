@@ -0,0 +1,50 @@
+"""PrintQueue's spool directory"""
+
+import os
+
+import PrintQueue
+
+
+def fail(printer, job):
+    raise ValueError('cannot print this')
+
+
+def run(queue):
+    queue.start()
+    assert queue.join(10)
+    queue.stop()
+
+
+def test_failed_job_leaves_only_its_record(tmp_path):
+    queue = PrintQueue.PrintQueue(None, str(tmp_path))
+    queue.register('broken', fail)
+    job_id = queue.submit('broken', files={'image': b'x' * 1000})
+    run(queue)
+    assert os.listdir(str(tmp_path)) == [job_id + '.failed']
+    assert queue.status(job_id)['status'] == 'failed'
+    assert queue.pending_bytes == 0
+
+
+def test_failed_jobs_expire(tmp_path):
+    queue = PrintQueue.PrintQueue(None, str(tmp_path))
+    queue.max_failed = 2
+    queue.register('broken', fail)
+    job_ids = [queue.submit('broken') for i in range(4)]
+    run(queue)
+    assert sorted(os.listdir(str(tmp_path))) == [job_id + '.failed'
+                                                 for job_id in job_ids[2:]]
+
+
+def test_stale_files_removed_at_startup(tmp_path):
+    queue = PrintQueue.PrintQueue(None, str(tmp_path))
+    queue.register('text', lambda printer, job: None)
+    job_id = queue.submit('text', files={'data': b'queued'})
+    stale = ['00000000000000001-0123abcd.image',        # Left by a failed job
+             '00000000000000002-0123abcd.data.tmp']     # Crash during submit()
+    for name in stale:
+        tmp_path.joinpath(name).write_bytes(b'stale')
+    tmp_path.joinpath('done.log').write_text('')
+    queue = PrintQueue.PrintQueue(None, str(tmp_path))
+    assert sorted(os.listdir(str(tmp_path))) == [job_id + '.data', job_id + '.job',
+                                                 'done.log']
+    assert queue.status(job_id)['status'] == 'queued'
@@ -0,0 +1,53 @@
+"""Scheduler against a wall clock that is set while it runs"""
+
+import asyncio
+import threading
+import time
+
+import Scheduler
+
+
+def test_daily_follows_wall_clock_set_later(monkeypatch):
+    # A Pi without a real-time clock boots with a stale time; NTP sets
+    # it two hours ahead once the daily job is scheduled
+    wall_time = time.time
+    shift = [0.0]
+    monkeypatch.setattr(time, 'time', lambda: wall_time() + shift[0])
+    at = time.localtime(wall_time() + 2 * 3600)
+    ran = threading.Event()
+    schedule = Scheduler.Scheduler()
+    schedule.wall_check = 0.05
+    schedule.daily(at.tm_hour, at.tm_min, ran.set)
+    schedule.start()
+    try:
+        target = time.mktime((at.tm_year, at.tm_mon, at.tm_mday,
+                              at.tm_hour, at.tm_min, 0, 0, 0, -1))
+        shift[0] = target - wall_time() - 0.2
+        assert ran.wait(2)
+    finally:
+        schedule.stop()
+
+
+def test_daily_deadline_kept_without_clock_change():
+    schedule = Scheduler.Scheduler()
+    at = time.localtime(time.time() + 2 * 3600)
+    job = schedule.daily(at.tm_hour, at.tm_min, lambda: None)
+    due = job.due
+    assert schedule._next_due() == (None, schedule.wall_check)
+    assert job.due == due
+
+
+def test_run_async_calls_jobs_off_the_loop():
+    schedule = Scheduler.Scheduler()
+    threads = []
+
+    async def run():
+        task = asyncio.ensure_future(schedule.run_async())
+        schedule.every(0.01, lambda: threads.append(threading.current_thread()))
+        while len(threads) < 2:
+            await asyncio.sleep(0.01)
+        schedule.stop()
+        await task
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+    assert threading.current_thread() not in threads
@@ -0,0 +1,72 @@
+"""The web app served from an asyncio loop"""
+
+import asyncio
+import configparser
+import json
+
+import PrintQueue
+import WebServer
+
+
+def api_section():
+    config = configparser.ConfigParser()
+    config['api'] = {'secret_key': 'sesame', 'max_upload': '1000'}
+    return config['api']
+
+
+def exchange(queue, *requests):
+    """Send each raw request to a connection of its own, return the responses"""
+    WebServer.configure(queue, api_section())
+
+    async def run():
+        server = await asyncio.start_server(WebServer.serve_connection, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+
+        async def send(request):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(request)
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            return response
+
+        async with server:
+            return await asyncio.gather(*[send(request) for request in requests])
+
+    return asyncio.run(run())
+
+
+def split(response):
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), body
+
+
+def test_submit_and_follow_job(tmp_path):
+    queue = PrintQueue.PrintQueue(None, str(tmp_path))
+    queue.register('text', lambda printer, job: None)
+    body = b'{"text": "Hello"}'
+    submitted, = exchange(queue, b'POST /api/sesame/print/text HTTP/1.1\r\n'
+                                 b'Host: printer\r\nContent-Type: application/json\r\n'
+                                 b'Content-Length: %d\r\n\r\n%s' % (len(body), body))
+    status, body = split(submitted)
+    assert status == 202
+    job_id = json.loads(body.decode('utf-8'))['id']
+    followed, wrong_key = exchange(queue,
+                                   b'GET /api/sesame/jobs/%s HTTP/1.1\r\nHost: printer\r\n\r\n'
+                                   % job_id.encode('ascii'),
+                                   b'GET /api/guess/queue HTTP/1.1\r\nHost: printer\r\n\r\n')
+    status, body = split(followed)
+    assert status == 200
+    assert json.loads(body.decode('utf-8'))['status'] == 'queued'
+    assert split(wrong_key)[0] == 403
+
+
+def test_oversized_and_chunked_bodies_refused(tmp_path):
+    queue = PrintQueue.PrintQueue(None, str(tmp_path))
+    too_large, chunked = exchange(
+        queue,
+        b'POST /api/sesame/print/raw HTTP/1.1\r\nContent-Length: 5000\r\n\r\n',
+        b'POST /api/sesame/print/raw HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n0\r\n\r\n')
+    assert split(too_large)[0] == 413
+    assert split(chunked)[0] == 411
+    assert queue.stats()['jobs'] == 0
@@ -0,0 +1,30 @@
+"""Compiled mail whitelists"""
+
+import logging
+
+import MailWhitelist
+
+
+def test_address_and_domain_entries(caplog):
+    with caplog.at_level(logging.WARNING, logger='MailWhitelist'):
+        matcher = MailWhitelist.AddressMatcher(['me@example.org', '@example.net',
+                                                'mail.example.com'])
+    assert not caplog.records
+    assert matcher('Me <ME@example.org>')
+    assert matcher('someone@example.net')
+    assert matcher('someone@eu.mail.example.com')
+    assert not matcher('you@example.org')
+    assert not matcher('someone@example.com')
+
+
+def test_substring_entries_warned_about(caplog):
+    entries = ['John', '@gmail', 'example.', '.example.com', 'a@b', '@']
+    with caplog.at_level(logging.WARNING, logger='MailWhitelist'):
+        matcher = MailWhitelist.AddressMatcher(entries)
+    assert len(caplog.records) == len(entries)
+    assert not matcher('John <john@gmail.com>')
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger='MailWhitelist'):
+        matcher = MailWhitelist.AddressMatcher(entries, substring=True)
+    assert not caplog.records
+    assert matcher('John <john@gmail.com>')
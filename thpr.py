@@ -3,7 +3,7 @@
 """[Th]ermal [Pr]inter
 
 Usage:
-thpr.py [-s | --no-server] [-v | --verbose] [-d | --no-deleting] [-p | --no-printing] [-r | --run-once]
+thpr.py [-s | --no-server] [-v | --verbose] [-d | --no-deleting] [-p | --no-printing] [-r | --run-once] [-a | --asyncio]
 thpr.py (-h | --help)
 thpr.py --version
 
@@ -15,6 +15,8 @@ Options:
 -d --no-deleting    Do not delete mails after printing
 -p --no-printing    Do not print anything
 -r --run-once       Run only one check, then exit
+-a --asyncio        Run printing, mail, button, schedule and the web
+                    server on one asyncio event loop
 
 
 
@@ -37,22 +39,31 @@ Original version based on
 """
 
 from __future__ import print_function
-from flask import Flask, render_template, request
 import configparser
 import subprocess
 import time
 from PIL import Image, ImageFilter
 import socket
 from AdafruitThermal import *
-import RPi.GPIO as GPIO
-import imaplib
-import email
-from email.header import decode_header
+from ThermalImage import pack_attachment, fit_size
+from ThermalCache import BitmapCache
+from ThermalAsync import AsyncThermal
+import jobs
+from PrintQueue import PrintQueue
+from Scheduler import Scheduler
+from ButtonWatcher import ButtonWatcher
+from MailWatcher import MailReceiver, MailWatcher
+from WebServer import web_server, serve_async
 import os
-from threading import Timer
-import uuid
-import shutil
-import numpy as np
+# Away from a Raspberry Pi, set THPR_FAKE_GPIO=1 to run with the
+# stand-in; a failing RPi.GPIO (e.g. no access to /dev/mem) is an error
+# otherwise, rather than a button and LED that silently do nothing.
+if os.environ.get('THPR_FAKE_GPIO'):
+    import FakeGPIO as GPIO
+else:
+    import RPi.GPIO as GPIO
+import asyncio
+import sys
 from docopt import docopt
 
 import logging
@@ -60,64 +71,43 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-lastId = '1'   # State information passed to/from interval script
-webapp = Flask(__name__)
+async def run_asyncio(printer, mail_watcher, schedule, server=None):
+    """Run printer, mail, button, schedule and web server on one event loop
+
+    Print jobs are rendered into ThermalDocuments and sent with
+    AsyncThermal, paced by loop timers instead of sleeping threads.  The
+    mailbox is watched in IDLE and HTTP connections are served by the
+    loop; server is a serve_async() coroutine, or None.  Work that
+    blocks - rendering jobs, imaplib commands, the Flask views, button
+    actions and scheduled jobs - is handed to the default executor for
+    its duration, and GPIO edges arrive from RPi.GPIO's own thread.
+    Returns after a KeyboardInterrupt or cancellation.
+    """
+    output = AsyncThermal(printer.tp)
+    tasks = [asyncio.ensure_future(printer.queue.run_async(output.print_document)),
+             asyncio.ensure_future(printer.button.run_async()),
+             asyncio.ensure_future(schedule.run_async()),
+             asyncio.ensure_future(mail_watcher.run_async())]
+    if server is not None:
+        tasks.append(asyncio.ensure_future(server))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        mail_watcher.stop()
+        schedule.stop()
+        printer.button.stop()
+        printer.queue.stop()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def gfx_path(name):
+    """The path of an image in gfx/; spooled jobs only name the file"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gfx',
+                        os.path.basename(name))
 
 
-    
-@webapp.route("/")
-def main():
-    # For each pin, read the pin state and store it in the pins dictionary:
-    #for pin in pins:
-    #    pins[pin]['state'] = GPIO.input(pin)
-    # Put the pin dictionary into the template data dictionary:
-    #templateData = {'pins': pins}
-    # Pass the template data into the template main.html and
-    # return it to the user
-    return render_template('main.html')#, **templateData)
-
-@webapp.route("/<secret_key>/<action>/<param>")
-def action(secret_key, action, param):
-    """Executed when someone requests a URL with secret_key, action and param"""
-    if secret_key == config['api']['secret_key']:
-        # key is correct, so continue
-        if action == 'print':
-            pass
-            print('Here I would do something')
-            #thermo_print(param)
-         
-    # Along with the pin dictionary, put the message into the template data dictionary:
-    templateData = {
-        'action' : action,
-        'param' : param
-    }
-
-    return render_template('main.html', **templateData)
-
-
-class Scheduler(object):
-    def __init__(self, sleep_time, function):
-        self.sleep_time = sleep_time
-        self.function = function
-        self._t = None
-
-    def start(self):
-        if self._t is None:
-            self._t = Timer(self.sleep_time, self._run)
-            self._t.start()
-        else:
-            raise Exception("this timer is already running")
-
-    def _run(self):
-        self.function()
-        self._t = Timer(self.sleep_time, self._run)
-        self._t.start()
-
-    def stop(self):
-        if self._t is not None:
-            self._t.cancel()
-            self._t = None
-
 class MyThermalPrinter:
     """Thermal Printer class with added button and LED"""
 
@@ -127,19 +117,31 @@ class MyThermalPrinter:
         self.button_pin = int(kwargs.pop('button_pin'))
         LED_PIN = int(kwargs.pop('led_pin'))
         self.hold_time = int(kwargs.pop('hold_time'))
+        spool_dir = kwargs.pop('spool_dir')
+        queue_budget = kwargs.pop('queue_budget', None)
+        queue_time = kwargs.pop('queue_time', None)
+        self.cache = BitmapCache(kwargs.pop('cache_dir'))
         self.available = True
         self.tap_time = 0.01  # Debounce time for button taps
         self.next_interval = 0.0   # Time of next recurring operation
-        self.daily_flag = False  # Set after daily trigger occurs
         GPIO.setup(LED_PIN, GPIO.OUT)
         GPIO.setup(self.button_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
         self.tp = AdafruitThermal(*args, **kwargs)
+        # All printing after start-up goes through the queue's worker
+        self.queue = PrintQueue(self.tp, spool_dir, max_bytes=queue_budget,
+                                max_seconds=queue_time)
+        self.queue.register('text', self.print_text, self.estimate_text)
+        self.queue.register('image', self.print_upload, self.estimate_upload)
+        self.queue.register('raw', self.print_raw, self.estimate_raw)
+        self.queue.register('mail', self.print_mail, self.estimate_mail)
+        self.queue.register('gfx', self.print_gfx, self.estimate_gfx)
+        self.queue.register('job', self.run_job)
+        # Jobs run in this process and share tp; load them now rather
+        # than on the first button press
+        jobs.preload()
         #self.available = False
-        # Enable LED and button (w/pull-up on latter)
-        self.prev_button_state = GPIO.input(self.button_pin)
-        self.prev_time = time.time()
-        self.tap_enable = False
-        self.hold_enable = False
+        self.button = ButtonWatcher(GPIO, self.button_pin, LED_PIN, self.tap, self.hold,
+                                    tap_time=self.tap_time, hold_time=self.hold_time)
 
 
     def check_network(self):
@@ -175,77 +177,21 @@ class MyThermalPrinter:
         GPIO.output(LED_PIN, GPIO.HIGH)
         # Print greeting image
         if self.available:
-            self.tp.print_image(Image.open('gfx/hello.png'), True)
+            self.cache.print_image(self.tp, 'gfx/hello.png', True)
             self.tp.feed(3)
         GPIO.output(LED_PIN, GPIO.LOW)
 
-    def query_button(self):
-        # Poll current button state and time
-        button_state = GPIO.input(self.button_pin)
-        t = time.time()
-        # Has button state changed?
-        if button_state != self.prev_button_state:
-            if button_state:
-                GPIO.output(LED_PIN, GPIO.HIGH)
-            else:
-                GPIO.output(LED_PIN, GPIO.LOW)
-            #print('Button changed')
-            self.prev_button_state = button_state   # Yes, save new state/time
-            self.prev_time = t
-        else:                             # Button state unchanged
-            if (t - self.prev_time) >= self.hold_time:  # Button held more than 'holdTime'?
-                # Yes it has.  Is the hold action as-yet untriggered?
-                if self.hold_enable == True:        # Yep!
-                    print('Hold action to be exec')
-                    self.hold()                      # Perform hold action (usu. shutdown)
-                    self.hold_enable = False          # 1 shot...don't repeat hold action
-                    self.tap_enable  = False          # Don't do tap action on release
-            elif (t - self.prev_time) >= self.tap_time: # Not holdTime.  tapTime elapsed?
-                #print('tap')
-                # Yes.  Debounced press or release...
-                if button_state == True:       # Button released?
-                    #print('button_state', button_state)
-                    if self.tap_enable == True:       # Ignore if prior hold()
-                        self.tap()                     # Tap triggered (button released)
-                        print('tap action executed')
-                        self.hold_enable = False
-                else:                         # Button pressed
-                    
-                    self.tap_enable  = True           # Enable tap and hold actions
-                    self.hold_enable = True
-                    #print('tap_enable', self.tap_enable)
-
-        # LED blinks while idle, for a brief interval every 2 seconds.
-        # Pin 18 is PWM-capable and a "sleep throb" would be nice, but
-        # the PWM-related library is a hassle for average users to install
-        # right now.  Might return to this later when it's more accessible.
-        if ((int(t) & 1) == 0) and ((t - int(t)) < 0.05):
-            GPIO.output(LED_PIN, GPIO.HIGH)
-        else:
-            GPIO.output(LED_PIN, GPIO.LOW)
-
-        # Once per day (currently set for 6:30am local time, or when script
-        # is first run, if after 6:30am), run forecast and sudoku scripts.
-        loc_time = time.localtime()
-        if loc_time.tm_hour ==  6 and loc_time.tm_min == 30:
-            if self.daily_flag == False:
-                self.daily()
-                self.daily_flag = True
-        else:
-            self.daily_flag = False  # Reset daily trigger
-
-
     def tap(self):
-        """Called when button is briefly tapped.  Invokes time/temperature script."""
-        GPIO.output(LED_PIN, GPIO.HIGH)  # LED on while working
-        subprocess.call(["python", "timetemp.py"])
-        GPIO.output(LED_PIN, GPIO.LOW)
+        """Called when button is briefly tapped.  Queues the time/temperature job."""
+        # Local requests are never shed
+        self.queue.submit('job', {'name': 'timetemp'}, shed=False)
 
     def hold(self):
         """Called when button is held down.  Prints image, invokes shutdown process."""
         GPIO.output(LED_PIN, GPIO.HIGH)
-        self.tp.print_line('Switching off...')
-        self.tp.feed(3)
+        self.queue.submit('gfx', {'name': 'goodbye.png'}, shed=False)
+        self.queue.submit('text', {'text': 'Switching off...'}, shed=False)
+        self.queue.join(60)
         for i in range(10):
             GPIO.output(LED_PIN, GPIO.HIGH)
             time.sleep(0.5)
@@ -257,195 +203,132 @@ class MyThermalPrinter:
     
     def interval(self):
         """Called at periodic intervals (30 seconds by default).
-            Invokes twitter script.
+            Invokes twitter job (which remembers the last tweet printed).
         """
-        GPIO.output(LED_PIN, GPIO.HIGH)
-        p = subprocess.Popen(["python", "twitter.py", str(lastId)],
-                stdout=subprocess.PIPE)
-        GPIO.output(LED_PIN, GPIO.LOW)
-        return p.communicate()[0] # Script pipes back lastId, returned to main
+        self.queue.submit('job', {'name': 'twitter'})
 
 
     
     def daily(self):
         """ Called once per day (6:30am by default).
         
-            Invokes weather forecast and sudoku-gfx scripts.
+            Invokes weather forecast and sudoku jobs.
         """
+        self.queue.submit('job', {'name': 'forecast'})
+        self.queue.submit('job', {'name': 'sudoku'})
+
+    # Print queue handlers, run on the queue's worker thread
+
+    def print_text(self, tp, job):
+        GPIO.output(LED_PIN, GPIO.HIGH)
+        tp.print_line(job['params']['text'])
+        tp.feed(3)
+        GPIO.output(LED_PIN, GPIO.LOW)
+
+    def print_mail(self, tp, job):
+        params = job['params']
         GPIO.output(LED_PIN, GPIO.HIGH)
-        subprocess.call(["python", "forecast.py"])
-        subprocess.call(["python", "sudoku-gfx.py"])
+        tp.justify('C')
+        tp.print_line(20*'-')
+        tp.bold_on()
+        tp.print_line(params['subject'])
+        tp.bold_off()
+        if params['text']:
+            tp.print_line(params['text'])
+        if 'bitmap' in job['files']:
+            with open(job['files']['bitmap'], 'rb') as fp:
+                tp.print_bitmap(params['width'], params['height'], fp.read(), True)
+        elif 'image' in job['files']:
+            tp.print_image(Image.open(job['files']['image']), True)
+        tp.print_line(20*'-')
+        tp.justify('L')
         GPIO.output(LED_PIN, GPIO.LOW)
 
-class MailReceiver(object):
-    def __init__(self, config, printer, no_deleting=False):
-        self.base_dir = os.path.join('/tmp', 'thpr')
+    def print_upload(self, tp, job):
+        params = job['params']
+        GPIO.output(LED_PIN, GPIO.HIGH)
         try:
-            shutil.rmtree(self.base_dir)
-        except:
-            pass
-        #os.makedirs(self.base_dir)
-        self.user = config['EMail']['user']
-        self.password = config['EMail']['password']
-        self.printer = printer
-        self.no_deleting = no_deleting
-        
-        self.valid_senders = [x[1].lower() for x in config.items('Valid senders')]
-        self.valid_recipients = [x[1].lower() for x in config.items('Valid recipients')]
-        self.printable_extensions = ['.jpg', '.jpeg', '.png']
-
-    def check_mail(self):
-        # Icloud mail
-        # Benutzername: Dies ist in der Regel der Namensteil Ihrer
-        # iCloud-E-Mail-Adresse (beispielsweise emilyparker, nicht
-        # emilyparker@icloud.com). Wenn Ihr E-Mail-Client bei Verwendung
-        # des Namensteils Ihrer iCloud-E-Mail-Adresse keine Verbindung zu 
-        # iCloud herstellen kann, probieren Sie, die vollständige Adresse
-        # zu verwenden.
-        # Kennwort: Ihr iCloud-Kennwort (app specific!!!)
-        imap_session = imaplib.IMAP4_SSL('imap.mail.me.com', 993)
-        imap_session.login(self.user, self.password)
-        imap_session.select('inbox')
-        
-        
-        typ, data = imap_session.search(None, 'ALL')
-        if typ != 'OK':
-            print('Error searching Inbox.')
-            raise
-    
-        # Iterating over all emails
-        relevant_message = False
-        message_with_image = False
-        to_be_deleted = []        
-        for msgId in data[0].split():
-            typ, message_parts = imap_session.fetch(msgId, '(RFC822)')
-            if typ != 'OK':
-                print('Error fetching mail.')
-                raise
-
-            email_body = message_parts[0][1]
-            mail = email.message_from_string(email_body)
-            subject = decode_header(mail['subject'])[0]
-            logger.debug('Output from decode header: {0}, encoding {1}'.format(subject[0], subject[1]))
-            subject = subject[0]#.decode(subject[1])
-        
-            sender = mail['from']
-            recipient = mail['to']
-            mail_text = None
-            #print('Mail found: subject "{0}", From: {1}, To: {2}'.format(subject, sender, recipient))
-            if sender != None and recipient != None:
-                
-                logger.debug('Decoded subject: {0}'.format(subject))    
-            
-                found_valid_recipient = False
-                for val in self.valid_recipients:
-                        if recipient.lower().find(val) != -1:
-                            found_valid_recipient = True
-                        
-                found_valid_sender = False
-                if sender:
-                    for val in self.valid_senders:
-                        if sender.lower().find(val) != -1:
-                            found_valid_sender = True
-
-                if found_valid_recipient and found_valid_sender:
-                    print('Valid mail found: subject "{0}", From: {1}, To: {2}'.format(subject, sender, recipient))
-                    if mail.is_multipart():
-                        mail_text = None
-                        file_name = None
-                        for num, part in enumerate(mail.walk()):
-                            
-                            logger.debug('---'*10)
-                            logger.debug('Part No. {0}, Content type: :::{1}:::'.format(num, part.get_content_type()))
-                            logger.debug('Part as string')
-                            logger.debug(part.as_string()[:100])
-                            logger.debug('Part payload')
-                            logger.debug(part.get_payload()[:100])
-
-                            if not mail_text and part.get_content_type() == 'text/plain':
-                                mail_text = part.get_payload(decode=True).strip(' \n\r')
-                                
-                                logger.debug('MAILTEXT (Multipart; length: {1}): {0}'.format(mail_text[:100], len(mail_text)))
-                            if not file_name:
-                                file_name = part.get_filename()
-                                if file_name:
-                                    logger.debug('Filename: {0}'.format(file_name))
-                                    fn, file_extension = os.path.splitext(file_name)
-                                    if file_extension.lower() in self.printable_extensions:
-                                        message_with_image = True
-                                        savedir = os.path.join(self.base_dir, uuid.uuid1().hex)
-                                        os.makedirs(savedir)
-                                        fp = open(os.path.join(savedir, file_name), 'wb')
-                                        fp.write(part.get_payload(decode=True))
-                                        fp.close()
-                    else:
-                        file_name = mail.get_filename()
-                        if file_name:
-                            logger.debug('Filename: {0}'.format(file_name))
-                            fn, file_extension = os.path.splitext(file_name)
-                            if file_extension.lower() in self.printable_extensions:
-                                message_with_image = True
-                                savedir = os.path.join(self.base_dir, uuid.uuid1().hex)
-                                os.makedirs(savedir)
-                                fp = open(os.path.join(savedir, file_name), 'wb')
-                                fp.write(mail.get_payload(decode=True))
-                                fp.close()
-                        else:
-                            mail_text = mail.get_payload(decode=True).strip(' \n\r')
-                            logger.debug('MAILTEXT (Singlepart; length: {1}): {0}'.format(mail_text[:100], len(mail_text)))
-                    if not message_with_image:
-                        GPIO.output(LED_PIN, GPIO.HIGH)
-                        self.printer.justify('C')
-                        self.printer.print_line(20*'-')
-                        self.printer.bold_on()
-                        self.printer.print_line(subject)
-                        self.printer.bold_off()
-                        if mail_text:
-                            self.printer.print(mail_text)
-                        self.printer.print_line(20*'-')
-                        self.printer.justify('L')
-                        GPIO.output(LED_PIN, GPIO.LOW)
-                    else:
-                        GPIO.output(LED_PIN, GPIO.HIGH)
-                        self.printer.justify('C')
-                        self.printer.print_line(20*'-')
-                        self.printer.bold_on()
-                        self.printer.print_line(subject)
-                        self.printer.bold_off()
-                        if mail_text != None and mail_text != '':
-                            self.printer.print_line(mail_text)
-                        logger.debug('Directory ({0}) and name ({1})'.format(savedir, file_name))
-                        my_image = Image.open(os.path.join(savedir, file_name))
-                        new_width = 384
-                        percentage = new_width/float(my_image.size[0])
-                        new_height = my_image.size[1] * percentage
-                        #print('New width {0}, height {1}'.format(int(new_width+0.5), int(new_height+0.5)))
-                        gray = my_image.resize([int(new_width+0.5), int(new_height+0.5)]).convert('L')
-                        gray_array = np.asarray(gray)
-                        #bw = (gray_array > gray_array.mean())*255
-                        bw = gray.point(lambda x: 0 if x<np.median(gray_array)*1.1 else 255, '1').convert('1')
-                        bw.save(os.path.join('/tmp', 'convert_' + file_name + '.png'))
-#                         self.printer.print_image(bw, True)
-                        self.printer.print_line(20*'-')
-                        self.printer.justify('L')
-                        GPIO.output(LED_PIN, GPIO.LOW)
-                    to_be_deleted.append(msgId)
-        if to_be_deleted and not self.no_deleting:
-            logger.debug('IDs to be moved to trash: {0}'.format(to_be_deleted))
-            boxes = imap_session.list()
-            #for box in boxes[1]:
-            #    print(box)
-            for id in to_be_deleted:
-                result = imap_session.copy(id, 'Deleted Messages')
-                print(result)
-                if result[0] == 'OK':
-                    imap_session.store(id, '+FLAGS', '\\Deleted')
-                    
-            imap_session.expunge()
-                
-        imap_session.close()
-        imap_session.logout()        
-                   
+            width, height, bitmap = pack_attachment(job['files']['image'],
+                                                    max_height=params.get('max_height'),
+                                                    dither=params.get('dither', 'median'))
+            tp.print_bitmap(width, height, bitmap, True)
+            tp.feed(3)
+        finally:
+            GPIO.output(LED_PIN, GPIO.LOW)
+
+    def print_gfx(self, tp, job):
+        # Static images from gfx/ are packed once, then printed from
+        # the bitmap cache
+        GPIO.output(LED_PIN, GPIO.HIGH)
+        try:
+            self.cache.print_image(tp, gfx_path(job['params']['name']), True)
+            tp.feed(3)
+        finally:
+            GPIO.output(LED_PIN, GPIO.LOW)
+
+    def print_raw(self, tp, job):
+        # ESC/POS bytes as sent by the client; write() paces them by the
+        # lines they print, and the text settings are reset afterwards
+        GPIO.output(LED_PIN, GPIO.HIGH)
+        try:
+            with open(job['files']['data'], 'rb') as fp:
+                while True:
+                    chunk = fp.read(tp.buffer_size)
+                    if not chunk:
+                        break
+                    tp.write(chunk)
+            tp.set_default()
+        finally:
+            GPIO.output(LED_PIN, GPIO.LOW)
+
+    # Print time estimates, called by the queue on submission
+
+    def estimate_text(self, job):
+        return self.tp.estimate_text(job['params']['text'] + '\n' * 4).seconds
+
+    def estimate_upload(self, job):
+        with open(job['files']['image'], 'rb') as fp:
+            width, height = fit_size(Image.open(fp).size,
+                                     max_height=job['params'].get('max_height'))
+        return (self.tp.estimate_bitmap(width, height, True).seconds +
+                self.tp.estimate_text('\n' * 3).seconds)
+
+    def estimate_gfx(self, job):
+        with open(gfx_path(job['params']['name']), 'rb') as fp:
+            width, height = Image.open(fp).size
+        return (self.tp.estimate_bitmap(min(width, 384), height, True).seconds +
+                self.tp.estimate_text('\n' * 3).seconds)
+
+    def estimate_raw(self, job):
+        # Only the text lines and the transfer are accounted for
+        size = os.path.getsize(job['files']['data'])
+        lines = 0
+        with open(job['files']['data'], 'rb') as fp:
+            for chunk in iter(lambda: fp.read(65536), b''):
+                lines += chunk.count(b'\n')
+        return (size * self.tp.byte_time +
+                lines * (self.tp.char_height * self.tp.dot_print_time +
+                         self.tp.line_spacing * self.tp.dot_feed_time))
+
+    def estimate_mail(self, job):
+        params = job['params']
+        lines = [20*'-', params['subject']] + ([params['text']] if params['text'] else [])
+        seconds = self.tp.estimate_text('\n'.join(lines + [20*'-', ''])).seconds
+        if 'bitmap' in job['files']:
+            seconds += self.tp.estimate_bitmap(params['width'], params['height'], True).seconds
+        elif 'image' in job['files']:
+            with open(job['files']['image'], 'rb') as fp:
+                width, height = Image.open(fp).size
+            seconds += self.tp.estimate_bitmap(min(width, 384), height, True).seconds
+        return seconds
+
+    def run_job(self, tp, job):
+        GPIO.output(LED_PIN, GPIO.HIGH)  # LED on while working
+        try:
+            jobs.run(job['params']['name'], tp, **job['params'].get('args', {}))
+        finally:
+            GPIO.output(LED_PIN, GPIO.LOW)
+
 
 if __name__ == "__main__":
 
@@ -459,15 +342,14 @@ if __name__ == "__main__":
     ch.setFormatter(formatter)
 
     #print(arguments)
-    if arguments['--verbose']:
-        logger.setLevel(logging.DEBUG)
-        ch.setLevel(logging.DEBUG)
-    else:
-        logger.setLevel(logging.INFO)
-        ch.setLevel(logging.INFO)
+    level = logging.DEBUG if arguments['--verbose'] else logging.INFO
+    ch.setLevel(level)
 
-    # add the handlers to the logger
-    logger.addHandler(ch)
+    # add the handlers to the loggers of thpr.py and its modules
+    for name in (__name__, 'PrintQueue', 'Scheduler', 'ButtonWatcher',
+                 'MailWatcher', 'MailWhitelist'):
+        logging.getLogger(name).setLevel(level)
+        logging.getLogger(name).addHandler(ch)
 
 
     GPIO.setmode(GPIO.BCM)
@@ -484,6 +366,11 @@ if __name__ == "__main__":
                                button_pin = BUTTON_PIN,
                                led_pin = LED_PIN,
                                hold_time = HOLD_TIME,
+                               spool_dir = config['Printer'].get('spool_dir', '/var/spool/thpr'),
+                               cache_dir = config['Printer'].get('cache_dir', '/var/cache/thpr'),
+                               queue_budget = config['Printer'].getint('queue_budget', fallback=16 << 20),
+                               queue_time = config['Printer'].getint('queue_time', fallback=1800),
+                               timing_file = config['Printer'].get('timing_file', '/var/lib/thpr/timing.json'),
                                no_printing = arguments['--no-printing'])
 
     GPIO.output(LED_PIN, GPIO.HIGH)
@@ -497,21 +384,58 @@ if __name__ == "__main__":
     PRINTER.check_network()
     #PRINTER.greeting()
     
-    MR = MailReceiver(config, PRINTER.tp, no_deleting = arguments['--no-deleting'])
-    #MR.check_mail()
-    mail_schedule = Scheduler(60, MR.check_mail)
-    todo_schedule = Scheduler(0.05, PRINTER.query_button)
-    if not arguments['--run-once']:
-        #mail_schedule.start()
-        todo_schedule.start()
+    MR = MailReceiver(config, PRINTER.queue, no_deleting = arguments['--no-deleting'])
+    mail_watcher = MailWatcher(MR, poll_interval = config['EMail'].getint('poll_interval', fallback=60))
+    schedule = Scheduler()
+    hour, minute = config['Printer'].get('daily_time', '06:30').split(':')
+    schedule.daily(int(hour), int(minute), PRINTER.daily)
+    # Mail attachments and uploaded images share one limit
+    max_image_height = config['EMail'].getint('max_image_height', fallback=1600)
+    if arguments['--asyncio'] and not arguments['--run-once']:
+        logger.debug('Starting asyncio loop')
+        server = None
+        if not arguments['--no-server']:
+            server = serve_async(PRINTER.queue, config['api'],
+                                 max_image_height=max_image_height)
+        try:
+            asyncio.run(run_asyncio(PRINTER, mail_watcher, schedule, server))
+        except KeyboardInterrupt:
+            pass
+        logger.debug('Schedule lateness: {0}'.format(schedule.metrics()))
+        MR.close()
+        sys.exit(0)
 
+    server = None
     if not arguments['--no-server']:
+        server = web_server(PRINTER.queue, config['api'],
+                            max_image_height=max_image_height)
+    PRINTER.queue.start()
+    if not arguments['--run-once']:
+        mail_watcher.start()
+        PRINTER.button.start()
+        schedule.start()
+    else:
+        MR.check_mail()
+
+    if server is not None:
         logger.debug('Starting server')
-        webapp.run(host='0.0.0.0', port=80, debug=True, use_reloader=False)
+        try:
+            server.run()
+        except KeyboardInterrupt:
+            server.close()
     elif not arguments['--run-once']:
         logger.debug('Starting endless loop')
         while True:
-            pass
+            time.sleep(60)
     if not arguments['--run-once']:
-        todo_schedule.stop()
-        #mail_schedule.stop()
+        schedule.stop()
+        logger.debug('Schedule lateness: {0}'.format(schedule.metrics()))
+        PRINTER.button.stop()
+        mail_watcher.stop()
+    MR.close()
+    if arguments['--run-once'] and server is None:
+        # Print what check_mail() queued before exiting
+        PRINTER.queue.join()
+    # Otherwise stop after the current job; the rest stays spooled and
+    # is printed after a restart
+    PRINTER.queue.stop()
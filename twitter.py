@@ -26,102 +26,15 @@
 # If you put code on Github or other public repository, replace them
 # with dummy strings.
 
+# The job itself is jobs/twitter.py, which thpr.py runs in-process;
+# this script runs it once, taking the last tweet id seen as its
+# argument and printing the newest one.
+
 from __future__ import print_function
-import base64, HTMLParser, httplib, json, sys, urllib, zlib
-from unidecode import unidecode
+import sys
 from AdafruitThermal import *
+import jobs
 
-
-# Configurable globals.  Edit to your needs. -------------------------------
-
-# Twitter application credentials -- see notes above -- DO NOT SHARE.
-consumer_key    = 'PUT_YOUR_CONSUMER_KEY_HERE'
-consumer_secret = 'PUT_YOUR_CONSUMER_SECRET_HERE'
-
-# queryString can be any valid Twitter API search string, including
-# boolean operators.  See http://dev.twitter.com/docs/using-search
-# for options and syntax.  Funny characters do NOT need to be URL
-# encoded here -- urllib takes care of that.
-queryString = 'from:Adafruit'
-
-
-# Other globals.  You probably won't need to change these. -----------------
-
-printer   = Adafruit_Thermal("/dev/ttyAMA0", 19200, timeout=5)
-host      = 'api.twitter.com'
-authUrl   = '/oauth2/token'
-searchUrl = '/1.1/search/tweets.json?'
-agent     = 'Gutenbird v1.0'
+printer = AdafruitThermal("/dev/ttyAMA0", 19200, timeout=5)
 # lastID is command line value (if passed), else 1
-if len(sys.argv) > 1: lastId = sys.argv[1]
-else:                 lastId = '1'
-
-# Initiate an HTTPS connection/request, uncompress and JSON-decode results
-def issueRequestAndDecodeResponse(method, url, body, headers):
-  connection = httplib.HTTPSConnection(host)
-  connection.request(method, url, body, headers)
-  response = connection.getresponse()
-  if response.status != 200:
-    # This is OK for command-line testing, otherwise
-    # keep it commented out when using main.py
-    # print('HTTP error: %d' % response.status)
-    exit(-1)
-  compressed = response.read()
-  connection.close()
-  return json.loads(zlib.decompress(compressed, 16+zlib.MAX_WBITS))
-
-
-# Mainline code. -----------------------------------------------------------
-
-# Get access token. --------------------------------------------------------
-
-token = issueRequestAndDecodeResponse(
-  'POST', authUrl, 'grant_type=client_credentials',
-   {'Host'            : host,
-    'User-Agent'      : agent,
-    'Accept-Encoding' : 'gzip',
-    'Content-Type'    : 'application/x-www-form-urlencoded;charset=UTF-8',
-    'Authorization'   : 'Basic ' + base64.b64encode(
-     urllib.quote(consumer_key) + ':' + urllib.quote(consumer_secret))}
-  )['access_token']
-
-
-# Perform search. ----------------------------------------------------------
-
-data = issueRequestAndDecodeResponse(
-  'GET',
-  (searchUrl + 'count=3&since_id=%s&q=%s' %
-   (lastId, urllib.quote(queryString))),
-  None,
-  {'Host'            : host,
-   'User-Agent'      : agent,
-   'Accept-Encoding' : 'gzip',
-   'Authorization'   : 'Bearer ' + token})
-
-
-# Display results. ---------------------------------------------------------
-
-maxId = data['search_metadata']['max_id_str']
-
-for tweet in data['statuses']:
-
-  printer.inverseOn()
-  printer.print(' ' + '{:<31}'.format(tweet['user']['screen_name']))
-  printer.inverseOff()
-
-  printer.underlineOn()
-  printer.print('{:<32}'.format(tweet['created_at']))
-  printer.underlineOff()
-
-  # max_id_str is not always present, so check tweet IDs as fallback
-  id = tweet['id_str']
-  if(id > maxId): maxId = id # String compare is OK for this
-
-  # Remove HTML escape sequences
-  # and remap Unicode values to nearest ASCII equivalents
-  printer.print(unidecode(
-    HTMLParser.HTMLParser().unescape(tweet['text'])))
-
-  printer.feed(3)
-
-print(maxId) # Piped back to calling process
+print(jobs.run('twitter', printer, last_id=sys.argv[1] if len(sys.argv) > 1 else '1')) # Piped back to calling process